@@ -2,6 +2,7 @@
 ASGI config for alx_backend_graphql_crm project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; websockets on ``/graphql`` serve GraphQL subscriptions.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +14,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
 
-application = get_asgi_application()
+# Set up Django before importing anything that touches models.
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from django.urls import path  # noqa: E402
+
+from crm.consumers import GraphQLSubscriptionConsumer  # noqa: E402
+
+application = ProtocolTypeRouter({
+    "http": django_asgi_app,
+    "websocket": URLRouter([
+        path("graphql", GraphQLSubscriptionConsumer.as_asgi()),
+    ]),
+})
@@ -71,6 +71,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'alx_backend_graphql_crm.wsgi.application'
+ASGI_APPLICATION = 'alx_backend_graphql_crm.asgi.application'
 
 
 # Database
@@ -129,3 +130,25 @@ GRAPHENE = {
     "SCHEMA": "graphql_crm.schema.schema" 
 }
 
+# /healthz and /readyz (see crm/health.py): seconds a check result is
+# reused, and seconds since its last run after which a job is reported stale.
+CRM_HEALTH_CACHE_SECONDS = 10
+CRM_HEALTH_MAX_JOB_LAG = {
+    'log_crm_heartbeat': 15 * 60,
+    'maintain_inventory': 30 * 60,
+    'build_copurchase_index': 2 * 60 * 60,
+    'update_low_stock': 13 * 60 * 60,
+    'sync_customer_activity': 25 * 60 * 60,
+    'archive_orders': 25 * 60 * 60,
+    'prune_change_records': 25 * 60 * 60,
+}
+
+# /graphql rate limiting (see crm/ratelimit.py): query-cost units refilled
+# per second, bucket size, and requests per client in flight at once. The
+# 'memory' backend is per process; 'cache' shares limits through
+# CRM_RATE_LIMIT_CACHE. CRM_RATE_LIMIT_RATE = None turns limiting off.
+CRM_RATE_LIMIT_RATE = 2000
+CRM_RATE_LIMIT_BURST = 20000
+CRM_RATE_LIMIT_CONCURRENCY = 4
+CRM_RATE_LIMIT_BACKEND = 'memory'
+CRM_RATE_LIMIT_CACHE = 'default'
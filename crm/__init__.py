@@ -1,3 +1,13 @@
-from .celery import app as celery_app
+def __getattr__(name):
+    # Import the Celery app on demand so web requests, cron jobs and management
+    # commands don't pay for loading Celery. Workers import ``crm.celery``
+    # directly via ``celery -A crm``, and ``crm.tasks`` imports it before
+    # declaring tasks.
+    if name == 'celery_app':
+        from .celery import app
 
-__all__ = ('celery_app',)
\ No newline at end of file
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ('celery_app',)
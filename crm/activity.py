@@ -0,0 +1,107 @@
+"""
+Customer activity columns.
+
+``Customer.last_order_at``, ``Customer.order_count`` and
+``Customer.total_spent`` summarize a customer's orders, so inactivity checks,
+activity filters and sorts are a range scan over an indexed column instead of
+a join against every order. Whatever
+writes orders calls ``record_orders`` in the same transaction;
+``sync_activity`` recomputes the columns from the live and archived
+orders in customer id chunks, to backfill them or repair drift.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, DateTimeField, DecimalField, F, IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import ArchivedOrder, Customer, Order
+
+DEFAULT_CHUNK_SIZE = 1000
+SPENT_FIELD = DecimalField(max_digits=14, decimal_places=2)
+
+
+def record_orders(orders):
+    """Count newly created ``orders`` against their customers."""
+    counts = defaultdict(int)
+    totals = defaultdict(Decimal)
+    latest = {}
+    for order in orders:
+        counts[order.customer_id] += 1
+        totals[order.customer_id] += Decimal(order.total_amount)
+        if order.customer_id not in latest or order.order_date > latest[order.customer_id]:
+            latest[order.customer_id] = order.order_date
+    for customer_id in sorted(counts):
+        order_date = Value(latest[customer_id], output_field=DateTimeField())
+        # Relative update, so concurrent orders for one customer both count.
+        Customer.objects.filter(pk=customer_id).update(
+            order_count=F("order_count") + counts[customer_id],
+            total_spent=F("total_spent") + totals[customer_id],
+            last_order_at=Greatest(Coalesce("last_order_at", order_date), order_date),
+        )
+
+
+def _recompute(customers):
+    live, archived = (
+        model.objects.filter(customer=OuterRef("pk")).order_by().values("customer")
+        for model in (Order, ArchivedOrder)
+    )
+
+    def count(orders):
+        return Coalesce(Subquery(orders.annotate(n=Count("pk")).values("n")), Value(0), output_field=IntegerField())
+
+    def spent(orders):
+        return Coalesce(Subquery(orders.annotate(total=Sum("total_amount")).values("total")), Value(Decimal(0)),
+                        output_field=SPENT_FIELD)
+
+    def latest(orders):
+        return Subquery(orders.annotate(latest=Max("order_date")).values("latest"))
+
+    # Archived orders are all older than live ones, so they only matter when
+    # the customer has no live order.
+    return customers.update(
+        order_count=count(live) + count(archived),
+        total_spent=spent(live) + spent(archived),
+        last_order_at=Coalesce(latest(live), latest(archived)),
+    )
+
+
+def sync_activity(chunk_size=DEFAULT_CHUNK_SIZE, repair=True):
+    """
+    Compare the activity columns with the orders, one id chunk at a time.
+
+    Returns ``(checked, drifted)``; with ``repair`` the drifted customers are
+    recomputed in place.
+    """
+    checked = drifted = 0
+    last_id = 0
+    while True:
+        rows = list(
+            Customer.objects.filter(pk__gt=last_id)
+            .order_by("pk")
+            .values_list("pk", "order_count", "total_spent", "last_order_at")[:chunk_size]
+        )
+        if not rows:
+            return checked, drifted
+        last_id = rows[-1][0]
+        actual = {}
+        for model in (Order, ArchivedOrder):
+            for customer_id, count, total, latest in (
+                model.objects.filter(customer_id__gte=rows[0][0], customer_id__lte=last_id)
+                .order_by()
+                .values("customer_id")
+                .annotate(count=Count("pk"), total=Sum("total_amount"), latest=Max("order_date"))
+                .values_list("customer_id", "count", "total", "latest")
+            ):
+                seen, seen_total, seen_latest = actual.get(customer_id, (0, 0, None))
+                actual[customer_id] = (
+                    seen + count,
+                    seen_total + total,
+                    latest if seen_latest is None else max(seen_latest, latest),
+                )
+        stale = [pk for pk, *columns in rows if actual.get(pk, (0, 0, None)) != tuple(columns)]
+        checked += len(rows)
+        drifted += len(stale)
+        if stale and repair:
+            _recompute(Customer.objects.filter(pk__in=stale))
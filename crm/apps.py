@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import events, loaders
+        from .metrics import REGISTRY, install_sql_timer
+
+        if REGISTRY.enabled:
+            connection_created.connect(install_sql_timer, dispatch_uid='crm_sql_timer')
+        events.connect_signals()
+        loaders.connect_signals()
@@ -0,0 +1,63 @@
+"""
+Archival of historical orders.
+
+Orders placed more than ``CRM_ORDER_ARCHIVE_AFTER_DAYS`` ago are moved, with
+their product links, from ``Order`` into ``ArchivedOrder``. Each chunk is
+moved in its own transaction, so an order is in exactly one of the two tables
+at any time, and it keeps its id (and therefore its global ID). Orders are
+moved oldest first: every archived order is older than every live one.
+
+Totals, reports and customer activity read both tables; order listings read
+the live table unless the client passes ``includeArchived``.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, Order
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 365
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def archive_horizon(now=None):
+    days = getattr(settings, "CRM_ORDER_ARCHIVE_AFTER_DAYS", DEFAULT_ARCHIVE_AFTER_DAYS)
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archive_orders(before=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Move orders placed before ``before`` (default: the horizon) into the archive; return how many moved."""
+    if before is None:
+        before = archive_horizon()
+    links = Order.products.through
+    archived_links = ArchivedOrder.products.through
+    moved = 0
+    while True:
+        with transaction.atomic():
+            orders = list(
+                Order.objects.filter(order_date__lt=before).order_by("order_date", "id")[:chunk_size]
+            )
+            if not orders:
+                return moved
+            ids = [order.pk for order in orders]
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(
+                    id=order.pk,
+                    customer_id=order.customer_id,
+                    total_amount=order.total_amount,
+                    order_date=order.order_date,
+                )
+                for order in orders
+            ])
+            archived_links.objects.bulk_create([
+                archived_links(archivedorder_id=order_id, product_id=product_id)
+                for order_id, product_id in links.objects.filter(order_id__in=ids).values_list(
+                    "order_id", "product_id"
+                )
+            ])
+            # Cascades to the links; stock movements and reservations keep their rows.
+            Order.objects.filter(pk__in=ids).delete()
+        moved += len(orders)
@@ -0,0 +1,140 @@
+"""
+Helpers shared by the ``bench_*`` management commands.
+
+Benchmarks run against a throwaway test database so they never touch the
+configured one.
+"""
+
+import contextlib
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from . import activity
+from .models import Customer, Order, Product
+
+
+@contextlib.contextmanager
+def benchmark_database(shared=False):
+    """
+    Create a migrated throwaway database for the duration of the block.
+
+    ``shared=True`` keeps an SQLite database in a file rather than in memory so
+    worker processes can open it too.
+    """
+    setup_test_environment()
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    tmpdir = None
+    if shared and connection.vendor == 'sqlite' and not old_test_name:
+        tmpdir = tempfile.TemporaryDirectory()
+        test_settings['NAME'] = os.path.join(tmpdir.name, 'benchmark.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        if tmpdir is not None:
+            test_settings['NAME'] = old_test_name
+            tmpdir.cleanup()
+
+
+def seed(customers=100, products=50, orders=1000, products_per_order=3):
+    """Insert a synthetic dataset with bulk writes and return the created orders.
+
+    May be called repeatedly; new customers and products are numbered after
+    the existing ones.
+    """
+    first_customer, first_product = Customer.objects.count(), Product.objects.count()
+    Customer.objects.bulk_create(
+        Customer(name=f'Customer {i}', email=f'customer{i}@example.com')
+        for i in range(first_customer, first_customer + customers)
+    )
+    Product.objects.bulk_create(
+        Product(name=f'Product {i}', price=Decimal(i % 97) + Decimal('0.99'), stock=100)
+        for i in range(first_product, first_product + products)
+    )
+    customer_ids = list(Customer.objects.values_list('id', flat=True))
+    product_ids = list(Product.objects.values_list('id', flat=True))
+    prices = dict(Product.objects.values_list('id', 'price'))
+
+    created = Order.objects.bulk_create(
+        Order(customer_id=customer_ids[i % len(customer_ids)]) for i in range(orders)
+    )
+    through = Order.products.through
+    links = []
+    for i, order in enumerate(created):
+        chosen = {product_ids[(i * 7 + j) % len(product_ids)] for j in range(products_per_order)}
+        links.extend(through(order_id=order.pk, product_id=pk) for pk in chosen)
+        order.total_amount = sum(prices[pk] for pk in chosen)
+    through.objects.bulk_create(links)
+    Order.objects.bulk_update(created, ['total_amount'], batch_size=1000)
+    activity.record_orders(created)
+    return created
+
+
+def best_of(rounds, func):
+    """Run ``func`` ``rounds`` times and return the fastest wall time in seconds."""
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def stock_contention(threads=16, operations=50):
+    """
+    Sell one unit of a single product ``operations`` times from each of
+    ``threads`` threads, using whatever stock coalescing the settings select.
+
+    Returns ``{"seconds", "per_second", "sold", "errors", "consistent"}``;
+    ``consistent`` checks the final stock and the ledger against the sales.
+    """
+    from django.db import close_old_connections
+    from django.db.models import Sum
+
+    from . import inventory
+    from .models import StockMovement
+
+    initial = threads * operations
+    product = Product.objects.create(name='Contended product', price=Decimal('1.00'), stock=0)
+    inventory.restock({product.pk: initial})
+    sold, errors = [], []
+    start = threading.Barrier(threads)
+
+    def worker():
+        start.wait()
+        try:
+            for _ in range(operations):
+                try:
+                    inventory.sell(None, {product.pk: 1})
+                    sold.append(1)
+                except Exception as e:
+                    errors.append(e)
+        finally:
+            close_old_connections()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    product.refresh_from_db()
+    ledger = StockMovement.objects.filter(product=product).aggregate(total=Sum('quantity'))['total']
+    return {
+        'seconds': seconds,
+        'per_second': len(sold) / seconds if seconds else 0.0,
+        'sold': len(sold),
+        'errors': len(errors),
+        'consistent': product.stock == ledger == initial - len(sold),
+    }
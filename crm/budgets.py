@@ -0,0 +1,114 @@
+"""
+SQL query budgets for representative GraphQL operations.
+
+Each operation runs in-process against the shared schema and its SQL
+statements are counted. An operation's count must stay within its budget
+and must not grow with the size of the dataset, which is what an N+1 query
+looks like. ``measure`` grows a seeded dataset through several sizes and
+returns a JSON-ready report; ``crm/tests.py`` checks it and
+``python manage.py query_budgets`` writes it out for trend tracking.
+"""
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .models import Customer, Product
+
+DEFAULT_SIZES = (10, 100)
+
+
+def _order_variables():
+    return {
+        "customerId": str(Customer.objects.order_by("pk").values_list("pk", flat=True)[0]),
+        "productIds": [str(pk) for pk in Product.objects.order_by("pk").values_list("pk", flat=True)[:3]],
+    }
+
+
+# name: (document, variables factory or None, budget)
+OPERATIONS = {
+    "nested_all_orders": (
+        """{ allOrders(first: 100, orderBy: "-orderDate") { edges { node {
+            id orderDate totalAmount customer { name email } products { edges { node { name price } } }
+        } } pageInfo { hasNextPage endCursor } } }""",
+        None,
+        2,
+    ),
+    "filtered_all_customers": (
+        """{ allCustomers(first: 100, name: "customer", orderCount_Gte: 1, orderBy: "name") {
+            edges { node { id name email orderCount totalSpent lastOrderAt lastOrderDate } }
+        } }""",
+        None,
+        1,
+    ),
+    "recent_orders": (
+        "{ recentOrders(limit: 20) { id totalAmount customer { name } products { edges { node { name } } } } }",
+        None,
+        2,
+    ),
+    "stats": (
+        "{ totalCustomers totalOrders totalRevenue }",
+        None,
+        5,
+    ),
+    "create_order": (
+        """mutation ($customerId: ID!, $productIds: [ID]!) {
+            createOrder(customerId: $customerId, productIds: $productIds) {
+                order { id totalAmount customer { name } products { edges { node { name } } } }
+            }
+        }""",
+        _order_variables,
+        17,
+    ),
+    "update_low_stock_products": (
+        "mutation { updateLowStockProducts { success updatedProducts { name stock } } }",
+        None,
+        9,
+    ),
+}
+
+
+def count_queries(name):
+    """Run operation ``name`` and return how many SQL statements it executed."""
+    from graphql_crm.schema import execute
+
+    document, variables, _ = OPERATIONS[name]
+    variables = variables() if variables else None
+    with CaptureQueriesContext(connection) as ctx:
+        result = execute(document, variables)
+    if result.errors:
+        raise RuntimeError(f"{name} failed: {result.errors[0]}")
+    return len(ctx.captured_queries)
+
+
+def measure(sizes=DEFAULT_SIZES, seed=None):
+    """
+    Grow the dataset to each size in turn and count every operation's queries.
+
+    ``seed(customers, products, orders)`` adds rows; it defaults to
+    ``crm.benchmarks.seed``. Returns ``{"sizes": [...], "operations": {name:
+    {"budget": n, "queries": [count per size], "within_budget": bool,
+    "constant": bool}}}``.
+    """
+    if seed is None:
+        from .benchmarks import seed
+    counts = {name: [] for name in OPERATIONS}
+    seeded = 0
+    for size in sizes:
+        seed(customers=max(1, (size - seeded) // 5), products=max(3, (size - seeded) // 10), orders=size - seeded)
+        seeded = size
+        # A few products below the low-stock threshold for updateLowStockProducts.
+        Product.objects.filter(pk__in=Product.objects.order_by("-pk").values("pk")[:3]).update(stock=1)
+        for name in OPERATIONS:
+            counts[name].append(count_queries(name))
+    return {
+        "sizes": list(sizes),
+        "operations": {
+            name: {
+                "budget": OPERATIONS[name][2],
+                "queries": queries,
+                "within_budget": max(queries) <= OPERATIONS[name][2],
+                "constant": len(set(queries)) == 1,
+            }
+            for name, queries in counts.items()
+        },
+    }
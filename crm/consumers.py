@@ -0,0 +1,113 @@
+"""
+Websocket consumer serving GraphQL subscriptions.
+
+Speaks the ``graphql-transport-ws`` protocol: the client sends
+``connection_init`` and then one ``subscribe`` message per operation; results
+arrive as ``next`` messages and end with ``complete``.
+"""
+
+import asyncio
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+PROTOCOL = "graphql-transport-ws"
+
+# Close codes defined by the protocol.
+INVALID_MESSAGE = 4400
+UNAUTHORIZED = 4401
+INIT_TIMEOUT = 4408
+DUPLICATE_SUBSCRIBER = 4409
+TOO_MANY_INIT_REQUESTS = 4429
+
+
+class GraphQLSubscriptionConsumer(AsyncJsonWebsocketConsumer):
+    init_timeout = 10
+
+    async def connect(self):
+        self.acknowledged = False
+        self.operations = {}
+        if PROTOCOL not in self.scope.get("subprotocols", []):
+            await self.close()
+            return
+        await self.accept(PROTOCOL)
+        self.init_timer = asyncio.get_running_loop().call_later(
+            self.init_timeout, lambda: asyncio.ensure_future(self.close(INIT_TIMEOUT))
+        )
+
+    async def disconnect(self, code):
+        if getattr(self, "init_timer", None):
+            self.init_timer.cancel()
+        for task in list(getattr(self, "operations", {}).values()):
+            task.cancel()
+
+    async def receive_json(self, message, **kwargs):
+        message_type = message.get("type") if isinstance(message, dict) else None
+        if message_type == "connection_init":
+            if self.acknowledged:
+                await self.close(TOO_MANY_INIT_REQUESTS)
+                return
+            self.acknowledged = True
+            self.init_timer.cancel()
+            await self.send_json({"type": "connection_ack"})
+        elif message_type == "ping":
+            await self.send_json({"type": "pong"})
+        elif message_type == "pong":
+            pass
+        elif message_type == "subscribe":
+            await self.start(message)
+        elif message_type == "complete":
+            task = self.operations.pop(message.get("id"), None)
+            if task:
+                task.cancel()
+        else:
+            await self.close(INVALID_MESSAGE)
+
+    async def decode_json(self, text_data):
+        try:
+            return await super().decode_json(text_data)
+        except ValueError:
+            return None
+
+    async def start(self, message):
+        if not self.acknowledged:
+            await self.close(UNAUTHORIZED)
+            return
+        operation_id = message.get("id")
+        payload = message.get("payload") or {}
+        if not isinstance(operation_id, str) or not isinstance(payload.get("query"), str):
+            await self.close(INVALID_MESSAGE)
+            return
+        if operation_id in self.operations:
+            await self.close(DUPLICATE_SUBSCRIBER)
+            return
+        self.operations[operation_id] = asyncio.ensure_future(self.run(operation_id, payload))
+
+    async def run(self, operation_id, payload):
+        from graphql_crm.schema import get_schema
+
+        result = await get_schema().subscribe(
+            payload["query"],
+            variable_values=payload.get("variables"),
+            operation_name=payload.get("operationName"),
+        )
+        try:
+            if not hasattr(result, "__aiter__"):
+                # Validation or subscribe-time errors come back as a single result.
+                await self.send_json({
+                    "type": "error",
+                    "id": operation_id,
+                    "payload": [error.formatted for error in result.errors or ()],
+                })
+                return
+            try:
+                async for execution in result:
+                    await self.send_json({
+                        "type": "next",
+                        "id": operation_id,
+                        "payload": execution.formatted,
+                    })
+            finally:
+                await result.aclose()
+            await self.send_json({"type": "complete", "id": operation_id})
+        finally:
+            self.operations.pop(operation_id, None)
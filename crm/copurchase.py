@@ -0,0 +1,176 @@
+"""
+Precomputed "frequently bought together" index.
+
+``build_index`` reads the order/product link tables of live and archived
+orders from where its ``IndexCursor`` stopped, a chunk of orders at a time.
+The pairs in a chunk are counted by one grouped self-join of the link table
+in the database, then added to the sparse ``CoPurchase`` matrix. Only the
+products the chunk touched get their top ``CRM_COPURCHASE_TOP_K`` neighbours
+re-ranked. ``ProductType.frequentlyBoughtWith`` reads those ranked rows
+through the ``(product, rank)`` index. Lists of products prefetch them with
+``prefetch_neighbours``, one query per list.
+
+Counts only grow. Deleting orders or customers doesn't lower them, and
+changing ``CRM_COPURCHASE_TOP_K`` doesn't re-rank products the next build
+doesn't touch. ``build_index(rebuild=True)`` recounts everything.
+
+The cursor is an order id, and ids are assigned on insert, not on commit.
+So a build stops short of the first order placed less than
+``CRM_COPURCHASE_SETTLE_SECONDS`` ago, because a lower id may still be
+committing. An order whose transaction stays open longer than that is never
+counted, short of a rebuild.
+"""
+
+from collections import Counter
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Prefetch
+from django.utils import timezone
+
+from .models import ArchivedOrder, CoPurchase, IndexCursor, Order
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_TOP_K = 10
+DEFAULT_FIRST = 5
+DEFAULT_SETTLE_SECONDS = 60
+CURSOR_NAME = "copurchase"
+# Where prefetch_neighbours puts a product's ranked rows.
+RANKED_ATTR = "ranked_copurchases"
+# Rows per bulk statement, and products per re-rank query.
+BATCH_SIZE = 500
+
+
+def top_k():
+    return getattr(settings, "CRM_COPURCHASE_TOP_K", DEFAULT_TOP_K)
+
+
+def neighbours(product_id, first=DEFAULT_FIRST, ranked=None):
+    """
+    The products most often ordered with ``product_id``, most frequent first.
+    ``ranked`` is the product's rows from ``prefetch_neighbours``, when it has them.
+    """
+    first = max(0, min(first, top_k()))
+    if not first:
+        return []
+    if ranked is not None:
+        return [row.other for row in ranked[:first]]
+    rows = CoPurchase.objects.filter(product_id=product_id, rank__lte=first).order_by("rank").select_related("other")
+    return [row.other for row in rows]
+
+
+def prefetch_neighbours(lookup="copurchases"):
+    """``Prefetch`` of the ranked rows of the products at ``lookup``, for every product in one query."""
+    rows = CoPurchase.objects.filter(rank__lte=top_k()).order_by("rank").select_related("other")
+    return Prefetch(lookup, queryset=rows, to_attr=RANKED_ATTR)
+
+
+# =======================
+# BUILD
+# =======================
+def _link_tables():
+    for model in (Order, ArchivedOrder):
+        field = model._meta.get_field("products")
+        yield field.remote_field.through, field.m2m_field_name()
+
+
+def settle_horizon(now=None):
+    seconds = getattr(settings, "CRM_COPURCHASE_SETTLE_SECONDS", DEFAULT_SETTLE_SECONDS)
+    return (now or timezone.now()) - timedelta(seconds=seconds)
+
+
+def _next_chunk(after, chunk_size, settled):
+    """``(last id, orders)`` of the next ``chunk_size`` orders after ``after``, or ``(None, 0)``."""
+    bounds = {"pk__gt": after}
+    # Stop below the first order placed after ``settled``. Archived orders are
+    # all old, so only live ones can be that recent.
+    recent = Order.objects.filter(pk__gt=after, order_date__gt=settled).order_by("pk").values_list("pk", flat=True)
+    first_recent = recent.first()
+    if first_recent is not None:
+        bounds["pk__lt"] = first_recent
+    # An order is live or archived, never both; the smallest ids overall are
+    # among the smallest of each table.
+    ids = sorted(chain.from_iterable(
+        model.objects.filter(**bounds).order_by("pk").values_list("pk", flat=True)[:chunk_size]
+        for model in (Order, ArchivedOrder)
+    ))[:chunk_size]
+    return (ids[-1], len(ids)) if ids else (None, 0)
+
+
+def count_pairs(after, upto):
+    """``Counter`` of ``(product_id, other_id)`` over orders with ids in ``(after, upto]``, both ways round."""
+    counts = Counter()
+    for through, source in _link_tables():
+        pairs = (
+            through.objects.filter(**{f"{source}_id__gt": after, f"{source}_id__lte": upto})
+            .values("product_id", other=F(f"{source}__products"))
+            .exclude(other=F("product_id"))
+            .annotate(orders=Count("pk"))
+            .order_by()
+        )
+        counts.update({(row["product_id"], row["other"]): row["orders"] for row in pairs})
+    return counts
+
+
+def add_counts(counts):
+    """Add ``counts`` to the matrix and return the products whose rows changed."""
+    products = {product for product, _ in counts}
+    existing = {
+        (row.product_id, row.other_id): row
+        for row in CoPurchase.objects.filter(product_id__in=products, other_id__in={other for _, other in counts})
+    }
+    changed, created = [], []
+    for (product, other), n in counts.items():
+        row = existing.get((product, other))
+        if row is None:
+            created.append(CoPurchase(product_id=product, other_id=other, count=n))
+        else:
+            row.count += n
+            changed.append(row)
+    CoPurchase.objects.bulk_update(changed, ["count"], batch_size=BATCH_SIZE)
+    CoPurchase.objects.bulk_create(created, batch_size=BATCH_SIZE)
+    return products
+
+
+def rerank(products, k):
+    """Number the top ``k`` neighbours of each of ``products`` and unrank the rest."""
+    products = sorted(products)
+    for start in range(0, len(products), BATCH_SIZE):
+        rows = (
+            CoPurchase.objects.filter(product_id__in=products[start:start + BATCH_SIZE])
+            .order_by("product_id", "-count", "other_id")
+            .values_list("pk", "product_id", "rank")
+        )
+        changed = []
+        position, current = 0, None
+        for pk, product, rank in rows:
+            position = position + 1 if product == current else 1
+            current = product
+            new_rank = position if position <= k else None
+            if new_rank != rank:
+                changed.append(CoPurchase(pk=pk, rank=new_rank))
+        CoPurchase.objects.bulk_update(changed, ["rank"], batch_size=BATCH_SIZE)
+
+
+def build_index(chunk_size=DEFAULT_CHUNK_SIZE, rebuild=False):
+    """Count the settled orders placed since the last build into the index and return how many were read."""
+    if rebuild:
+        with transaction.atomic():
+            CoPurchase.objects.all().delete()
+            IndexCursor.objects.update_or_create(name=CURSOR_NAME, defaults={"position": 0})
+    k = top_k()
+    settled = settle_horizon()
+    read = 0
+    while True:
+        # One transaction per chunk: the counts and the cursor move together.
+        with transaction.atomic():
+            cursor, _ = IndexCursor.objects.select_for_update().get_or_create(name=CURSOR_NAME)
+            upto, orders = _next_chunk(cursor.position, chunk_size, settled)
+            if upto is None:
+                return read
+            rerank(add_counts(count_pairs(cursor.position, upto)), k)
+            cursor.position = upto
+            cursor.save(update_fields=["position", "updated_at"])
+        read += orders
@@ -2,81 +2,44 @@
 Cron jobs for the CRM application.
 """
 
-from gql.transport.requests import RequestsHTTPTransport
-from gql import gql, Client
-import os
 from datetime import datetime
-import requests
-import json
-from django.conf import settings
+from crm.jobs import JobFailed, coordinated_job
+from crm.jsonlog import get_job_logger
 
+@coordinated_job("log_crm_heartbeat", lease_seconds=60, fresh_for=60)
 def log_crm_heartbeat():
     """
     Log a heartbeat message every 5 minutes to confirm CRM application health.
     """
-    try:
-        # Get current timestamp
-        timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
-        message = f"{timestamp} CRM is alive"
-        
-        # Log to file
-        log_file_path = "/tmp/crm_heartbeat_log.txt"
-        
-        # Append to log file
-        with open(log_file_path, 'a') as log_file:
-            log_file.write(message + "\n")
-        
-        # Optional: Verify GraphQL endpoint is responsive
-        try:
-            # Try to query the GraphQL endpoint
-            url = "http://localhost:8000/graphql"
-            
-            # Try different query variations
-            queries_to_try = [
-                {'query': '{ hello }'},
-                {'query': '{ __schema { queryType { name } } }'},
-                {'query': '{ __typename }'}
-            ]
-            
-            for query in queries_to_try:
-                try:
-                    response = requests.post(url, json=query, timeout=5)
-                    if response.status_code == 200:
-                        # GraphQL endpoint is responsive
-                        with open(log_file_path, 'a') as log_file:
-                            log_file.write(f"{timestamp} GraphQL endpoint is responsive\n")
-                        break
-                except:
-                    continue
-            else:
-                # If all queries failed
-                with open(log_file_path, 'a') as log_file:
-                    log_file.write(f"{timestamp} GraphQL endpoint check failed\n")
-                    
-        except Exception as e:
-            # Log GraphQL check error but don't fail the heartbeat
-            with open(log_file_path, 'a') as log_file:
-                log_file.write(f"{timestamp} GraphQL check error: {str(e)}\n")
-        
-        return f"Heartbeat logged: {message}"
-        
-    except Exception as e:
-        # Fallback: log to a different location if main log fails
-        error_log_path = "/tmp/crm_heartbeat_error.log"
-        with open(error_log_path, 'a') as error_file:
-            error_file.write(f"{datetime.now().strftime('%d/%m/%Y-%H:%M:%S')} Heartbeat failed: {str(e)}\n")
-        
-        return f"Heartbeat failed: {str(e)}"
+    from crm import health
+
+    log = get_job_logger("crm_heartbeat_log")
+    timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
+    message = f"{timestamp} CRM is alive"
 
+    # Same checks as /readyz, run in-process instead of over HTTP
+    report = health.readiness(refresh=True)
+    if report["status"] != "ok":
+        log.warning("CRM is unavailable", database=report["database"])
+        return f"Heartbeat logged: {timestamp} CRM is unavailable"
+    log.info(
+        "CRM is alive",
+        db_latency_ms=report["database"]["latency_ms"],
+        stale_jobs=report["stale_jobs"],
+        queues=report["queues"],
+    )
+    return f"Heartbeat logged: {message}"
 
+
+@coordinated_job("update_low_stock", lease_seconds=1800, fresh_for=3600)
 def update_low_stock():
     """
     Update low-stock products every 12 hours using GraphQL mutation.
     """
+    from graphql_crm.schema import execute
+
+    log = get_job_logger("low_stock_updates_log")
     try:
-        timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
-        log_file_path = "/tmp/low_stock_updates_log.txt"
-        
         # GraphQL mutation
         mutation = """
         mutation {
@@ -92,65 +55,117 @@ def update_low_stock():
             }
         }
         """
-        
-        # Execute the mutation
-        url = "http://localhost:8000/graphql"
-        payload = {"query": mutation}
-        
-        response = requests.post(url, json=payload, timeout=30)
-        response.raise_for_status()
-        
-        result = response.json()
-        
+
+        # Execute the mutation in-process against the shared schema
+        result = execute(mutation)
+
         # Check for GraphQL errors
-        if 'errors' in result:
-            error_message = f"{timestamp} GraphQL errors: {result['errors']}\n"
-            with open(log_file_path, 'a') as log_file:
-                log_file.write(error_message)
-            return f"GraphQL errors: {result['errors']}"
-        
+        if result.errors:
+            errors = [str(e) for e in result.errors]
+            log.error("GraphQL errors", errors=errors)
+            raise JobFailed(f"GraphQL errors: {errors}")
+
         # Process the mutation result
-        mutation_result = result.get('data', {}).get('updateLowStockProducts', {})
-        
-        success = mutation_result.get('success', False)
-        message = mutation_result.get('message', 'No message')
-        updated_products = mutation_result.get('updatedProducts', [])
-        
-        # Log the results
-        log_message = f"{timestamp} Low Stock Update Results:\n"
-        log_message += f"Success: {success}\n"
-        log_message += f"Message: {message}\n"
-        
-        if updated_products:
-            log_message += "Updated Products:\n"
-            for product in updated_products:
-                log_message += f"  - {product['name']}: Stock updated to {product['stock']} (Price: ${product['price']})\n"
-        else:
-            log_message += "No products were updated.\n"
-        
-        log_message += "-" * 50 + "\n"
-        
-        # Write to log file
-        with open(log_file_path, 'a') as log_file:
-            log_file.write(log_message)
-        
+        mutation_result = result.data['updateLowStockProducts']
+
+        success = mutation_result['success']
+        message = mutation_result['message']
+        if not success:
+            log.error("Low stock update failed", message=message)
+            raise JobFailed(f"Low stock update failed: {message}")
+        updated_products = mutation_result['updatedProducts'] or []
+
+        for product in updated_products:
+            log.info(
+                "Product restocked",
+                product_id=product['id'],
+                name=product['name'],
+                stock=product['stock'],
+                price=product['price'],
+            )
+        log.info(
+            "Low stock update results",
+            success=success,
+            message=message,
+            updated=len(updated_products),
+        )
+
         return f"Low stock update completed: {message}"
-        
-    except requests.exceptions.ConnectionError:
-        error_message = f"{timestamp} Failed to connect to GraphQL server\n"
-        with open(log_file_path, 'a') as log_file:
-            log_file.write(error_message)
-        return "Failed to connect to GraphQL server"
-        
-    except requests.exceptions.RequestException as e:
-        error_message = f"{timestamp} Network error: {str(e)}\n"
-        with open(log_file_path, 'a') as log_file:
-            log_file.write(error_message)
-        return f"Network error: {str(e)}"
-        
+
+    except JobFailed:
+        raise
     except Exception as e:
-        error_message = f"{timestamp} Unexpected error: {str(e)}\n"
-        with open(log_file_path, 'a') as log_file:
-            log_file.write(error_message)
-        return f"Unexpected error: {str(e)}"
-    
\ No newline at end of file
+        log.exception("Unexpected error", error=str(e))
+        raise JobFailed(f"Unexpected error: {str(e)}") from e
+
+
+@coordinated_job("maintain_inventory", lease_seconds=600)
+def maintain_inventory():
+    """
+    Release expired stock reservations and compact the stock ledger.
+    """
+    from crm import inventory
+
+    log = get_job_logger("inventory_log")
+    released = inventory.expire_reservations()
+    removed, adjusted = inventory.compact_ledger()
+    log.info(
+        "Inventory maintained",
+        reservations_released=released,
+        ledger_rows_removed=removed,
+        products_adjusted=adjusted,
+    )
+    return f"Inventory maintained: {released} reservations released, {removed} ledger rows compacted"
+
+
+@coordinated_job("sync_customer_activity", lease_seconds=3600)
+def sync_customer_activity():
+    """
+    Check the customer activity columns against the orders and repair drift.
+    """
+    from crm.activity import sync_activity
+
+    log = get_job_logger("activity_log")
+    checked, drifted = sync_activity()
+    log.info("Customer activity synced", customers_checked=checked, customers_repaired=drifted)
+    return f"Customer activity synced: {drifted} of {checked} customers repaired"
+
+
+@coordinated_job("archive_orders", lease_seconds=3600)
+def archive_orders():
+    """
+    Move orders older than CRM_ORDER_ARCHIVE_AFTER_DAYS into the archive tables.
+    """
+    from crm import archive
+
+    log = get_job_logger("archive_log")
+    before = archive.archive_horizon()
+    moved = archive.archive_orders(before)
+    log.info("Orders archived", orders_archived=moved, before=before.isoformat())
+    return f"Orders archived: {moved} placed before {before:%Y-%m-%d}"
+
+
+@coordinated_job("build_copurchase_index", lease_seconds=3600)
+def build_copurchase_index():
+    """
+    Count orders placed since the last run into the frequently-bought-together index.
+    """
+    from crm.copurchase import build_index
+
+    log = get_job_logger("copurchase_log")
+    read = build_index()
+    log.info("Co-purchase index built", orders_counted=read)
+    return f"Co-purchase index built: {read} new orders counted"
+
+
+@coordinated_job("prune_change_records", lease_seconds=3600)
+def prune_change_records():
+    """
+    Delete change feed records older than CRM_OUTBOX_RETENTION_DAYS.
+    """
+    from crm.outbox import prune_changes
+
+    log = get_job_logger("outbox_log")
+    removed = prune_changes()
+    log.info("Change records pruned", records_removed=removed)
+    return f"Change records pruned: {removed} removed"
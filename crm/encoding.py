@@ -0,0 +1,55 @@
+"""
+JSON encoders for GraphQL responses.
+
+``CRM_GRAPHQL_JSON_ENCODER`` picks one by name: ``"orjson"`` (the default
+when the package is installed) or ``"json"`` for the standard library. Every
+encoder returns compact UTF-8 bytes.
+"""
+
+import json
+from decimal import Decimal
+
+from django.conf import settings
+
+
+def _default(value):
+    # Money fields are serialized by the Decimal scalar; this only catches strays.
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=_default).encode()
+
+
+def encode_orjson(data):
+    import orjson
+
+    return orjson.dumps(data, default=_default)
+
+
+ENCODERS = {
+    "json": encode_json,
+    "orjson": encode_orjson,
+}
+
+
+def orjson_available():
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_encoder(name=None):
+    """Return the configured encoder, falling back to ``json`` without orjson."""
+    if name is None:
+        name = getattr(settings, "CRM_GRAPHQL_JSON_ENCODER", None)
+    if name is None:
+        name = "orjson" if orjson_available() else "json"
+    try:
+        return ENCODERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown JSON encoder {name!r}; choose from {', '.join(ENCODERS)}")
@@ -0,0 +1,147 @@
+"""
+In-process event bus feeding GraphQL subscriptions.
+
+Model signals publish events after the writing transaction commits; every
+open subscription gets its own bounded queue on its event loop. When a slow
+consumer's queue is full the oldest event is dropped rather than blocking the
+writer, and the drop is counted on the subscription and in ``/metrics``.
+"""
+
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+
+from .metrics import REGISTRY
+
+ORDER_CREATED = "order_created"
+STOCK_CHANGED = "stock_changed"
+
+DEFAULT_QUEUE_SIZE = 100
+
+# Sent with ``products=[...]`` by writes that bypass ``post_save``, such as
+# queryset ``update()`` calls.
+stock_changed = Signal()
+
+EVENTS_DROPPED = REGISTRY.counter(
+    "crm_subscription_events_dropped_total",
+    "Events dropped because a subscriber's queue was full.",
+    ["topic"],
+)
+
+
+class Subscription:
+    """One subscriber's bounded queue, bound to the event loop that created it."""
+
+    def __init__(self, bus, topic, loop, maxsize):
+        import asyncio
+
+        self.bus = bus
+        self.topic = topic
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def offer(self, event):
+        # Runs on the subscriber's loop, so the queue is never touched concurrently.
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            EVENTS_DROPPED.inc(topic=self.topic)
+        self.queue.put_nowait(event)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, topic, maxsize=None):
+        """Subscribe the running event loop to ``topic``; use as a context manager."""
+        import asyncio
+
+        if maxsize is None:
+            maxsize = getattr(settings, "CRM_SUBSCRIPTION_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)
+        subscription = Subscription(self, topic, asyncio.get_running_loop(), maxsize)
+        with self._lock:
+            self._subscribers[topic] = self._subscribers.get(topic, ()) + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            remaining = tuple(
+                s for s in self._subscribers.get(subscription.topic, ()) if s is not subscription
+            )
+            if remaining:
+                self._subscribers[subscription.topic] = remaining
+            else:
+                self._subscribers.pop(subscription.topic, None)
+
+    def has_subscribers(self, topic):
+        return bool(self._subscribers.get(topic))
+
+    def publish(self, topic, event):
+        """Hand ``event`` to every subscriber of ``topic``; safe to call from any thread."""
+        for subscription in self._subscribers.get(topic, ()):
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # The subscriber's loop has closed without unsubscribing.
+                self.unsubscribe(subscription)
+
+    def publish_on_commit(self, topic, event):
+        """Publish once the current transaction commits; skipped when nobody listens."""
+        if self.has_subscribers(topic):
+            transaction.on_commit(lambda: self.publish(topic, event))
+
+
+BUS = EventBus()
+
+
+# =======================
+# SIGNAL RECEIVERS
+# =======================
+def order_saved(sender, instance, created, **kwargs):
+    # Subscribers load the order after commit, once its products and total are set.
+    if created:
+        BUS.publish_on_commit(ORDER_CREATED, instance.pk)
+
+
+def product_saved(sender, instance, **kwargs):
+    BUS.publish_on_commit(STOCK_CHANGED, product_snapshot(instance))
+
+
+def products_stock_changed(sender, products, **kwargs):
+    for product in products:
+        BUS.publish_on_commit(STOCK_CHANGED, product_snapshot(product))
+
+
+def product_snapshot(product):
+    # A detached copy: subscribers never share instances with the writer.
+    return type(product)(pk=product.pk, name=product.name, price=product.price, stock=product.stock)
+
+
+def connect_signals():
+    from django.db.models.signals import post_save
+
+    from .models import Order, Product
+
+    post_save.connect(order_saved, sender=Order, dispatch_uid="crm_events_order_saved")
+    post_save.connect(product_saved, sender=Product, dispatch_uid="crm_events_product_saved")
+    stock_changed.connect(products_stock_changed, dispatch_uid="crm_events_stock_changed")
@@ -0,0 +1,103 @@
+"""
+Query plans for GraphQL operations, for finding missing indexes.
+
+With ``DEBUG`` on, a ``/graphql`` request carrying ``explain`` (``?explain=1``
+or ``"explain": true`` in the JSON body) runs as a dry run. Every SQL
+statement its resolvers execute is recorded, and the whole transaction is
+rolled back afterwards, mutations included. The response gains
+``extensions.explain``: one entry per distinct statement, with how often it
+ran and its plan. The plan comes from ``EXPLAIN QUERY PLAN`` on SQLite or
+``EXPLAIN`` on PostgreSQL. Tables read by a full scan and sorts that need a
+temporary B-tree are flagged. ``explain(query)`` does the same in-process.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+
+EXPLAINABLE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+POSTGRES_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def enabled():
+    return settings.DEBUG
+
+
+def requested(request, data):
+    flag = request.GET.get("explain") or (data.get("explain") if isinstance(data, dict) else None)
+    return flag not in (None, False, "", "0", "false")
+
+
+def _sqlite_full_scan(line):
+    # "SCAN crm_order" reads every row; "SCAN ... USING INDEX" walks an index
+    # in order and "SEARCH" seeks one.
+    words = line.split()
+    if words[:1] != ["SCAN"] or "USING" in words or len(words) < 2 or words[1] in ("CONSTANT", "SUBQUERY"):
+        return None
+    return words[2] if words[1] == "TABLE" and len(words) > 2 else words[1]
+
+
+def plan(sql, params):
+    """``(plan lines, fully scanned tables, uses a temporary sort)``, or ``None`` when unsupported."""
+    vendor = connection.vendor
+    if vendor not in ("sqlite", "postgresql"):
+        return None
+    prefix = "EXPLAIN QUERY PLAN " if vendor == "sqlite" else "EXPLAIN "
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        lines = [row[-1] for row in cursor.fetchall()]
+    if vendor == "sqlite":
+        scanned = {_sqlite_full_scan(line) for line in lines} - {None}
+        temp_sort = any("USE TEMP B-TREE" in line for line in lines)
+    else:
+        scanned = {match.group(1) for line in lines for match in POSTGRES_FULL_SCAN.finditer(line)}
+        temp_sort = any(line.strip().startswith("Sort") or "-> Sort" in line for line in lines)
+    return lines, sorted(scanned), temp_sort
+
+
+def explain_statements(statements):
+    """Group ``[(sql, params)]`` by SQL text and explain each distinct statement."""
+    counts, first_params = {}, {}
+    for sql, params in statements:
+        if EXPLAINABLE.match(sql):
+            counts[sql] = counts.get(sql, 0) + 1
+            first_params.setdefault(sql, params)
+    report = []
+    for sql, count in counts.items():
+        lines, scanned, temp_sort = plan(sql, first_params[sql]) or (None, [], False)
+        report.append({"sql": sql, "count": count, "plan": lines, "full_scans": scanned, "temp_sort": temp_sort})
+    return {
+        "dry_run": True,
+        "statements": report,
+        "full_scans": sorted({table for entry in report for table in entry["full_scans"]}),
+    }
+
+
+def run_explained(func):
+    """
+    Call ``func()`` in a transaction that is always rolled back, and return
+    ``(its result, the explain report of the SQL it ran)``.
+    """
+    statements = []
+
+    def record(execute, sql, params, many, context):
+        statements.append((sql, params[0] if many and params else params))
+        return execute(sql, params, many, context)
+
+    with transaction.atomic():
+        with connection.execute_wrapper(record):
+            # A failing operation rolls back to this savepoint, which leaves
+            # the outer transaction usable for the EXPLAIN statements.
+            with transaction.atomic():
+                result = func()
+        report = explain_statements(statements)
+        transaction.set_rollback(True)
+    return result, report
+
+
+def explain(query, variables=None, operation_name=None):
+    """Run an operation in-process as a dry run; returns ``(ExecutionResult, report)``."""
+    from graphql_crm.schema import execute
+
+    return run_explained(lambda: execute(query, variables, operation_name))
@@ -1,12 +1,48 @@
+from datetime import datetime, time, timedelta
+
 import django_filters
+from django.db.models import Q
+from django.utils import timezone
 from .models import Customer, Product, Order
 
+
+class StableOrderingFilter(django_filters.OrderingFilter):
+    """
+    ``orderBy`` that always ends with ``id``, so rows with equal sort keys keep
+    their order between pages. Each sort key has an index on ``(key, id)``;
+    only those keys are accepted.
+    """
+
+    def filter(self, qs, value):
+        if value in django_filters.constants.EMPTY_VALUES:
+            return qs
+        ordering = [self.get_ordering_value(param) for param in value]
+        if not any(key.lstrip('-') == 'id' for key in ordering):
+            # Tie-break in the direction of the last key so one index serves the sort.
+            ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+        return qs.order_by(*ordering)
+
+
 class CustomerFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(field_name="name", lookup_expr="icontains")
     email = django_filters.CharFilter(field_name="email", lookup_expr="icontains")
     created_at__gte = django_filters.DateFilter(field_name="created_at", lookup_expr="gte")
     created_at__lte = django_filters.DateFilter(field_name="created_at", lookup_expr="lte")
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
+    last_order_at__gte = django_filters.DateTimeFilter(field_name="last_order_at", lookup_expr="gte")
+    last_order_at__lt = django_filters.DateTimeFilter(field_name="last_order_at", lookup_expr="lt")
+    order_count__gte = django_filters.NumberFilter(field_name="order_count", lookup_expr="gte")
+    order_count__lte = django_filters.NumberFilter(field_name="order_count", lookup_expr="lte")
+    total_spent__gte = django_filters.NumberFilter(field_name="total_spent", lookup_expr="gte")
+    total_spent__lte = django_filters.NumberFilter(field_name="total_spent", lookup_expr="lte")
+    last_order_date__gte = django_filters.DateFilter(method='filter_last_order_date')
+    last_order_date__lte = django_filters.DateFilter(method='filter_last_order_date')
+    inactive_since = django_filters.DateTimeFilter(method='filter_inactive_since')
+    # last_order_at is nullable, so sorting by it pages by offset (see crm/pagination.py).
+    order_by = StableOrderingFilter(fields=(
+        ('name', 'name'), ('email', 'email'), ('order_count', 'order_count'),
+        ('total_spent', 'total_spent'), ('last_order_at', 'last_order_date'),
+    ))
 
     class Meta:
         model = Customer
@@ -15,12 +51,16 @@ class CustomerFilter(django_filters.FilterSet):
     def filter_phone_pattern(self, queryset, name, value):
         return queryset.filter(phone__startswith=value)
 
-fields = {
-    'name': ['icontains'],
-    'email': ['icontains'],
-    'phone': ['icontains'],
-    'created_at': ['gte', 'lte'],
-}
+    def filter_last_order_date(self, queryset, name, value):
+        # Compare against the start of the next day so last_order_at's index applies.
+        start = timezone.make_aware(datetime.combine(value, time.min))
+        if name.endswith('__gte'):
+            return queryset.filter(last_order_at__gte=start)
+        return queryset.filter(last_order_at__lt=start + timedelta(days=1))
+
+    def filter_inactive_since(self, queryset, name, value):
+        # Customers who never ordered count as inactive.
+        return queryset.filter(Q(last_order_at__lt=value) | Q(last_order_at__isnull=True))
 
 class ProductFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(field_name="name", lookup_expr="icontains")
@@ -28,6 +68,7 @@ class ProductFilter(django_filters.FilterSet):
     price__lte = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
     stock__gte = django_filters.NumberFilter(field_name="stock", lookup_expr="gte")
     stock__lte = django_filters.NumberFilter(field_name="stock", lookup_expr="lte")
+    order_by = StableOrderingFilter(fields=(('name', 'name'), ('price', 'price'), ('stock', 'stock')))
 
     class Meta:
         model = Product
@@ -40,8 +81,9 @@ class OrderFilter(django_filters.FilterSet):
     order_date__gte = django_filters.DateFilter(field_name="order_date", lookup_expr="gte")
     order_date__lte = django_filters.DateFilter(field_name="order_date", lookup_expr="lte")
     customer_name = django_filters.CharFilter(field_name="customer__name", lookup_expr="icontains")
-    product_name = django_filters.CharFilter(field_name="product__name", lookup_expr="icontains")
-    product_id = django_filters.NumberFilter(field_name="product__id", lookup_expr="exact")
+    product_name = django_filters.CharFilter(field_name="products__name", lookup_expr="icontains", distinct=True)
+    product_id = django_filters.NumberFilter(field_name="products__id", lookup_expr="exact")
+    order_by = StableOrderingFilter(fields=(('order_date', 'order_date'), ('total_amount', 'total_amount')))
 
     class Meta:
         model = Order
@@ -0,0 +1,121 @@
+"""
+Liveness and readiness checks.
+
+``liveness`` runs ``SELECT 1`` on the default database. ``readiness`` adds
+the backlogs this process can see: job log queues, expired stock
+reservations and uncounted co-purchase orders. It also reports how long ago
+each coordinated job last finished. A job is stale when that lag is beyond
+its entry in ``CRM_HEALTH_MAX_JOB_LAG`` or its last run failed. Only the
+database decides the status. Stale jobs and backlogs are reported, but they
+don't take the process out of rotation.
+
+Backlogs are counted up to ``BACKLOG_LIMIT`` rows, so a stalled queue
+doesn't turn the check into a full table count; a capped value means "at
+least". Both results are kept in process memory for ``CRM_HEALTH_CACHE_SECONDS``, so
+frequent probes cost at most one check per interval. ``/healthz`` and
+``/readyz`` serve them, and the heartbeat cron job logs the readiness report.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+DEFAULT_CACHE_SECONDS = 10
+BACKLOG_LIMIT = 10000
+
+_results = {}
+_results_lock = threading.Lock()
+
+
+def check_database():
+    started = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+    except DatabaseError as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+def job_lag(now=None):
+    """``{job: {"lag_seconds", "last_outcome", "running", "stale"}}`` from the job leases."""
+    from .models import JobLease, JobRun
+
+    now = now or timezone.now()
+    limits = getattr(settings, "CRM_HEALTH_MAX_JOB_LAG", {})
+    jobs = {}
+    for name, finished, outcome, expires in JobLease.objects.values_list(
+        "name", "last_finished_at", "last_outcome", "expires_at"
+    ):
+        lag = (now - finished).total_seconds() if finished else None
+        limit = limits.get(name)
+        jobs[name] = {
+            "lag_seconds": round(lag, 1) if lag is not None else None,
+            "last_outcome": outcome or None,
+            "running": expires is not None and expires > now,
+            "stale": outcome == JobRun.ERROR or (limit is not None and (lag is None or lag > limit)),
+        }
+    return jobs
+
+
+def queue_backlog(now=None):
+    from .copurchase import CURSOR_NAME
+    from .jsonlog import queue_depths
+    from .models import IndexCursor, Order, StockReservation
+
+    now = now or timezone.now()
+    counted = IndexCursor.objects.filter(name=CURSOR_NAME).values_list("position", flat=True).first() or 0
+    return {
+        "job_logs": queue_depths(),
+        "expired_reservations": StockReservation.objects.filter(
+            status=StockReservation.HELD, expires_at__lte=now
+        )[:BACKLOG_LIMIT].count(),
+        "copurchase_orders": Order.objects.filter(pk__gt=counted)[:BACKLOG_LIMIT].count(),
+    }
+
+
+def _cached(kind, compute, refresh):
+    ttl = getattr(settings, "CRM_HEALTH_CACHE_SECONDS", DEFAULT_CACHE_SECONDS)
+    now = time.monotonic()
+    with _results_lock:
+        cached = _results.get(kind)
+        if cached and not refresh and cached[0] > now:
+            return cached[1]
+    result = compute()
+    result["checked_at"] = timezone.now().isoformat()
+    with _results_lock:
+        _results[kind] = (now + ttl, result)
+    return result
+
+
+def liveness(refresh=False):
+    """``{"status": "ok" | "unavailable", "database": {...}, "checked_at": ...}``."""
+    def compute():
+        database = check_database()
+        return {"status": "ok" if database["ok"] else "unavailable", "database": database}
+
+    return _cached("liveness", compute, refresh)
+
+
+def readiness(refresh=False):
+    """``liveness`` plus job lag, stale jobs and backlogs."""
+    def compute():
+        database = check_database()
+        report = {"status": "ok" if database["ok"] else "unavailable", "database": database}
+        if database["ok"]:
+            report["jobs"] = job_lag()
+            report["stale_jobs"] = sorted(name for name, job in report["jobs"].items() if job["stale"])
+            report["queues"] = queue_backlog()
+        return report
+
+    return _cached("readiness", compute, refresh)
+
+
+def reset():
+    """Forget cached results (for tests)."""
+    with _results_lock:
+        _results.clear()
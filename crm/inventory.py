@@ -0,0 +1,392 @@
+"""
+Inventory: concurrent-safe stock changes backed by an append-only ledger.
+
+Stock is only ever taken with a conditional ``UPDATE ... WHERE stock >= qty``,
+so concurrent orders contend on single product rows rather than a table lock
+and can never oversell. Every change appends ``StockMovement`` rows in the
+same transaction; ``compact_ledger`` folds old rows into one balance row per
+product and corrects drift from writes that bypass this module.
+
+With ``CRM_STOCK_COALESCE_MS`` set, sells and restocks made outside a
+transaction are applied in groups by ``StockCoalescer``, one UPDATE per
+group, so a hot product row is locked once per group rather than once per
+change.
+"""
+
+import functools
+import operator
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Case, Count, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import events, outbox
+from .models import ChangeRecord, Product, StockMovement, StockReservation
+
+DEFAULT_RESERVATION_TTL = 15 * 60
+DEFAULT_COMPACT_AFTER_DAYS = 7
+DEFAULT_COALESCE_MAX_BATCH = 500
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested):
+        super().__init__(f"Insufficient stock for product {product_id}: {requested} requested")
+        self.product_id = product_id
+        self.requested = requested
+
+
+def _take(product_id, quantity):
+    return Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+        stock=F("stock") - quantity
+    ) == 1
+
+
+def _put(quantities):
+    # One UPDATE per distinct quantity; restocks usually share one.
+    by_quantity = defaultdict(list)
+    for product_id, quantity in quantities.items():
+        by_quantity[quantity].append(product_id)
+    for quantity, product_ids in by_quantity.items():
+        Product.objects.filter(pk__in=product_ids).update(stock=F("stock") + quantity)
+
+
+def _stock_changed(product_ids):
+    """Publish the new stock levels to the outbox and to subscribers; returns the products."""
+    products = list(Product.objects.filter(pk__in=product_ids).order_by("pk"))
+    outbox.record_changes(
+        "product", ChangeRecord.UPDATE, [(p.pk, {"stock": p.stock}) for p in products]
+    )
+    events.stock_changed.send(sender=Product, products=products)
+    return products
+
+
+# =======================
+# STOCK CHANGES
+# =======================
+def sell(order, quantities):
+    """
+    Take ``{product_id: quantity}`` from stock for ``order``.
+
+    Raises ``InsufficientStock`` and rolls back every decrement if any product
+    runs short. Rows are updated in id order so concurrent orders never deadlock.
+    """
+    coalescer = get_coalescer()
+    if coalescer is not None:
+        return coalescer.submit(quantities, -1, StockMovement.SALE, order)
+    return _sell(order, quantities)
+
+
+def _sell(order, quantities):
+    with transaction.atomic():
+        for product_id in sorted(quantities):
+            if not _take(product_id, quantities[product_id]):
+                raise InsufficientStock(product_id, quantities[product_id])
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=product_id, quantity=-quantity, reason=StockMovement.SALE, order=order)
+            for product_id, quantity in quantities.items()
+        ])
+        return _stock_changed(quantities)
+
+
+def restock(quantities, reason=StockMovement.RESTOCK):
+    """Add ``{product_id: quantity}`` to stock and return the updated products."""
+    coalescer = get_coalescer()
+    if coalescer is not None:
+        return coalescer.submit(quantities, 1, reason)
+    return _restock(quantities, reason)
+
+
+def _restock(quantities, reason=StockMovement.RESTOCK):
+    with transaction.atomic():
+        _put(quantities)
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=product_id, quantity=quantity, reason=reason)
+            for product_id, quantity in quantities.items()
+        ])
+        return _stock_changed(quantities)
+
+
+def open_stock(products):
+    """Record the initial stock of newly created products in the ledger."""
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=p.pk, quantity=p.stock, reason=StockMovement.RESTOCK)
+        for p in products
+        if p.stock
+    ])
+
+
+# =======================
+# COALESCING
+# =======================
+class StockConflict(Exception):
+    """A product row changed between a group's read and its update."""
+
+
+class _Change:
+    """One sell or restock waiting in a ``StockCoalescer``."""
+
+    def __init__(self, quantities, sign, reason, order):
+        self.quantities = quantities
+        self.sign = sign
+        self.reason = reason
+        self.order = order
+        self.result = self.error = None
+        self.done = threading.Event()
+
+    def apply(self):
+        """Apply this change on its own, as if coalescing were off."""
+        try:
+            if self.sign < 0:
+                self.result = _sell(self.order, self.quantities)
+            else:
+                self.result = _restock(self.quantities, self.reason)
+        except Exception as e:
+            self.error = e
+        self.done.set()
+
+
+class StockCoalescer:
+    """
+    Applies concurrent stock changes in groups from a background thread.
+
+    A caller blocks until the group holding its change commits, together with
+    the change's ledger rows. An acknowledged change is therefore never only
+    in memory, and the ledger is its journal. A group locks its products'
+    rows once, in id order. It admits sells in arrival order against the
+    stock it read, then writes every product with one ``UPDATE ... SET stock =
+    stock + CASE id ... END``. If the group fails, for example because a
+    direct write changed a row under it, each of its changes is applied on its
+    own instead.
+    """
+
+    def __init__(self, window, max_batch=DEFAULT_COALESCE_MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self.condition = threading.Condition()
+        self.pending = []
+        self.thread = None
+
+    def submit(self, quantities, sign, reason, order=None):
+        change = _Change(dict(quantities), sign, reason, order)
+        with self.condition:
+            self.pending.append(change)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="stock-coalescer", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        change.done.wait()
+        if change.error is not None:
+            raise change.error
+        return change.result
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                full = len(self.pending) >= self.max_batch
+            if not full:
+                # Let changes arriving in the next few milliseconds join the group.
+                time.sleep(self.window)
+            with self.condition:
+                group, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            try:
+                self.flush(group)
+            finally:
+                close_old_connections()
+
+    def flush(self, group):
+        try:
+            with transaction.atomic():
+                outcomes = _apply_group(group)
+        except Exception:
+            for change in group:
+                change.apply()
+            return
+        for change, outcome in zip(group, outcomes):
+            if isinstance(outcome, Exception):
+                change.error = outcome
+            else:
+                change.result = outcome
+            change.done.set()
+
+
+def _apply_group(group):
+    """Apply ``group`` in the current transaction; returns each change's products or exception."""
+    product_ids = sorted({pk for change in group for pk in change.quantities})
+    stock = dict(
+        Product.objects.select_for_update().filter(pk__in=product_ids).order_by("pk").values_list("pk", "stock")
+    )
+    deltas = defaultdict(int)
+    admitted, movements, outcomes = [], [], []
+    for change in group:
+        if change.sign < 0:
+            short = next((
+                pk for pk in sorted(change.quantities)
+                if pk not in stock or stock[pk] + deltas[pk] < change.quantities[pk]
+            ), None)
+            if short is not None:
+                outcomes.append(InsufficientStock(short, change.quantities[short]))
+                continue
+        for pk, quantity in change.quantities.items():
+            deltas[pk] += change.sign * quantity
+            movements.append(StockMovement(
+                product_id=pk, quantity=change.sign * quantity, reason=change.reason, order=change.order
+            ))
+        admitted.append(change)
+        outcomes.append(None)
+
+    changed = {pk: delta for pk, delta in deltas.items() if delta}
+    if changed:
+        # The guards repeat the stock checks, so a row written directly since
+        # the read above can't go negative; the group is then retried change by change.
+        guards = [Q(pk=pk, stock__gte=-delta) if delta < 0 else Q(pk=pk) for pk, delta in changed.items()]
+        updated = Product.objects.filter(functools.reduce(operator.or_, guards)).update(
+            stock=F("stock") + Case(
+                *(When(pk=pk, then=Value(delta)) for pk, delta in changed.items()),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+        if updated != len(changed):
+            raise StockConflict(f"{len(changed) - updated} products changed during a coalesced stock update")
+    StockMovement.objects.bulk_create(movements)
+    products = {p.pk: p for p in _stock_changed(sorted(deltas))} if admitted else {}
+    return [
+        outcome if outcome is not None else [products[pk] for pk in sorted(change.quantities) if pk in products]
+        for change, outcome in zip(group, outcomes)
+    ]
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer():
+    """
+    The process-wide ``StockCoalescer``, or ``None`` when coalescing is off or
+    the caller is inside a transaction, whose rollback a group could not undo.
+    """
+    global _coalescer
+    window = getattr(settings, "CRM_STOCK_COALESCE_MS", 0)
+    if not window or connection.in_atomic_block:
+        return None
+    with _coalescer_lock:
+        if _coalescer is None or _coalescer.window != window / 1000:
+            _coalescer = StockCoalescer(
+                window / 1000, getattr(settings, "CRM_STOCK_COALESCE_MAX_BATCH", DEFAULT_COALESCE_MAX_BATCH)
+            )
+        return _coalescer
+
+
+# =======================
+# RESERVATIONS
+# =======================
+def reserve(product_id, quantity, ttl=None):
+    """Hold ``quantity`` units until confirmed, released or ``ttl`` seconds pass."""
+    if ttl is None:
+        ttl = getattr(settings, "CRM_RESERVATION_TTL_SECONDS", DEFAULT_RESERVATION_TTL)
+    with transaction.atomic():
+        if not _take(product_id, quantity):
+            raise InsufficientStock(product_id, quantity)
+        reservation = StockReservation.objects.create(
+            product_id=product_id,
+            quantity=quantity,
+            expires_at=timezone.now() + timedelta(seconds=ttl),
+        )
+        StockMovement.objects.create(
+            product_id=product_id, quantity=-quantity,
+            reason=StockMovement.RESERVE, reservation=reservation,
+        )
+        _stock_changed([product_id])
+    return reservation
+
+
+def confirm_reservation(reservation_id, order=None):
+    """Turn a live hold into a sale; returns False if it expired or was released."""
+    return StockReservation.objects.filter(
+        pk=reservation_id, status=StockReservation.HELD, expires_at__gt=timezone.now()
+    ).update(status=StockReservation.CONFIRMED, order=order) == 1
+
+
+def release_reservation(reservation_id):
+    """Return a held reservation's units to stock; returns False if it was no longer held."""
+    with transaction.atomic():
+        # The status flip is the claim: only one releaser (or confirmer) can win it.
+        if not StockReservation.objects.filter(
+            pk=reservation_id, status=StockReservation.HELD
+        ).update(status=StockReservation.RELEASED):
+            return False
+        reservation = StockReservation.objects.get(pk=reservation_id)
+        _put({reservation.product_id: reservation.quantity})
+        StockMovement.objects.create(
+            product_id=reservation.product_id, quantity=reservation.quantity,
+            reason=StockMovement.RELEASE, reservation=reservation,
+        )
+        _stock_changed([reservation.product_id])
+    return True
+
+
+def expire_reservations(now=None):
+    """Release every hold past its expiry and return how many were released."""
+    expired = StockReservation.objects.filter(
+        status=StockReservation.HELD, expires_at__lte=now or timezone.now()
+    ).values_list("pk", flat=True)
+    return sum(release_reservation(pk) for pk in list(expired))
+
+
+# =======================
+# COMPACTION
+# =======================
+def compact_ledger(older_than=None):
+    """
+    Fold movements older than ``older_than`` into one balance row per product,
+    then append adjustments wherever ``Product.stock`` drifted from the ledger.
+
+    Returns ``(rows_removed, products_adjusted)``.
+    """
+    if older_than is None:
+        older_than = timedelta(
+            days=getattr(settings, "CRM_LEDGER_COMPACT_AFTER_DAYS", DEFAULT_COMPACT_AFTER_DAYS)
+        )
+    cutoff = timezone.now() - older_than
+    removed = 0
+    old_rows = (
+        StockMovement.objects.filter(created_at__lt=cutoff)
+        .values("product")
+        .annotate(total=Sum("quantity"), rows=Count("id"), last_id=Max("id"))
+        .filter(rows__gt=1)
+    )
+    for group in old_rows.iterator():
+        with transaction.atomic():
+            deleted, _ = StockMovement.objects.filter(
+                product_id=group["product"], created_at__lt=cutoff, id__lte=group["last_id"]
+            ).delete()
+            StockMovement.objects.create(
+                product_id=group["product"], quantity=group["total"], reason=StockMovement.BALANCE
+            )
+            removed += deleted - 1
+
+    ledger_total = (
+        StockMovement.objects.filter(product=OuterRef("pk"))
+        .values("product")
+        .annotate(total=Sum("quantity"))
+        .values("total")
+    )
+    drifted = (
+        Product.objects.annotate(ledger=Coalesce(Subquery(ledger_total), 0))
+        .exclude(stock=F("ledger"))
+        .values_list("pk", "stock", "ledger")
+    )
+    adjustments = [
+        StockMovement(product_id=pk, quantity=stock - ledger, reason=StockMovement.ADJUST)
+        for pk, stock, ledger in drifted
+    ]
+    StockMovement.objects.bulk_create(adjustments)
+    return removed, len(adjustments)
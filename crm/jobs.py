@@ -0,0 +1,142 @@
+"""
+Coordination of scheduled jobs across cron hosts and Celery beat.
+
+Every job name owns one ``JobLease`` row. A run first claims the lease with a
+conditional UPDATE, so overlapping invocations (a slow previous run, or several
+hosts firing the same schedule) skip instead of competing for locks. The last
+successful result is kept on the lease and reused while it is fresh, and every
+invocation is recorded as a ``JobRun`` with its duration and outcome. A job
+that handles its own errors raises ``JobFailed`` to have the run recorded as
+an error.
+"""
+
+import functools
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .metrics import record_cache
+from .models import JobLease, JobRun
+
+# JobRun rows older than this are pruned when a run finishes.
+DEFAULT_JOB_RUN_RETENTION_DAYS = 30
+
+
+class JobFailed(Exception):
+    """
+    Raised by a coordinated job that failed but has handled the error; the run
+    is recorded as an error and the message is returned as the job's result.
+    """
+
+
+def acquire_lease(name, lease_seconds):
+    """
+    Claim the lease for ``name``.
+
+    Returns an owner token, or ``None`` when another run holds an unexpired lease.
+    """
+    JobLease.objects.get_or_create(name=name)
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    claimed = JobLease.objects.filter(name=name).filter(
+        Q(expires_at__isnull=True) | Q(expires_at__lte=now)
+    ).update(
+        owner=token,
+        expires_at=now + timedelta(seconds=lease_seconds),
+        last_started_at=now,
+    )
+    return token if claimed else None
+
+
+def release_lease(name, token, outcome, result=None, duration=0.0):
+    """Release a lease claimed by ``token`` and store the outcome of the run."""
+    now = timezone.now()
+    fields = {
+        "owner": "",
+        "expires_at": None,
+        "last_finished_at": now,
+        "last_outcome": outcome,
+        "last_duration": duration,
+    }
+    if outcome == JobRun.SUCCESS:
+        fields["last_result"] = result
+    JobLease.objects.filter(name=name, owner=token).update(**fields)
+    record_run(name, outcome, duration, started_at=now - timedelta(seconds=duration))
+
+
+def fresh_result(name, fresh_for):
+    """Return ``(True, result)`` if the last successful run finished within ``fresh_for`` seconds."""
+    if not fresh_for:
+        return False, None
+    lease = JobLease.objects.filter(
+        name=name,
+        last_outcome=JobRun.SUCCESS,
+        last_finished_at__gte=timezone.now() - timedelta(seconds=fresh_for),
+    ).only("last_result").first()
+    record_cache("job_result", lease is not None)
+    if lease is None:
+        return False, None
+    return True, lease.last_result
+
+
+def record_run(name, outcome, duration=0.0, started_at=None):
+    started_at = started_at or timezone.now()
+    JobRun.objects.create(name=name, started_at=started_at, duration=duration, outcome=outcome)
+
+    retention = getattr(settings, "CRM_JOB_RUN_RETENTION_DAYS", DEFAULT_JOB_RUN_RETENTION_DAYS)
+    JobRun.objects.filter(name=name, started_at__lt=started_at - timedelta(days=retention)).delete()
+
+
+def claim_job(name, lease_seconds, fresh_for=0):
+    """
+    Decide whether a run of ``name`` should proceed.
+
+    Returns ``(token, None)`` when the lease was claimed, otherwise
+    ``(None, result)`` with the fresh cached result or a skip message.
+    """
+    is_fresh, result = fresh_result(name, fresh_for)
+    if is_fresh:
+        record_run(name, JobRun.CACHED)
+        return None, result
+
+    token = acquire_lease(name, lease_seconds)
+    if token is None:
+        record_run(name, JobRun.SKIPPED)
+        return None, f"{name} skipped: a previous run is still in progress"
+    return token, None
+
+
+def coordinated_job(name, lease_seconds=600, fresh_for=0):
+    """
+    Run the decorated job at most once at a time across all hosts.
+
+    ``lease_seconds`` bounds how long a crashed run can block the next one, and
+    a successful result younger than ``fresh_for`` seconds is returned without
+    running the job again.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token, result = claim_job(name, lease_seconds, fresh_for)
+            if token is None:
+                return result
+
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except JobFailed as e:
+                release_lease(name, token, JobRun.ERROR, duration=time.monotonic() - started)
+                return str(e)
+            except Exception:
+                release_lease(name, token, JobRun.ERROR, duration=time.monotonic() - started)
+                raise
+            release_lease(name, token, JobRun.SUCCESS, result, time.monotonic() - started)
+            return result
+
+        return wrapper
+
+    return decorator
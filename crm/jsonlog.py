@@ -0,0 +1,209 @@
+"""
+Structured JSON-lines logging for the scheduled jobs.
+
+Callers only put records on a bounded in-memory queue. A background listener
+thread drains the queue in batches, formats each record as one JSON object per
+line and writes the whole batch with a single write, rotating the file by size.
+When the queue is full new records are dropped and counted instead of blocking
+the job.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+from django.core.exceptions import ImproperlyConfigured
+
+DEFAULT_LOG_DIR = "/tmp"
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_BATCH_SIZE = 500
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def _setting(name, default):
+    """Read a setting, falling back to the environment when Django is not configured."""
+    from django.conf import settings
+
+    try:
+        return getattr(settings, name, default)
+    except ImproperlyConfigured:
+        return type(default)(os.environ.get(name, default))
+
+
+class JsonLineFormatter(logging.Formatter):
+    """Format a record as a single JSON object including its structured fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Leave the JSON encoding to the listener thread; only resolve the
+        # message and traceback, which may reference objects that change later.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class BatchRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that writes a batch of records with one write call."""
+
+    def write_batch(self, records):
+        data = "".join(self.format(record) + "\n" for record in records)
+        self.acquire()
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            position = self.stream.tell()
+            if self.maxBytes and position and position + len(data) > self.maxBytes:
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            self.stream.write(data)
+            self.stream.flush()
+        finally:
+            self.release()
+
+
+class BatchQueueListener(logging.handlers.QueueListener):
+    """QueueListener that hands every record already waiting to its handlers as one batch."""
+
+    def __init__(self, queue, *handlers, batch_size=DEFAULT_BATCH_SIZE):
+        super().__init__(queue, *handlers)
+        self.batch_size = batch_size
+
+    def enqueue_sentinel(self):
+        # Wait for room rather than failing when the buffer is full at shutdown.
+        self.queue.put(self._sentinel)
+
+    def _monitor(self):
+        q = self.queue
+        while True:
+            batch = [q.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(q.get_nowait())
+            except queue.Empty:
+                pass
+
+            records = [record for record in batch if record is not self._sentinel]
+            if records:
+                for handler in self.handlers:
+                    handler.write_batch(records)
+            for _ in batch:
+                q.task_done()
+            if len(records) != len(batch):
+                break
+
+
+class StructuredLogger:
+    """Thin wrapper that attaches keyword fields to every log record."""
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    def log(self, level, event, exc_info=False, **fields):
+        self.logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+    def exception(self, event, **fields):
+        self.log(logging.ERROR, event, exc_info=True, **fields)
+
+
+def get_job_logger(name):
+    """
+    Return a structured logger writing to ``<CRM_LOG_DIR>/<name>.jsonl``.
+
+    The file handler and its listener thread are created once per process.
+    """
+    with _sinks_lock:
+        if name not in _sinks:
+            path = os.path.join(_setting("CRM_LOG_DIR", DEFAULT_LOG_DIR), f"{name}.jsonl")
+            file_handler = BatchRotatingFileHandler(
+                path,
+                maxBytes=_setting("CRM_LOG_MAX_BYTES", DEFAULT_MAX_BYTES),
+                backupCount=_setting("CRM_LOG_BACKUP_COUNT", DEFAULT_BACKUP_COUNT),
+                delay=True,
+            )
+            file_handler.setFormatter(JsonLineFormatter())
+
+            records = queue.Queue(maxsize=_setting("CRM_LOG_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+            listener = BatchQueueListener(
+                records, file_handler,
+                batch_size=_setting("CRM_LOG_BATCH_SIZE", DEFAULT_BATCH_SIZE),
+            )
+            listener.start()
+
+            logger = logging.getLogger(f"crm.jobs.{name}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            queue_handler = BoundedQueueHandler(records)
+            logger.addHandler(queue_handler)
+            _sinks[name] = (logger, queue_handler, listener, file_handler)
+        return StructuredLogger(_sinks[name][0])
+
+
+def queue_depths():
+    """``{name: {"queued": n, "dropped": n}}`` for every sink opened in this process."""
+    with _sinks_lock:
+        return {
+            name: {"queued": queue_handler.queue.qsize(), "dropped": queue_handler.dropped}
+            for name, (logger, queue_handler, listener, file_handler) in _sinks.items()
+        }
+
+
+def shutdown():
+    """Flush and stop every sink; loggers are recreated on next use."""
+    with _sinks_lock:
+        for logger, queue_handler, listener, file_handler in _sinks.values():
+            logger.removeHandler(queue_handler)
+            listener.stop()
+            file_handler.close()
+        _sinks.clear()
+
+
+atexit.register(shutdown)
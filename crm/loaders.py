@@ -0,0 +1,169 @@
+"""
+Object loading for relay nodes, foreign keys and nested lists.
+
+``load`` keeps a per-operation identity map on the request context, so each
+``(model, pk)`` is fetched at most once while one operation resolves, however
+often it appears in the response. ``selected_fields`` tells list resolvers
+which relations to join or prefetch up front. Products additionally go
+through an optional cross-request cache, enabled by
+``CRM_PRODUCT_CACHE_TIMEOUT`` (seconds) and stored in the
+``CRM_PRODUCT_CACHE`` cache alias.
+
+Cached products are stamped with a per-product version that every save,
+delete and stock change bumps, both immediately and once the transaction
+commits. A reader that loaded a row just before a write therefore stores it
+under a version nobody asks for again. The cache must be shared by every
+process (Redis, Memcached) for invalidations to reach all of them.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from graphql.language.ast import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+from .metrics import record_cache
+from .models import Product
+
+DEFAULT_CACHE_ALIAS = "default"
+
+
+def identity_map(info):
+    """The ``{(model label, pk): object}`` map of the operation being resolved."""
+    context = info.context
+    if context is None:
+        return {}
+    maps = getattr(context, "_crm_identity_maps", None)
+    if maps is None:
+        maps = {}
+        context._crm_identity_maps = maps
+    # Operations of one batch share the request; each gets its own map. The
+    # AST node is kept alongside so its id cannot be reused while the request lives.
+    return maps.setdefault(id(info.operation), (info.operation, {}))[1]
+
+
+def load(info, model, pk):
+    """Return the ``model`` row with primary key ``pk``, or ``None``."""
+    try:
+        pk = model._meta.pk.to_python(pk)
+    except ValidationError:
+        return None
+    objects = identity_map(info)
+    key = (model._meta.label, pk)
+    hit = key in objects
+    record_cache("identity_map", hit)
+    if not hit:
+        if model is Product:
+            objects[key] = get_product(pk)
+        else:
+            objects[key] = model._default_manager.filter(pk=pk).first()
+    return objects[key]
+
+
+def _collect(info, selection_sets, into):
+    for selection_set in selection_sets:
+        for selection in selection_set.selections if selection_set else ():
+            if isinstance(selection, FieldNode):
+                into.setdefault(selection.name.value, []).append(selection)
+            elif isinstance(selection, InlineFragmentNode):
+                _collect(info, [selection.selection_set], into)
+            elif isinstance(selection, FragmentSpreadNode):
+                _collect(info, [info.fragments[selection.name.value].selection_set], into)
+    return into
+
+
+def _unwrap(info, fields):
+    for wrapper in ("edges", "node"):
+        if wrapper in fields:
+            fields = _collect(info, [node.selection_set for node in fields[wrapper]], {})
+    return fields
+
+
+def selected_fields(info, *path):
+    """
+    Names of the fields selected on the objects ``info``'s field returns,
+    looking through ``edges { node }`` when the field is a connection. With
+    ``path``, the fields selected under those nested fields instead, e.g.
+    ``selected_fields(info, "products")`` on a list of orders.
+    """
+    fields = _unwrap(info, _collect(info, [node.selection_set for node in info.field_nodes], {}))
+    for name in path:
+        fields = _unwrap(info, _collect(info, [node.selection_set for node in fields.get(name, ())], {}))
+    return set(fields)
+
+
+def prefetched(manager):
+    """True when ``manager`` is a related manager whose rows were prefetched."""
+    cache = getattr(getattr(manager, "instance", None), "_prefetched_objects_cache", {})
+    return getattr(manager, "prefetch_cache_name", None) in cache
+
+
+# =======================
+# PRODUCT CACHE
+# =======================
+def product_cache():
+    """The cache backing ``get_product``, or ``None`` when it is disabled."""
+    if not getattr(settings, "CRM_PRODUCT_CACHE_TIMEOUT", 0):
+        return None
+    return caches[getattr(settings, "CRM_PRODUCT_CACHE", DEFAULT_CACHE_ALIAS)]
+
+
+def _version_key(pk):
+    return f"crm:product-version:{pk}"
+
+
+def get_product(pk):
+    cache = product_cache()
+    if cache is None:
+        return Product.objects.filter(pk=pk).first()
+    # Read the version before the row, so a concurrent write always wins.
+    key = f"crm:product:{pk}:{cache.get(_version_key(pk), 0)}"
+    product = cache.get(key)
+    record_cache("product", product is not None)
+    if product is None:
+        product = Product.objects.filter(pk=pk).first()
+        if product is not None:
+            cache.set(key, product, settings.CRM_PRODUCT_CACHE_TIMEOUT)
+    return product
+
+
+def bump_versions(pks):
+    cache = product_cache()
+    if cache is None:
+        return
+    for pk in pks:
+        key = _version_key(pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # First write since the version expired or was evicted.
+            if not cache.add(key, 1, None):
+                cache.incr(key)
+
+
+def invalidate_products(pks):
+    """Drop cached copies of ``pks`` now and again when the transaction commits."""
+    pks = list(pks)
+    bump_versions(pks)
+    transaction.on_commit(lambda: bump_versions(pks))
+
+
+# =======================
+# SIGNALS
+# =======================
+def product_changed(sender, instance, **kwargs):
+    invalidate_products([instance.pk])
+
+
+def products_stock_changed(sender, products, **kwargs):
+    invalidate_products([product.pk for product in products])
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    from .events import stock_changed
+
+    post_save.connect(product_changed, sender=Product, dispatch_uid="crm_loaders_product_saved")
+    post_delete.connect(product_changed, sender=Product, dispatch_uid="crm_loaders_product_deleted")
+    stock_changed.connect(products_stock_changed, dispatch_uid="crm_loaders_stock_changed")
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from crm.archive import DEFAULT_CHUNK_SIZE, archive_horizon, archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Move orders older than CRM_ORDER_ARCHIVE_AFTER_DAYS into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive orders placed before this date (YYYY-MM-DD) instead')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Orders moved per transaction')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                before = timezone.make_aware(datetime.strptime(options['before'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError(f"Invalid --before date: {options['before']!r}")
+        else:
+            before = archive_horizon()
+        moved = archive_orders(before, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} orders placed before {before:%Y-%m-%d}'))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.benchmarks import benchmark_database, best_of, seed
+from crm.encoding import ENCODERS, orjson_available
+
+QUERY = """
+query Page($after: String) {
+    allOrders(first: 100, after: $after) {
+        edges { cursor node { id orderDate totalAmount customer { name email } } }
+        pageInfo { hasNextPage endCursor }
+    }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = 'Compare the GraphQL response encoders on a large allOrders response'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--edges', type=int, default=10000, help='Edges in the encoded response')
+        parser.add_argument('--rounds', type=int, default=20, help='Rounds per encoder; the fastest counts')
+
+    def handle(self, *args, **options):
+        from graphql_crm.schema import execute
+
+        with benchmark_database():
+            seed(customers=500, products=100, orders=options['edges'])
+            edges, after = [], None
+            while True:
+                result = execute(QUERY, {'after': after})
+                if result.errors:
+                    raise CommandError(result.errors[0])
+                page = result.data['allOrders']
+                edges.extend(page['edges'])
+                if not page['pageInfo']['hasNextPage']:
+                    break
+                after = page['pageInfo']['endCursor']
+
+        response = {'data': {'allOrders': {'edges': edges, 'pageInfo': page['pageInfo']}}}
+        encoders = [name for name in ENCODERS if name != 'orjson' or orjson_available()]
+        reference = ENCODERS['json'](response)
+        timings = {}
+        for name in encoders:
+            encode = ENCODERS[name]
+            if encode(response) != reference:
+                raise CommandError(f'{name} output differs from the json encoder')
+            timings[name] = best_of(options['rounds'], lambda: encode(response))
+
+        self.stdout.write(f'{len(edges)} edges, {len(reference) / 1e6:.1f} MB encoded')
+        baseline = timings['json']
+        for name, seconds in timings.items():
+            self.stdout.write(
+                f'{name:8} {seconds * 1000:8.2f} ms  {len(reference) / seconds / 1e6:8.1f} MB/s  '
+                f'{baseline / seconds:5.1f}x'
+            )
@@ -0,0 +1,71 @@
+import gc
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from crm import metrics
+from crm.benchmarks import benchmark_database, seed
+
+QUERY = """
+query Stats {
+    totalCustomers
+    totalOrders
+    totalRevenue
+    recentOrders(limit: 5) { id totalAmount customer { name } }
+}
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure the request-path overhead of the metrics instrumentation on /graphql'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=25, help='Requests per round')
+        parser.add_argument('--rounds', type=int, default=30, help='Rounds per mode; the fastest counts')
+        parser.add_argument(
+            '--max-overhead', type=float, default=2.0,
+            help='Fail when instrumentation adds more than this percentage',
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            seed(customers=50, products=20, orders=200)
+            client = Client()
+
+            def run_round():
+                # Keep collector pauses out of the timed section.
+                gc.collect()
+                gc.disable()
+                try:
+                    started = time.perf_counter()
+                    for _ in range(options['requests']):
+                        response = client.post('/graphql', {'query': QUERY}, content_type='application/json')
+                        assert response.status_code == 200, response.content
+                    return time.perf_counter() - started
+                finally:
+                    gc.enable()
+
+            previous = metrics.REGISTRY.enabled
+            timings = {True: [], False: []}
+            try:
+                run_round()  # warm-up
+                # Alternate which mode goes first so drift affects both equally.
+                for i in range(options['rounds']):
+                    for enabled in ((False, True) if i % 2 == 0 else (True, False)):
+                        metrics.REGISTRY.enabled = enabled
+                        timings[enabled].append(run_round())
+            finally:
+                metrics.REGISTRY.enabled = previous
+
+        baseline, instrumented = min(timings[False]), min(timings[True])
+        overhead = (instrumented - baseline) / baseline * 100
+        per_request = options['requests']
+        self.stdout.write(
+            f'baseline     {baseline / per_request * 1e6:8.1f} us/request\n'
+            f'instrumented {instrumented / per_request * 1e6:8.1f} us/request\n'
+            f'overhead     {overhead:8.2f} %'
+        )
+        if overhead > options['max_overhead']:
+            raise CommandError(f'Metrics overhead {overhead:.2f}% exceeds {options["max_overhead"]}%')
+        self.stdout.write(self.style.SUCCESS('Metrics overhead within budget'))
@@ -0,0 +1,46 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.benchmarks import benchmark_database, best_of, seed
+from crm.reports import build_report
+
+
+class Command(BaseCommand):
+    help = 'Measure how the customer report engine scales with worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=20000)
+        parser.add_argument('--orders', type=int, default=200000)
+        parser.add_argument(
+            '--workers', default=None,
+            help='Comma-separated worker counts to compare (default: 1, 2, 4, ... up to the CPU count)',
+        )
+        parser.add_argument('--rounds', type=int, default=3, help='Rounds per worker count; the fastest counts')
+
+    def handle(self, *args, **options):
+        if options['workers']:
+            counts = [int(n) for n in options['workers'].split(',')]
+        else:
+            cpus = os.cpu_count() or 1
+            counts = sorted({1, cpus} | {2 ** i for i in range(1, cpus.bit_length()) if 2 ** i <= cpus})
+
+        with benchmark_database(shared=True):
+            seed(customers=options['customers'], products=200, orders=options['orders'])
+            reference = build_report(workers=1)
+            timings = {}
+            for workers in counts:
+                if build_report(workers=workers) != reference:
+                    raise CommandError(f'Report built with {workers} workers differs from the serial one')
+                timings[workers] = best_of(options['rounds'], lambda: build_report(workers=workers))
+
+        self.stdout.write(
+            f'{options["customers"]} customers, {options["orders"]} orders, {os.cpu_count()} CPUs'
+        )
+        baseline = timings[counts[0]] * counts[0]
+        for workers, seconds in timings.items():
+            speedup = timings[counts[0]] / seconds
+            self.stdout.write(
+                f'{workers:3} workers {seconds:8.2f} s  speedup {speedup:5.2f}x  '
+                f'efficiency {baseline / seconds / workers * 100:5.1f} %'
+            )
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What each entry point imports before doing any work.
+TARGETS = {
+    'manage.py': ['manage.py', 'version'],
+    'web': ['-c', (
+        'import django; django.setup(); '
+        'from django.urls import get_resolver; get_resolver().url_patterns'
+    )],
+    'cron': ['-c', 'import django; django.setup(); import crm.cron'],
+    'celery': ['-c', 'import crm.celery'],
+}
+
+DEFAULT_BUDGET_MS = {
+    'manage.py': 1000,
+    'web': 1000,
+    'cron': 1000,
+    'celery': 500,
+}
+
+
+def parse_importtime(output):
+    """Return ``(total_us, top_level)`` from ``python -X importtime`` output."""
+    total, top_level = 0, []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        total += int(self_us)
+        if not name.startswith('  '):
+            top_level.append((int(cumulative_us), name.strip()))
+    return total, sorted(top_level, reverse=True)
+
+
+class Command(BaseCommand):
+    help = 'Measure cold-start import time of the CRM entry points against a budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='*', help=f'Entry points to measure: {", ".join(TARGETS)}')
+        parser.add_argument('--runs', type=int, default=3, help='Runs per target; the fastest counts')
+        parser.add_argument('--top', type=int, default=5, help='Heaviest top-level imports to list')
+
+    def handle(self, *args, **options):
+        budgets = {**DEFAULT_BUDGET_MS, **getattr(settings, 'CRM_STARTUP_BUDGET_MS', {})}
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', '')}
+        over_budget = []
+        unknown = set(options['targets']) - set(TARGETS)
+        if unknown:
+            raise CommandError(f'Unknown targets: {", ".join(sorted(unknown))}')
+
+        for target in options['targets'] or TARGETS:
+            best = None
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                completed = subprocess.run(
+                    [sys.executable, '-X', 'importtime', *TARGETS[target]],
+                    cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+                )
+                wall = time.perf_counter() - started
+                if completed.returncode:
+                    raise CommandError(f'{target} failed to start:\n{completed.stderr[-2000:]}')
+                total, top_level = parse_importtime(completed.stderr)
+                if best is None or total < best[0]:
+                    best = (total, wall, top_level)
+
+            total, wall, top_level = best
+            import_ms = total / 1000
+            budget = budgets[target]
+            status = 'ok' if import_ms <= budget else 'OVER BUDGET'
+            self.stdout.write(
+                f'{target:10} imports {import_ms:7.1f} ms  wall {wall * 1000:7.1f} ms  '
+                f'budget {budget} ms  {status}'
+            )
+            for cumulative, name in top_level[:options['top']]:
+                self.stdout.write(f'    {cumulative / 1000:7.1f} ms  {name}')
+            if import_ms > budget:
+                over_budget.append(target)
+
+        if over_budget:
+            raise CommandError(f'Startup budget exceeded for: {", ".join(over_budget)}')
+        self.stdout.write(self.style.SUCCESS('All entry points within their startup budget'))
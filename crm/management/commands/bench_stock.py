@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from crm.benchmarks import benchmark_database, stock_contention
+
+
+class Command(BaseCommand):
+    help = 'Compare direct and coalesced stock updates with many threads selling one product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--operations', type=int, default=50, help='Sells per thread')
+        parser.add_argument('--window-ms', type=float, default=2, help='Coalescing window to compare against')
+
+    def handle(self, *args, **options):
+        results = {}
+        with benchmark_database(shared=True):
+            for label, window in (('direct', 0), (f'coalesced {options["window_ms"]:g} ms', options['window_ms'])):
+                with override_settings(CRM_STOCK_COALESCE_MS=window):
+                    results[label] = stock_contention(options['threads'], options['operations'])
+
+        self.stdout.write(f'{options["threads"]} threads x {options["operations"]} sells of one product')
+        for label, result in results.items():
+            self.stdout.write(
+                f'{label:>20} {result["seconds"]:8.2f} s  {result["per_second"]:8.0f} sells/s  '
+                f'{result["sold"]:6} sold  {result["errors"]:5} errors'
+            )
+        inconsistent = [label for label, result in results.items() if not result['consistent']]
+        if inconsistent:
+            raise CommandError(f'Stock and ledger disagree after: {", ".join(inconsistent)}')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from crm.copurchase import DEFAULT_CHUNK_SIZE, build_index
+
+
+class Command(BaseCommand):
+    help = 'Count new orders into the frequently-bought-together index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Drop the index and recount every order')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Orders counted per transaction')
+
+    def handle(self, *args, **options):
+        read = build_index(options['chunk_size'], rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f'Counted {read} orders into the co-purchase index'))
@@ -1,37 +1,58 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Exists, OuterRef
-from crm.models import Customer, Order
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from crm import outbox
+from crm.jobs import coordinated_job
+from crm.models import ArchivedOrder, ChangeRecord, Customer, Order
+
+
+@coordinated_job('clean_inactive_customers', lease_seconds=3600)
+def purge_inactive_customers():
+    """Delete customers with no orders in the past year and return how many were deleted."""
+    one_year_ago = timezone.now() - timedelta(days=365)
+
+    # Candidates come off the last_order_at index, but the column can drift,
+    # so only those with no recent live or archived order are deleted.
+    inactive_customers = Customer.objects.filter(
+        Q(last_order_at__lt=one_year_ago) | Q(last_order_at__isnull=True)
+    ).filter(*(
+        ~Exists(model.objects.filter(customer=OuterRef('pk'), order_date__gte=one_year_ago))
+        for model in (Order, ArchivedOrder)
+    ))
+
+    with transaction.atomic():
+        # Locking the rows keeps new orders for them out until the delete commits.
+        customer_ids = list(inactive_customers.select_for_update().values_list('pk', flat=True))
+        # Orders, live and archived, go with their customer through the
+        # cascade; record those too.
+        order_ids = [
+            pk
+            for model in (Order, ArchivedOrder)
+            for pk in model.objects.filter(customer_id__in=customer_ids).values_list('pk', flat=True)
+        ]
+        outbox.record_changes('order', ChangeRecord.DELETE, [(pk, None) for pk in order_ids])
+        outbox.record_changes('customer', ChangeRecord.DELETE, [(pk, None) for pk in customer_ids])
+        Customer.objects.filter(pk__in=customer_ids).delete()
+    return len(customer_ids)
+
 
 class Command(BaseCommand):
     help = 'Delete customers with no orders in the past year'
 
     def handle(self, *args, **options):
-        one_year_ago = timezone.now() - timedelta(days=365)
-        
         try:
-            # Subquery to find customers with recent orders
-            recent_orders = Order.objects.filter(
-                customer=OuterRef('pk'),
-                order_date__gte=one_year_ago
-            )
-            
-            # Find inactive customers (no recent orders)
-            inactive_customers = Customer.objects.annotate(
-                has_recent_order=Exists(recent_orders)
-            ).filter(has_recent_order=False)
-            
-            deleted_count = inactive_customers.count()
-            inactive_customers.delete()
-            
-            self.stdout.write(
-                self.style.SUCCESS(f'Successfully deleted {deleted_count} inactive customers')
-            )
-            return deleted_count
-            
+            result = purge_inactive_customers()
         except Exception as e:
             self.stdout.write(
                 self.style.ERROR(f'Error: {e}')
             )
-            return 0
\ No newline at end of file
+            return
+
+        if isinstance(result, int):
+            self.stdout.write(
+                self.style.SUCCESS(f'Successfully deleted {result} inactive customers')
+            )
+        else:
+            self.stdout.write(self.style.WARNING(result))
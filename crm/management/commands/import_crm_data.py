@@ -0,0 +1,365 @@
+import csv
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from crm import activity, inventory, outbox
+from crm.models import ChangeRecord, Customer, Product, Order
+
+
+class RowError(Exception):
+    """Raised while preparing a single input row that cannot be imported."""
+
+
+class Command(BaseCommand):
+    help = 'Bulk import customers, products or orders from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=['customers', 'products', 'orders'])
+        parser.add_argument('path', help='CSV or NDJSON file to import')
+        parser.add_argument(
+            '--format', choices=['csv', 'ndjson'],
+            help='Input format (default: guessed from the file extension)',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help='Rows validated and written per transaction',
+        )
+        parser.add_argument(
+            '--rejects',
+            help='File receiving rejected rows as NDJSON (default: <path>.rejects.ndjson)',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        rejects_path = options['rejects'] or f'{path}.rejects.ndjson'
+        model = options['model']
+
+        # Emails already accepted from earlier chunks of this file.
+        self.seen_emails = set()
+
+        prepare = getattr(self, f'prepare_{model}')
+        write = self.write_orders if model == 'orders' else self.write_rows
+
+        imported = rejected = total = 0
+        started = time.monotonic()
+
+        with open(path, newline='', encoding='utf-8') as source, \
+                open(rejects_path, 'w', encoding='utf-8') as rejects_file:
+            rows = self.read_rows(source, fmt)
+            while True:
+                chunk = list(islice(rows, options['chunk_size']))
+                if not chunk:
+                    break
+                total += len(chunk)
+
+                rejects = [(line, row, 'Malformed JSON line') for line, row in chunk if row is None]
+                accepted, prepare_rejects = prepare([(line, row) for line, row in chunk if row is not None])
+                rejects.extend(prepare_rejects)
+                written, write_rejects = write(accepted)
+                rejects.extend(write_rejects)
+
+                imported += written
+                rejected += len(rejects)
+                for line, row, reason in rejects:
+                    rejects_file.write(json.dumps({'line': line, 'error': reason, 'row': row}) + '\n')
+
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'  {total} rows read, {imported} imported, {rejected} rejected')
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        if not rejected:
+            os.remove(rejects_path)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Imported {imported} {model}, rejected {rejected} '
+                f'({total / elapsed:.0f} rows/s)'
+            )
+        )
+        if rejected:
+            self.stdout.write(self.style.WARNING(f'Rejected rows written to {rejects_path}'))
+
+    # =======================
+    # INPUT
+    # =======================
+    def read_rows(self, source, fmt):
+        """Yield ``(line_number, row)`` pairs; malformed NDJSON lines yield a ``None`` row."""
+        if fmt == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line_number, line in enumerate(source, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+    # =======================
+    # VALIDATION
+    # =======================
+    def prepare_customers(self, chunk):
+        candidates, rejects = [], []
+        for line, row in chunk:
+            try:
+                name = self._text(row, 'name', Customer)
+                email = self._text(row, 'email', Customer)
+                try:
+                    validate_email(email)
+                except ValidationError:
+                    raise RowError(f'Invalid email: {email}')
+                if email in self.seen_emails:
+                    raise RowError(f'Duplicate email in input: {email}')
+                phone = self._text(row, 'phone', Customer, required=False)
+            except RowError as e:
+                rejects.append((line, row, str(e)))
+                continue
+            self.seen_emails.add(email)
+            candidates.append((line, row, Customer(name=name, email=email, phone=phone)))
+
+        # One IN lookup for the whole chunk instead of a query per row.
+        existing = set(
+            Customer.objects.filter(
+                email__in=[customer.email for _, _, customer in candidates]
+            ).values_list('email', flat=True)
+        )
+        accepted = []
+        for line, row, customer in candidates:
+            if customer.email in existing:
+                rejects.append((line, row, f'Email already exists: {customer.email}'))
+            else:
+                accepted.append((line, row, customer))
+        return accepted, rejects
+
+    def prepare_products(self, chunk):
+        accepted, rejects = [], []
+        for line, row in chunk:
+            try:
+                name = self._text(row, 'name', Product)
+                price = self._decimal(row, 'price', max_digits=10)
+                stock = self._integer(row, 'stock', default=0)
+            except RowError as e:
+                rejects.append((line, row, str(e)))
+                continue
+            accepted.append((line, row, Product(name=name, price=price, stock=stock)))
+        return accepted, rejects
+
+    def prepare_orders(self, chunk):
+        parsed, rejects = [], []
+        customer_ids, customer_emails, product_ids = set(), set(), set()
+        for line, row in chunk:
+            try:
+                customer_ref = self._customer_ref(row)
+                ids = self._product_ids(row)
+                total = self._decimal(row, 'total_amount', max_digits=12, required=False)
+            except RowError as e:
+                rejects.append((line, row, str(e)))
+                continue
+            if isinstance(customer_ref, int):
+                customer_ids.add(customer_ref)
+            else:
+                customer_emails.add(customer_ref)
+            product_ids.update(ids)
+            parsed.append((line, row, customer_ref, ids, total))
+
+        # Resolve every foreign key of the chunk with at most three queries.
+        customers_by_id = Customer.objects.in_bulk(customer_ids)
+        customers_by_email = Customer.objects.in_bulk(customer_emails, field_name='email')
+        products = Product.objects.in_bulk(product_ids)
+
+        accepted = []
+        for line, row, customer_ref, ids, total in parsed:
+            if isinstance(customer_ref, int):
+                customer = customers_by_id.get(customer_ref)
+            else:
+                customer = customers_by_email.get(customer_ref)
+            if customer is None:
+                rejects.append((line, row, f'Unknown customer: {customer_ref}'))
+                continue
+            missing = [pk for pk in ids if pk not in products]
+            if missing:
+                rejects.append((line, row, f'Unknown product ids: {missing}'))
+                continue
+            if total is None:
+                total = sum((products[pk].price for pk in ids), Decimal('0.00'))
+            order = Order(customer=customer, total_amount=total)
+            order._import_product_ids = ids
+            accepted.append((line, row, order))
+        return accepted, rejects
+
+    # =======================
+    # WRITES
+    # =======================
+    def write_rows(self, accepted):
+        """Write a chunk with one ``bulk_create``, retrying row by row if it fails."""
+        if not accepted:
+            return 0, []
+        model = type(accepted[0][2])
+        try:
+            with transaction.atomic():
+                objs = model.objects.bulk_create([obj for _, _, obj in accepted])
+                self.record_created(objs)
+            return len(accepted), []
+        except IntegrityError:
+            pass
+
+        # A concurrent writer beat us to some rows; isolate them with savepoints.
+        written, rejects, saved = 0, [], []
+        with transaction.atomic():
+            for line, row, obj in accepted:
+                obj.pk = None
+                try:
+                    with transaction.atomic():
+                        obj.save()
+                    written += 1
+                    saved.append(obj)
+                except IntegrityError as e:
+                    rejects.append((line, row, f'Integrity error: {e}'))
+            self.record_created(saved)
+        return written, rejects
+
+    def write_orders(self, accepted):
+        """Write a chunk of orders and their product links, retrying row by row if it fails."""
+        if not accepted:
+            return 0, []
+        try:
+            with transaction.atomic():
+                self.save_orders([order for _, _, order in accepted])
+            return len(accepted), []
+        except IntegrityError:
+            pass
+
+        # Isolate the failing orders with savepoints, as write_rows does.
+        written, rejects = 0, []
+        with transaction.atomic():
+            for line, row, order in accepted:
+                order.pk = None
+                try:
+                    with transaction.atomic():
+                        self.save_orders([order])
+                    written += 1
+                except IntegrityError as e:
+                    rejects.append((line, row, f'Integrity error: {e}'))
+        return written, rejects
+
+    @staticmethod
+    def save_orders(orders):
+        """Create ``orders``, their product links, activity and outbox records."""
+        through = Order.products.through
+        Order.objects.bulk_create(orders)
+        through.objects.bulk_create([
+            through(order_id=order.pk, product_id=product_id)
+            for order in orders
+            for product_id in order._import_product_ids
+        ])
+        activity.record_orders(orders)
+        outbox.record_changes('order', ChangeRecord.CREATE, [
+            (order.pk, outbox.order_payload(order, order._import_product_ids))
+            for order in orders
+        ])
+
+    @staticmethod
+    def record_created(objs):
+        """Append outbox records (and opening stock) for customers or products created in this chunk."""
+        if not objs:
+            return
+        if isinstance(objs[0], Customer):
+            model, payload = 'customer', outbox.customer_payload
+        else:
+            model, payload = 'product', outbox.product_payload
+            inventory.open_stock(objs)
+        outbox.record_changes(model, ChangeRecord.CREATE, [(obj.pk, payload(obj)) for obj in objs])
+
+    # =======================
+    # FIELD HELPERS
+    # =======================
+    @staticmethod
+    def _text(row, field, model, required=True):
+        """A stripped string value that fits ``model``'s column for ``field``."""
+        value = row.get(field)
+        if value is not None and not isinstance(value, str):
+            raise RowError(f'Invalid {field}: expected a string')
+        value = (value or '').strip()
+        if not value:
+            if required:
+                raise RowError(f'Missing required field: {field}')
+            return None
+        max_length = model._meta.get_field(field).max_length
+        if len(value) > max_length:
+            raise RowError(f'Invalid {field}: longer than {max_length} characters')
+        return value
+
+    def _decimal(self, row, field, max_digits, required=True):
+        value = row.get(field)
+        if value in (None, ''):
+            if required:
+                raise RowError(f'Missing required field: {field}')
+            return None
+        try:
+            amount = Decimal(str(value).strip()).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise RowError(f'Invalid {field}: {value}')
+        if amount < 0 or len(amount.as_tuple().digits) > max_digits:
+            raise RowError(f'Invalid {field}: {value}')
+        return amount
+
+    @staticmethod
+    def _integer(row, field, default):
+        value = row.get(field)
+        if value in (None, ''):
+            return default
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            raise RowError(f'Invalid {field}: {value}')
+        if number < 0:
+            raise RowError(f'Invalid {field}: {value}')
+        return number
+
+    @staticmethod
+    def _customer_ref(row):
+        """Orders reference their customer by ``customer_id`` or ``customer_email``."""
+        customer_id = row.get('customer_id')
+        if customer_id not in (None, ''):
+            try:
+                return int(customer_id)
+            except (TypeError, ValueError):
+                raise RowError(f'Invalid customer_id: {customer_id}')
+        email = row.get('customer_email')
+        email = email.strip() if isinstance(email, str) else None
+        if not email:
+            raise RowError('Missing required field: customer_id or customer_email')
+        return email
+
+    @staticmethod
+    def _product_ids(row):
+        """Product ids come as a JSON list (NDJSON) or a ``;``-separated string (CSV); repeats are dropped."""
+        value = row.get('product_ids')
+        if isinstance(value, str):
+            value = [part for part in value.replace('|', ';').split(';') if part.strip()]
+        if not value:
+            raise RowError('Missing required field: product_ids')
+        try:
+            # The link table holds each product once per order.
+            return list(dict.fromkeys(int(pk) for pk in value))
+        except (TypeError, ValueError):
+            raise RowError(f'Invalid product_ids: {row.get("product_ids")}')
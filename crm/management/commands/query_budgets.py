@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.benchmarks import benchmark_database
+from crm.budgets import DEFAULT_SIZES, measure
+
+
+class Command(BaseCommand):
+    help = 'Count the SQL queries of representative GraphQL operations at several dataset sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='Comma-separated order counts to measure at'
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file as well')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        with benchmark_database():
+            report = measure(sizes)
+
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+        self.stdout.write(text)
+
+        over = [
+            name for name, result in report['operations'].items()
+            if not (result['within_budget'] and result['constant'])
+        ]
+        if over:
+            raise CommandError(f'Over budget or growing with the dataset: {", ".join(over)}')
+        self.stdout.write(self.style.SUCCESS(f'All {len(report["operations"])} operations within budget'))
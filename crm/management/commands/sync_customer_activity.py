@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from crm.activity import DEFAULT_CHUNK_SIZE, sync_activity
+
+
+class Command(BaseCommand):
+    help = 'Backfill or check Customer.last_order_at and order_count against the orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Customers per chunk')
+        parser.add_argument('--check', action='store_true', help='Only report drift; do not repair it')
+
+    def handle(self, *args, **options):
+        checked, drifted = sync_activity(options['chunk_size'], repair=not options['check'])
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS(f'All {checked} customers are in sync'))
+        elif options['check']:
+            self.stdout.write(self.style.WARNING(f'{drifted} of {checked} customers have drifted'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {drifted} of {checked} customers'))
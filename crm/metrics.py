@@ -0,0 +1,270 @@
+"""
+In-process metrics exposed in the Prometheus text exposition format.
+
+Each metric keeps one plain dict per thread, so recording a sample never takes
+a lock; the per-thread dicts are merged when ``/metrics`` is scraped. The
+dicts of finished threads are folded into one retired total when a scrape or
+a new thread comes along, so thread churn doesn't grow the list. Metrics
+that live in the database rather than in this process (scheduled job runs,
+which execute in cron and Celery processes) are read by collectors at scrape
+time.
+"""
+
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        # (thread, values) per recording thread, and the totals of finished ones.
+        self._shards = []
+        self._retired = {}
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = {}
+            with self._shards_lock:
+                self._reap()
+                self._shards.append((threading.current_thread(), values))
+            self._local.values = values
+            return values
+
+    def _reap(self):
+        """Fold the shards of finished threads into the retired totals; call with the lock held."""
+        live = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                live.append((thread, values))
+            else:
+                self._merge(self._retired, values)
+        self._shards = live
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def _snapshots(self):
+        with self._shards_lock:
+            self._reap()
+            retired = self._retired.copy()
+            shards = [values for _, values in self._shards]
+        # dict.copy() is atomic under the GIL, so owners may keep writing.
+        return [retired] + [shard.copy() for shard in shards]
+
+    def collect(self):
+        totals = {}
+        for shard in self._snapshots():
+            self._merge(totals, shard)
+        return totals
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples())
+        return lines
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    @staticmethod
+    def _merge(totals, shard):
+        for key, value in shard.items():
+            totals[key] = totals.get(key, 0) + value
+
+    def _render_samples(self):
+        for key, value in sorted(self.collect().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        state = shard.get(key)
+        if state is None:
+            # Per-bucket counts (the last slot is +Inf), then sum and count.
+            state = shard[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    @staticmethod
+    def _merge(totals, shard):
+        for key, state in shard.items():
+            # New lists, so a snapshot of the totals never changes under a reader.
+            state = list(state)
+            merged = totals.get(key)
+            totals[key] = state if merged is None else [a + b for a, b in zip(merged, state)]
+
+    def _render_samples(self):
+        bounds = self.buckets + (float("inf"),)
+        for key, state in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(state[-2])}"
+            yield f"{self.name}_count{labels} {state[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self.enabled = getattr(settings, "CRM_METRICS_ENABLED", True)
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """Register a callable returning exposition lines, evaluated on every scrape."""
+        self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+GRAPHQL_REQUESTS = REGISTRY.counter(
+    "crm_graphql_requests_total", "GraphQL operations executed.", ["operation", "status"]
+)
+GRAPHQL_LATENCY = REGISTRY.histogram(
+    "crm_graphql_request_duration_seconds", "GraphQL operation latency.", ["operation"]
+)
+RESOLVER_ERRORS = REGISTRY.counter(
+    "crm_graphql_resolver_errors_total", "Errors raised while resolving GraphQL fields.", ["field"]
+)
+SQL_QUERIES = REGISTRY.histogram(
+    "crm_db_query_duration_seconds", "SQL statements executed and their latency.", ["alias"],
+    buckets=SQL_LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "crm_cache_requests_total", "Cache lookups by cache and result (hit or miss).", ["cache", "result"]
+)
+
+
+def record_cache(cache, hit):
+    if REGISTRY.enabled:
+        CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+class SQLTimer:
+    """``connection.execute_wrapper`` that counts and times every SQL statement."""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        if not REGISTRY.enabled:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            SQL_QUERIES.observe(time.perf_counter() - started, alias=self.alias)
+
+
+def install_sql_timer(sender, connection, **kwargs):
+    """``connection_created`` receiver adding the SQL timer to each new connection."""
+    if not any(isinstance(wrapper, SQLTimer) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(SQLTimer(connection.alias))
+
+
+@REGISTRY.register_collector
+def collect_job_metrics():
+    """Job runs are recorded in the database by whichever process ran them."""
+    from django.db.models import Count
+
+    from .models import JobLease, JobRun
+
+    lines = [
+        "# HELP crm_job_runs Scheduled job runs recorded within the retention window.",
+        "# TYPE crm_job_runs gauge",
+    ]
+    try:
+        runs = JobRun.objects.values("name", "outcome").annotate(count=Count("id")).order_by("name", "outcome")
+        for row in runs:
+            labels = _format_labels(("job", "outcome"), (row["name"], row["outcome"]))
+            lines.append(f"crm_job_runs{labels} {row['count']}")
+
+        leases = list(JobLease.objects.order_by("name"))
+    except Exception:
+        return []
+
+    lines.extend([
+        "# HELP crm_job_last_duration_seconds Duration of the last finished run.",
+        "# TYPE crm_job_last_duration_seconds gauge",
+    ])
+    for lease in leases:
+        if lease.last_duration is not None:
+            labels = _format_labels(("job", "outcome"), (lease.name, lease.last_outcome))
+            lines.append(f"crm_job_last_duration_seconds{labels} {_format_value(lease.last_duration)}")
+
+    lines.extend([
+        "# HELP crm_job_last_finished_timestamp_seconds Unix time the last run finished.",
+        "# TYPE crm_job_last_finished_timestamp_seconds gauge",
+    ])
+    for lease in leases:
+        if lease.last_finished_at is not None:
+            labels = _format_labels(("job",), (lease.name,))
+            lines.append(f"crm_job_last_finished_timestamp_seconds{labels} {lease.last_finished_at.timestamp()}")
+    return lines
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_customer_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('owner', models.CharField(blank=True, default='', max_length=64)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('last_started_at', models.DateTimeField(blank=True, null=True)),
+                ('last_finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_outcome', models.CharField(blank=True, default='', max_length=20)),
+                ('last_result', models.JSONField(blank=True, null=True)),
+                ('last_duration', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('started_at', models.DateTimeField()),
+                ('duration', models.FloatField(default=0)),
+                ('outcome', models.CharField(choices=[('success', 'Success'), ('error', 'Error'), ('skipped', 'Skipped (already running)'), ('cached', 'Cached result reused')], max_length=20)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name', 'started_at'], name='crm_jobrun_name_a51d62_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # Start every product's ledger with its current stock.
+    Product = apps.get_model('crm', 'Product')
+    StockMovement = apps.get_model('crm', 'StockMovement')
+    StockMovement.objects.bulk_create(
+        StockMovement(product_id=pk, quantity=stock, reason='balance')
+        for pk, stock in Product.objects.filter(stock__gt=0).values_list('pk', 'stock').iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_change_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('held', 'Held'), ('confirmed', 'Confirmed'), ('released', 'Released')], default='held', max_length=10)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='crm.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='crm.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('reason', models.CharField(choices=[('balance', 'Balance'), ('restock', 'Restock'), ('sale', 'Sale'), ('reserve', 'Reserve'), ('release', 'Release'), ('adjust', 'Adjust')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='crm.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='crm.product')),
+                ('reservation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='crm.stockreservation')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['status', 'expires_at'], name='crm_stockre_status_6c0e44_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'created_at'], name='crm_stockmo_product_f57a5d_idx'),
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
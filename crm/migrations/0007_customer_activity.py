@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:48
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def backfill_activity(apps, schema_editor):
+    """Fill the activity columns from existing orders, one id chunk at a time."""
+    Customer = apps.get_model('crm', 'Customer')
+    Order = apps.get_model('crm', 'Order')
+    orders = Order.objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+    last_id = 0
+    while True:
+        ids = list(
+            Customer.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:BACKFILL_CHUNK_SIZE]
+        )
+        if not ids:
+            return
+        last_id = ids[-1]
+        Customer.objects.filter(pk__gte=ids[0], pk__lte=last_id).update(
+            order_count=Coalesce(
+                Subquery(orders.annotate(n=Count('pk')).values('n')), Value(0), output_field=IntegerField()
+            ),
+            last_order_at=Subquery(orders.annotate(latest=Max('order_date')).values('latest')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='last_order_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_activity, migrations.RunPython.noop),
+    ]
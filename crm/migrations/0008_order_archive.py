@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_customer_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('order_date', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='crm.customer')),
+                ('products', models.ManyToManyField(related_name='archived_orders', to='crm.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order_date', 'id'], name='crm_archive_order_d_6c8561_idx'), models.Index(fields=['total_amount', 'id'], name='crm_archive_total_a_ca7a6c_idx')],
+            },
+        ),
+    ]
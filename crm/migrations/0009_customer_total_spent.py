@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:04
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def backfill_total_spent(apps, schema_editor):
+    """Sum each customer's live and archived orders, one id chunk at a time."""
+    Customer = apps.get_model('crm', 'Customer')
+
+    def spent(model):
+        orders = apps.get_model('crm', model).objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+        return Coalesce(
+            Subquery(orders.annotate(total=Sum('total_amount')).values('total')),
+            Value(Decimal(0)),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+
+    last_id = 0
+    while True:
+        ids = list(
+            Customer.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:BACKFILL_CHUNK_SIZE]
+        )
+        if not ids:
+            return
+        last_id = ids[-1]
+        Customer.objects.filter(pk__gte=ids[0], pk__lte=last_id).update(
+            total_spent=spent('Order') + spent('ArchivedOrder'),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_order_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='total_spent',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['order_count', 'id'], name='crm_custome_order_c_0a1b20_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['total_spent', 'id'], name='crm_custome_total_s_88a0e8_idx'),
+        ),
+        migrations.RunPython(backfill_total_spent, migrations.RunPython.noop),
+    ]
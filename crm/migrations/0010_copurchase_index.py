@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0009_customer_total_spent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('rank', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='crm.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copurchases', to='crm.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'rank'], name='crm_copurch_product_efacbb_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'other'), name='crm_copurchase_unique_pair')],
+            },
+        ),
+    ]
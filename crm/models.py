@@ -5,6 +5,18 @@ class Customer(models.Model):
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    # Maintained by crm/activity.py whenever orders are written.
+    last_order_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    order_count = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        # Backs the stable (key, id) orderings in crm/filters.py.
+        indexes = [
+            models.Index(fields=["name", "id"]),
+            models.Index(fields=["order_count", "id"]),
+            models.Index(fields=["total_spent", "id"]),
+        ]
 
     def __str__(self):
         return self.name
@@ -15,6 +27,13 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["name", "id"]),
+            models.Index(fields=["price", "id"]),
+            models.Index(fields=["stock", "id"]),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -25,6 +44,191 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
     order_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["order_date", "id"]),
+            models.Index(fields=["total_amount", "id"]),
+        ]
+
     def __str__(self):
         return f"Order {self.id} - {self.customer.name}"
 
+
+class ArchivedOrder(models.Model):
+    """An order moved out of ``Order`` by ``crm.archive.archive_orders``; it keeps its id."""
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="archived_orders")
+    products = models.ManyToManyField(Product, related_name="archived_orders")
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    order_date = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["order_date", "id"]),
+            models.Index(fields=["total_amount", "id"]),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.id} - {self.customer.name}"
+
+
+class CoPurchase(models.Model):
+    """
+    How many orders contained both ``product`` and ``other``, maintained by
+    ``crm.copurchase.build_index``. ``rank`` numbers ``product``'s top
+    neighbours from 1 and is empty for the rest.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="copurchases")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    count = models.PositiveIntegerField(default=0)
+    rank = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "other"], name="crm_copurchase_unique_pair"),
+        ]
+        # Serves frequentlyBoughtWith with one range read.
+        indexes = [models.Index(fields=["product", "rank"])]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.other_id}: {self.count}"
+
+
+class IndexCursor(models.Model):
+    """How far an incremental index build has read, as the last order id it counted."""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.position}"
+
+
+class JobLease(models.Model):
+    """Coordination state of one scheduled job: its lease and last result."""
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=64, blank=True, default="")
+    expires_at = models.DateTimeField(null=True, blank=True)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+    last_outcome = models.CharField(max_length=20, blank=True, default="")
+    last_result = models.JSONField(null=True, blank=True)
+    last_duration = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class JobRun(models.Model):
+    """One invocation of a scheduled job and how long it took."""
+    SUCCESS = "success"
+    ERROR = "error"
+    SKIPPED = "skipped"
+    CACHED = "cached"
+    OUTCOME_CHOICES = [
+        (SUCCESS, "Success"),
+        (ERROR, "Error"),
+        (SKIPPED, "Skipped (already running)"),
+        (CACHED, "Cached result reused"),
+    ]
+
+    name = models.CharField(max_length=100)
+    started_at = models.DateTimeField()
+    duration = models.FloatField(default=0)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES)
+
+    class Meta:
+        indexes = [models.Index(fields=["name", "started_at"])]
+
+    def __str__(self):
+        return f"{self.name} {self.outcome} at {self.started_at}"
+
+
+class ChangeRecord(models.Model):
+    """
+    Outbox entry for one change to a Customer, Product or Order row.
+
+    Written in the same transaction as the change itself; the auto-incrementing
+    id doubles as the cursor consumers resume from.
+    """
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+    OPERATION_CHOICES = [
+        (CREATE, "Create"),
+        (UPDATE, "Update"),
+        (DELETE, "Delete"),
+    ]
+
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.operation} {self.model} {self.object_id}"
+
+
+class StockReservation(models.Model):
+    """Stock held for a checkout until it is confirmed, released or expires."""
+    HELD = "held"
+    CONFIRMED = "confirmed"
+    RELEASED = "released"
+    STATUS_CHOICES = [
+        (HELD, "Held"),
+        (CONFIRMED, "Confirmed"),
+        (RELEASED, "Released"),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    order = models.ForeignKey(Order, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "expires_at"])]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} ({self.status})"
+
+
+class StockMovement(models.Model):
+    """
+    Append-only ledger of stock changes.
+
+    For every product the quantities sum to ``Product.stock``; compaction
+    folds old rows into a single ``BALANCE`` row without changing the sum.
+    """
+    BALANCE = "balance"
+    RESTOCK = "restock"
+    SALE = "sale"
+    RESERVE = "reserve"
+    RELEASE = "release"
+    ADJUST = "adjust"
+    REASON_CHOICES = [
+        (BALANCE, "Balance"),
+        (RESTOCK, "Restock"),
+        (SALE, "Sale"),
+        (RESERVE, "Reserve"),
+        (RELEASE, "Release"),
+        (ADJUST, "Adjust"),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="movements")
+    quantity = models.IntegerField()
+    reason = models.CharField(max_length=10, choices=REASON_CHOICES)
+    order = models.ForeignKey(Order, null=True, blank=True, on_delete=models.SET_NULL)
+    reservation = models.ForeignKey(
+        StockReservation, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["product", "created_at"])]
+
+    def __str__(self):
+        return f"{self.reason} {self.quantity:+d} of {self.product_id}"
@@ -0,0 +1,135 @@
+"""
+Transactional outbox for CRM writes.
+
+Every write path appends a compact ``ChangeRecord`` inside the transaction
+that makes the change, so a record exists exactly when the change committed.
+Consumers read forward from a cursor with ``changes_since`` or follow the log
+with ``stream_changes`` instead of re-reading whole tables.
+
+The cursor is the record id, and ids are handed out when a record is
+inserted, not when its transaction commits. A missing id may belong to a
+transaction that is still open, so a read stops before a gap until the
+record after it is ``CRM_OUTBOX_SETTLE_SECONDS`` old; after that the gap is
+taken to be a rollback. A transaction that stays open longer than that can
+still be skipped, so size the window above the longest write transaction.
+
+``prune_changes`` deletes records older than ``CRM_OUTBOX_RETENTION_DAYS``;
+the ``prune_change_records`` cron job runs it daily. A consumer further
+behind than that misses the pruned changes.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ChangeRecord
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 1000
+DEFAULT_SETTLE_SECONDS = 5
+DEFAULT_RETENTION_DAYS = 30
+
+
+def customer_payload(customer):
+    return {"name": customer.name, "email": customer.email, "phone": customer.phone}
+
+
+def product_payload(product):
+    return {"name": product.name, "price": str(product.price), "stock": product.stock}
+
+
+def order_payload(order, product_ids):
+    return {
+        "customer_id": order.customer_id,
+        "product_ids": sorted(product_ids),
+        "total_amount": str(order.total_amount),
+    }
+
+
+def record_change(model, object_id, operation, payload=None):
+    """Append one change record; call inside the transaction making the change."""
+    return ChangeRecord.objects.create(
+        model=model, object_id=object_id, operation=operation, payload=payload or {}
+    )
+
+
+def record_changes(model, operation, payloads):
+    """Append one record per ``(object_id, payload)`` pair with a single bulk insert."""
+    return ChangeRecord.objects.bulk_create(
+        [
+            ChangeRecord(model=model, object_id=object_id, operation=operation, payload=payload or {})
+            for object_id, payload in payloads
+        ],
+        batch_size=DEFAULT_BATCH_SIZE,
+    )
+
+
+def parse_cursor(cursor):
+    """Cursors are opaque strings to clients; an empty cursor starts from the beginning."""
+    if cursor in (None, ""):
+        return 0
+    try:
+        return int(cursor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid change cursor: {cursor!r}")
+
+
+def changes_since(cursor=None, limit=DEFAULT_BATCH_SIZE, models=None):
+    """
+    Return ``(records, next_cursor, has_more)`` for changes after ``cursor``.
+
+    Up to ``limit`` records are read, then filtered by ``models``, so a page
+    can hold fewer (even none) while ``has_more`` is true. ``next_cursor`` is
+    the cursor to pass on the next call; it equals the input cursor when
+    there is nothing new or the next record is held back behind a gap.
+    """
+    position = parse_cursor(cursor)
+    limit = max(1, min(limit, MAX_BATCH_SIZE))
+    settled = timezone.now() - timedelta(seconds=getattr(settings, "CRM_OUTBOX_SETTLE_SECONDS", DEFAULT_SETTLE_SECONDS))
+    rows = list(ChangeRecord.objects.filter(id__gt=position).order_by("id")[:limit + 1])
+    batch = []
+    for record in rows[:limit]:
+        if record.id != position + 1 and record.created_at > settled:
+            # A lower id may still commit; wait for it or for the gap to settle.
+            return batch, str(position), False
+        position = record.id
+        if not models or record.model in models:
+            batch.append(record)
+    return batch, str(position), len(rows) > limit
+
+
+def stream_changes(cursor=None, batch_size=DEFAULT_BATCH_SIZE, models=None,
+                   poll_interval=1.0, stop=None):
+    """
+    Yield change records in id order, starting after ``cursor``.
+
+    When caught up the generator sleeps ``poll_interval`` seconds and polls
+    again; with ``poll_interval=None`` it returns instead. ``stop`` is an
+    optional callable checked between batches.
+    """
+    while stop is None or not stop():
+        batch, cursor, has_more = changes_since(cursor, batch_size, models)
+        yield from batch
+        if has_more:
+            continue
+        if poll_interval is None:
+            return
+        time.sleep(poll_interval)
+
+
+def prune_changes(older_than=None, chunk_size=DEFAULT_BATCH_SIZE):
+    """Delete records older than ``older_than`` (default: the retention period) and return how many."""
+    if older_than is None:
+        older_than = timedelta(days=getattr(settings, "CRM_OUTBOX_RETENTION_DAYS", DEFAULT_RETENTION_DAYS))
+    cutoff = timezone.now() - older_than
+    removed = 0
+    while True:
+        # Old records sit at the start of the id index, so each chunk is a short walk.
+        ids = list(
+            ChangeRecord.objects.filter(created_at__lt=cutoff).order_by("id").values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return removed
+        removed += ChangeRecord.objects.filter(id__in=ids).delete()[0]
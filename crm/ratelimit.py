@@ -0,0 +1,311 @@
+"""
+Rate limiting and per-client concurrency control for ``/graphql``.
+
+Every request is charged its query cost: one unit per selected field, with a
+connection's or list's children multiplied by the number of rows it may
+return (``first``/``last``/``limit``). The charge is taken from a token
+bucket per client, which holds up to ``CRM_RATE_LIMIT_BURST`` units and
+refills at ``CRM_RATE_LIMIT_RATE`` units per second. No more than
+``CRM_RATE_LIMIT_CONCURRENCY`` requests per client run at once. Requests over
+either limit are rejected before they touch the database, with a
+``Retry-After`` hint.
+
+Limiting is off unless ``CRM_RATE_LIMIT_RATE`` is set. State is kept in
+process memory by default; buckets that have refilled are dropped every
+``burst / rate`` seconds. ``CRM_RATE_LIMIT_BACKEND = "cache"`` shares it
+through the ``CRM_RATE_LIMIT_CACHE`` cache instead. That backend
+approximates the bucket with atomic per-window counters, because the cache
+API has no compare-and-set.
+"""
+
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from graphql import GraphQLError, OperationType, get_operation_ast, parse
+from graphql.language.ast import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+    IntValueNode,
+    VariableNode,
+)
+
+from .metrics import REGISTRY
+
+# Rows assumed for a list whose size the query doesn't give: the relay page
+# limit at the top level, a typical nested list below it.
+ROOT_LIST_SIZE = 100
+NESTED_LIST_SIZE = 10
+MUTATION_COST = 10
+# Charged, without finishing the walk, for documents too large or deep to cost.
+MAX_COST = 10 ** 9
+MAX_COST_NODES = 10000
+MAX_COST_DEPTH = 64
+SIZE_ARGUMENTS = ("first", "last", "limit")
+
+DEFAULT_BURST_SECONDS = 10
+DEFAULT_CONCURRENCY = 4
+DEFAULT_CACHE_ALIAS = "default"
+
+REJECTIONS = REGISTRY.counter(
+    "crm_graphql_rate_limited_total", "Requests rejected by the /graphql rate limiter.", ["reason"]
+)
+
+
+# =======================
+# QUERY COST
+# =======================
+def _list_size(field, variables, nested):
+    for argument in field.arguments:
+        if argument.name.value in SIZE_ARGUMENTS:
+            value = argument.value
+            if isinstance(value, VariableNode):
+                value = variables.get(value.name.value)
+            elif isinstance(value, IntValueNode):
+                value = int(value.value)
+            if isinstance(value, int) and not isinstance(value, bool):
+                return max(0, value)
+    is_connection = field.selection_set and any(
+        isinstance(child, FieldNode) and child.name.value == "edges" for child in field.selection_set.selections
+    )
+    if is_connection or any(argument.name.value in SIZE_ARGUMENTS for argument in field.arguments):
+        return NESTED_LIST_SIZE if nested else ROOT_LIST_SIZE
+    return 1
+
+
+class _TooComplex(Exception):
+    pass
+
+
+class _CostWalk:
+    """
+    One pass over an operation's selections. Each fragment's cost is worked
+    out once per nesting flag and reused, so repeated spreads don't re-expand
+    it. The walk gives up past ``MAX_COST_NODES`` fields or ``MAX_COST_DEPTH``
+    levels.
+    """
+
+    def __init__(self, fragments, variables):
+        self.fragments = fragments
+        self.variables = variables
+        self.fragment_costs = {}
+        self.nodes = 0
+
+    def selection_cost(self, selection_set, nested, depth=0, seen=frozenset()):
+        if depth > MAX_COST_DEPTH:
+            raise _TooComplex
+        total = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                self.nodes += 1
+                if self.nodes > MAX_COST_NODES:
+                    raise _TooComplex
+                children = 0
+                if selection.selection_set:
+                    # Only connections and lists nest; edges/node sit inside one.
+                    inside = nested or selection.name.value not in ("edges", "node")
+                    children = self.selection_cost(selection.selection_set, inside, depth + 1, seen)
+                total += 1 + _list_size(selection, self.variables, nested) * children
+            elif isinstance(selection, InlineFragmentNode):
+                total += self.selection_cost(selection.selection_set, nested, depth + 1, seen)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                if name in self.fragments and name not in seen:
+                    key = (name, nested)
+                    if key not in self.fragment_costs:
+                        self.fragment_costs[key] = self.selection_cost(
+                            self.fragments[name].selection_set, nested, depth + 1, seen | {name}
+                        )
+                    total += self.fragment_costs[key]
+            total = min(total, MAX_COST)
+        return total
+
+
+def query_cost(query, variables=None, operation_name=None):
+    """Units charged for one operation; at least 1, even when it doesn't parse."""
+    try:
+        document = parse(query or "")
+    except GraphQLError:
+        return 1
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return 1
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    try:
+        cost = _CostWalk(fragments, variables or {}).selection_cost(operation.selection_set, nested=False)
+    except _TooComplex:
+        return MAX_COST
+    if operation.operation == OperationType.MUTATION:
+        cost += MUTATION_COST * len(operation.selection_set.selections)
+    return max(1, min(cost, MAX_COST))
+
+
+# =======================
+# BACKENDS
+# =======================
+class MemoryBackend:
+    """Token buckets and in-flight counts in this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.in_flight = {}
+        self.next_sweep = 0
+
+    def _sweep(self, now, rate, burst):
+        # A bucket that has refilled to ``burst`` is the same as no bucket.
+        self.buckets = {
+            key: (tokens, updated)
+            for key, (tokens, updated) in self.buckets.items()
+            if tokens + (now - updated) * rate < burst
+        }
+        self.next_sweep = now + burst / rate
+
+    def take(self, key, cost, rate, burst, now=None):
+        """Take ``cost`` tokens; return 0 on success or the seconds until they are available."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if now >= self.next_sweep:
+                self._sweep(now, rate, burst)
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self.buckets[key] = (tokens - cost, now)
+                return 0
+            self.buckets[key] = (tokens, now)
+            return (cost - tokens) / rate
+
+    def acquire(self, key, limit):
+        with self.lock:
+            if self.in_flight.get(key, 0) >= limit:
+                return False
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+            return True
+
+    def release(self, key):
+        with self.lock:
+            remaining = self.in_flight.get(key, 0) - 1
+            if remaining > 0:
+                self.in_flight[key] = remaining
+            else:
+                self.in_flight.pop(key, None)
+
+
+class CacheBackend:
+    """Limits shared by every process through a Django cache."""
+
+    # In-flight counts expire so a crashed worker can't hold a slot forever.
+    IN_FLIGHT_TIMEOUT = 60
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def _add(self, key, amount, timeout):
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key, amount)
+        except ValueError:
+            # Expired between add() and incr().
+            self.cache.add(key, amount, timeout)
+            return amount
+
+    def take(self, key, cost, rate, burst, now=None):
+        # A fixed window of burst / rate seconds admits up to ``burst`` units.
+        now = time.time() if now is None else now
+        window = burst / rate
+        start = math.floor(now / window) * window
+        spent = self._add(f"crm:ratelimit:{key}:{int(start)}", cost, math.ceil(window) + 1)
+        if spent <= burst:
+            return 0
+        return start + window - now
+
+    def acquire(self, key, limit):
+        key = f"crm:inflight:{key}"
+        if self._add(key, 1, self.IN_FLIGHT_TIMEOUT) > limit:
+            self.cache.decr(key)
+            return False
+        return True
+
+    def release(self, key):
+        try:
+            self.cache.decr(f"crm:inflight:{key}")
+        except ValueError:
+            pass
+
+
+# =======================
+# LIMITER
+# =======================
+class RateLimited(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Rate limit exceeded ({reason}); retry in {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Limiter:
+    def __init__(self, backend, rate, burst, concurrency):
+        self.backend = backend
+        self.rate, self.burst, self.concurrency = rate, burst, concurrency
+
+    def admit(self, client, cost):
+        """Charge ``cost`` and take an in-flight slot for ``client``, or raise ``RateLimited``."""
+        if not self.backend.acquire(client, self.concurrency):
+            REJECTIONS.inc(reason="concurrency")
+            raise RateLimited("concurrency", 1)
+        # A request costing more than the burst waits for a full bucket.
+        wait = self.backend.take(client, min(cost, self.burst), self.rate, self.burst)
+        if wait:
+            self.backend.release(client)
+            REJECTIONS.inc(reason="rate")
+            raise RateLimited("rate", wait)
+
+    def release(self, client):
+        self.backend.release(client)
+
+
+_limiter = None
+_limiter_config = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """The limiter for the current settings, or ``None`` when limiting is off."""
+    global _limiter, _limiter_config
+    rate = getattr(settings, "CRM_RATE_LIMIT_RATE", None)
+    if not rate:
+        return None
+    config = (
+        rate,
+        getattr(settings, "CRM_RATE_LIMIT_BURST", None) or rate * DEFAULT_BURST_SECONDS,
+        getattr(settings, "CRM_RATE_LIMIT_CONCURRENCY", DEFAULT_CONCURRENCY),
+        getattr(settings, "CRM_RATE_LIMIT_BACKEND", "memory"),
+        getattr(settings, "CRM_RATE_LIMIT_CACHE", DEFAULT_CACHE_ALIAS),
+    )
+    with _limiter_lock:
+        if config != _limiter_config:
+            rate, burst, concurrency, backend, alias = config
+            if backend == "memory":
+                backend = MemoryBackend()
+            elif backend == "cache":
+                backend = CacheBackend(alias)
+            else:
+                raise ValueError(f"Unknown rate limit backend {backend!r}; choose 'memory' or 'cache'")
+            _limiter, _limiter_config = Limiter(backend, rate, burst, concurrency), config
+        return _limiter
+
+
+def client_key(request):
+    """Authenticated users are limited per user, everyone else per address."""
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"addr:{request.META.get('REMOTE_ADDR', '')}"
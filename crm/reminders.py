@@ -0,0 +1,193 @@
+"""
+Concurrent order-reminder runner.
+
+Recent orders are read page by page from ``allOrders``, either in-process
+(``InProcessSource``) or from a remote ``/graphql`` endpoint over gql's async
+transport (``RemoteSource``). Each page is one batch. Its reminders are
+handed to a sender concurrently, with at most ``concurrency`` sends in
+flight. A batch that runs past ``batch_timeout`` seconds has its unfinished
+sends cancelled and counted as timed out. The next page is fetched while the
+current batch is being sent.
+
+A sender is any object with an ``async send(reminder)`` method that raises on
+failure; ``LogSender`` writes each reminder to the ``order_reminders_log``
+job log.
+"""
+
+import asyncio
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+
+from .jsonlog import get_job_logger
+
+# allOrders serves at most 100 edges per page (RELAY_CONNECTION_MAX_LIMIT).
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_CONCURRENCY = 50
+DEFAULT_BATCH_TIMEOUT = 60
+DEFAULT_LOOKBACK_DAYS = 7
+
+ORDERS_QUERY = """
+query ReminderOrders($since: Date!, $first: Int!, $after: String) {
+    allOrders(orderDate_Gte: $since, first: $first, after: $after) {
+        edges { node { id orderDate totalAmount customer { name email } } }
+        pageInfo { hasNextPage endCursor }
+    }
+}
+"""
+
+
+class ReminderError(Exception):
+    """The order source failed to return a page."""
+
+
+# =======================
+# SOURCES
+# =======================
+class InProcessSource:
+    """Pages of orders from the shared schema, executed in this process."""
+
+    async def fetch(self, variables):
+        from asgiref.sync import sync_to_async
+        from graphql_crm.schema import execute
+
+        # Thread-sensitive, so every page uses the same database connection.
+        result = await sync_to_async(execute)(ORDERS_QUERY, variables)
+        if result.errors:
+            raise ReminderError(str(result.errors[0]))
+        return result.data
+
+    async def close(self):
+        from asgiref.sync import sync_to_async
+        from django.db import connections
+
+        await sync_to_async(connections.close_all)()
+
+
+class RemoteSource:
+    """Pages of orders from a remote ``/graphql`` endpoint over gql's aiohttp transport."""
+
+    def __init__(self, url, timeout=30):
+        from gql import Client
+        from gql.transport.aiohttp import AIOHTTPTransport
+
+        self.client = Client(transport=AIOHTTPTransport(url=url, timeout=timeout))
+        self.query = None
+        self.session = None
+
+    async def fetch(self, variables):
+        from gql import gql
+
+        if self.session is None:
+            self.query = gql(ORDERS_QUERY)
+            self.session = await self.client.connect_async()
+        try:
+            return await self.session.execute(self.query, variable_values=variables)
+        except Exception as e:
+            raise ReminderError(str(e)) from e
+
+    async def close(self):
+        if self.session is not None:
+            await self.client.close_async()
+            self.session = None
+
+
+# =======================
+# SENDERS
+# =======================
+class LogSender:
+    """Records each reminder in the ``order_reminders_log`` job log."""
+
+    def __init__(self):
+        self.log = get_job_logger("order_reminders_log")
+
+    async def send(self, reminder):
+        # The log handler queues records; this never blocks on the file.
+        self.log.info("Order reminder", **reminder)
+
+
+def reminder_from_node(node):
+    customer = node.get("customer") or {}
+    return {
+        "order_id": node["id"],
+        "customer_email": customer.get("email"),
+        "customer_name": customer.get("name"),
+        "order_date": node["orderDate"],
+        "total_amount": node["totalAmount"],
+    }
+
+
+# =======================
+# RUNNER
+# =======================
+class ReminderSummary:
+    def __init__(self):
+        self.batches = self.sent = self.failed = self.timed_out = 0
+        self.seconds = 0.0
+
+    @property
+    def per_second(self):
+        return self.sent / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "batches": self.batches,
+            "sent": self.sent,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "seconds": round(self.seconds, 3),
+            "per_second": round(self.per_second, 1),
+        }
+
+
+async def send_batch(sender, reminders, semaphore, timeout, summary):
+    async def send(reminder):
+        async with semaphore:
+            await sender.send(reminder)
+
+    tasks = [asyncio.ensure_future(send(reminder)) for reminder in reminders]
+    done, pending = await asyncio.wait(tasks, timeout=timeout) if tasks else (set(), set())
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    summary.batches += 1
+    summary.timed_out += len(pending)
+    for task in done:
+        if task.exception() is None:
+            summary.sent += 1
+        else:
+            summary.failed += 1
+
+
+async def run_reminders(source, sender, since=None, page_size=None, concurrency=None, batch_timeout=None):
+    """Send a reminder for every order placed on or after ``since`` and return the ``ReminderSummary``."""
+    if since is None:
+        since = date.today() - timedelta(days=DEFAULT_LOOKBACK_DAYS)
+    page_size = page_size or getattr(settings, "CRM_REMINDER_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+    concurrency = concurrency or getattr(settings, "CRM_REMINDER_CONCURRENCY", DEFAULT_CONCURRENCY)
+    if batch_timeout is None:
+        batch_timeout = getattr(settings, "CRM_REMINDER_BATCH_TIMEOUT", DEFAULT_BATCH_TIMEOUT)
+
+    summary = ReminderSummary()
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+
+    def fetch(after):
+        variables = {"since": since.isoformat(), "first": page_size, "after": after}
+        return asyncio.ensure_future(source.fetch(variables))
+
+    next_page = fetch(None)
+    try:
+        while next_page is not None:
+            page = (await next_page)["allOrders"]
+            info = page["pageInfo"]
+            next_page = fetch(info["endCursor"]) if info["hasNextPage"] else None
+            reminders = [reminder_from_node(edge["node"]) for edge in page["edges"]]
+            await send_batch(sender, reminders, semaphore, batch_timeout, summary)
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+        await source.close()
+        summary.seconds = time.perf_counter() - started
+    return summary
@@ -0,0 +1,245 @@
+"""
+Customer report engine.
+
+Customers are split into id ranges; each range is loaded once and every
+requested section is computed over it, in a ``ProcessPoolExecutor`` when more
+than one worker is configured. Each worker process opens its own database
+connection. Section partials are merged in partition order with ties broken
+by id, so the report is identical for any number of workers or partitions.
+
+Sections:
+
+``lifetime_value``
+    Customers and revenue per lifetime-value band, and the top customers.
+``top_products_per_segment``
+    The most purchased products within each lifetime-value band.
+"""
+
+import heapq
+import math
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Min
+
+from .models import ArchivedOrder, Customer, Order, Product
+
+# Lower bounds of the lifetime-value bands; a customer falls in the highest
+# band whose bound does not exceed their total spend.
+LTV_BANDS = [
+    ("none", None),
+    ("under_100", Decimal("0")),
+    ("100_to_500", Decimal("100")),
+    ("500_to_1000", Decimal("500")),
+    ("1000_plus", Decimal("1000")),
+]
+TOP_CUSTOMERS = 10
+TOP_PRODUCTS = 5
+PARTITIONS_PER_WORKER = 4
+
+
+def ltv_band(orders, spend):
+    if not orders:
+        return "none"
+    band = LTV_BANDS[1][0]
+    for name, lower in LTV_BANDS[1:]:
+        if spend >= lower:
+            band = name
+    return band
+
+
+def customer_id_ranges(parts):
+    """Split the customer id space into ``parts`` half-open ``[start, end)`` ranges."""
+    bounds = Customer.objects.aggregate(low=Min("id"), high=Max("id"))
+    low, high = bounds["low"], bounds["high"]
+    if low is None:
+        return []
+    size = max(1, math.ceil((high - low + 1) / max(1, parts)))
+    return [(start, min(start + size, high + 1)) for start in range(low, high + 1, size)]
+
+
+# =======================
+# PARTITION DATA
+# =======================
+class Partition:
+    """Everything the sections read for customers with ids in [start, end)."""
+
+    def __init__(self, start, end):
+        self.start, self.end = start, end
+        self.customers = {
+            pk: name
+            for pk, name in Customer.objects.filter(id__gte=start, id__lt=end).values_list("id", "name")
+        }
+        self.orders = defaultdict(int)
+        self.spend = defaultdict(Decimal)
+        self.purchases = []
+        # Lifetime value covers archived orders too. Order ids are unique
+        # across both tables.
+        for model, order_field in ((Order, "order"), (ArchivedOrder, "archivedorder")):
+            order_customer = {}
+            for order_id, customer_id, amount in (
+                model.objects.filter(customer_id__gte=start, customer_id__lt=end)
+                .values_list("id", "customer_id", "total_amount")
+                .iterator(chunk_size=5000)
+            ):
+                self.orders[customer_id] += 1
+                self.spend[customer_id] += amount
+                order_customer[order_id] = customer_id
+            # Orders created after the order scan above are left out entirely.
+            self.purchases.extend(
+                (order_customer[order_id], product_id)
+                for order_id, product_id in model.products.through.objects.filter(**{
+                    f"{order_field}__customer_id__gte": start, f"{order_field}__customer_id__lt": end,
+                }).values_list(f"{order_field}_id", "product_id").iterator(chunk_size=5000)
+                if order_id in order_customer
+            )
+        self.bands = {pk: ltv_band(self.orders[pk], self.spend[pk]) for pk in self.customers}
+
+
+# =======================
+# SECTIONS
+# =======================
+def lifetime_value(partition):
+    bands = defaultdict(lambda: {"customers": 0, "revenue": Decimal("0")})
+    for pk, band in partition.bands.items():
+        bands[band]["customers"] += 1
+        bands[band]["revenue"] += partition.spend[pk]
+    top = heapq.nsmallest(
+        TOP_CUSTOMERS,
+        ((-partition.spend[pk], pk) for pk in partition.customers if partition.orders[pk]),
+    )
+    return {
+        "bands": dict(bands),
+        "top_customers": [
+            {
+                "id": pk,
+                "name": partition.customers[pk],
+                "orders": partition.orders[pk],
+                "lifetime_value": -spend,
+            }
+            for spend, pk in top
+        ],
+    }
+
+
+def merge_lifetime_value(partials):
+    bands = {name: {"customers": 0, "revenue": Decimal("0")} for name, _ in LTV_BANDS}
+    for partial in partials:
+        for name, totals in partial["bands"].items():
+            bands[name]["customers"] += totals["customers"]
+            bands[name]["revenue"] += totals["revenue"]
+    top = heapq.nsmallest(
+        TOP_CUSTOMERS,
+        (customer for partial in partials for customer in partial["top_customers"]),
+        key=lambda customer: (-customer["lifetime_value"], customer["id"]),
+    )
+    return {"bands": bands, "top_customers": top}
+
+
+def top_products_per_segment(partition):
+    counts = defaultdict(Counter)
+    for customer_id, product_id in partition.purchases:
+        counts[partition.bands[customer_id]][product_id] += 1
+    # Partials keep full counts: a product outside one partition's top K can
+    # still be in the overall top K.
+    return {band: dict(counter) for band, counter in counts.items()}
+
+
+def merge_top_products_per_segment(partials):
+    counts = defaultdict(Counter)
+    for partial in partials:
+        for band, counter in partial.items():
+            counts[band].update(counter)
+    top = {
+        band: heapq.nsmallest(TOP_PRODUCTS, counter.items(), key=lambda item: (-item[1], item[0]))
+        for band, counter in counts.items()
+    }
+    names = dict(
+        Product.objects.filter(
+            pk__in={pk for items in top.values() for pk, _ in items}
+        ).values_list("pk", "name")
+    )
+    return {
+        name: [
+            {"product_id": pk, "name": names.get(pk), "purchases": count}
+            for pk, count in top.get(name, ())
+        ]
+        for name, _ in LTV_BANDS
+        if name in top
+    }
+
+
+SECTIONS = {
+    "lifetime_value": (lifetime_value, merge_lifetime_value),
+    "top_products_per_segment": (top_products_per_segment, merge_top_products_per_segment),
+}
+
+
+# =======================
+# ENGINE
+# =======================
+def compute_partition(start, end, sections):
+    """Compute every section's partial for one customer id range."""
+    partition = Partition(start, end)
+    return {name: SECTIONS[name][0](partition) for name in sections}
+
+
+def _init_worker(settings_module, database_names):
+    # Under ``spawn`` the worker starts from scratch; under ``fork`` it inherits
+    # the parent's setup but must not share its connections.
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+        django.setup()
+    for alias, name in database_names.items():
+        connections[alias].close()
+        connections[alias].settings_dict["NAME"] = name
+
+
+def _compute_partition_in_worker(args):
+    try:
+        return compute_partition(*args)
+    finally:
+        connections.close_all()
+
+
+def build_report(sections=None, workers=None, partitions=None):
+    """
+    Build the customer report and return ``{section: result}``.
+
+    ``workers`` defaults to ``CRM_REPORT_WORKERS`` or the CPU count; with one
+    worker the partitions are computed in this process.
+    """
+    sections = list(sections or SECTIONS)
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown report sections: {', '.join(sorted(unknown))}")
+    if workers is None:
+        workers = getattr(settings, "CRM_REPORT_WORKERS", None) or os.cpu_count() or 1
+    if partitions is None:
+        partitions = workers * PARTITIONS_PER_WORKER
+    jobs = [(start, end, sections) for start, end in customer_id_ranges(partitions)]
+
+    if workers <= 1 or len(jobs) <= 1:
+        partials = [compute_partition(*job) for job in jobs]
+    else:
+        # Forked workers must not inherit open connections.
+        connections.close_all()
+        database_names = {conn.alias: conn.settings_dict["NAME"] for conn in connections.all()}
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(os.environ.get("DJANGO_SETTINGS_MODULE", ""), database_names),
+        ) as pool:
+            partials = list(pool.map(_compute_partition_in_worker, jobs))
+
+    return {
+        name: SECTIONS[name][1]([partial[name] for partial in partials])
+        for name in sections
+    }
@@ -0,0 +1,60 @@
+"""
+Exact decimal scalar for money fields.
+
+Amounts travel as strings (``"19.99"``) so clients never see float rounding.
+Inputs may be strings, integers or float literals; float literals are read
+from their source text, so ``price: 19.99`` arrives as ``Decimal("19.99")``.
+"""
+
+from decimal import Decimal as _Decimal, InvalidOperation
+
+import graphene
+from django import forms
+from django.db import models
+from graphene_django.converter import convert_django_field, get_django_field_description
+from graphene_django.forms.converter import convert_form_field, get_form_field_description
+from graphql import Undefined
+from graphql.language.ast import FloatValueNode, IntValueNode, StringValueNode
+
+
+class Decimal(graphene.Scalar):
+    """A decimal number serialized as a string, without a float round-trip."""
+
+    @staticmethod
+    def serialize(value):
+        if isinstance(value, float):
+            # ``repr`` is the shortest string that round-trips to the same float.
+            value = _Decimal(repr(value))
+        elif not isinstance(value, _Decimal):
+            value = _Decimal(value)
+        return str(value)
+
+    @classmethod
+    def parse_literal(cls, node, _variables=None):
+        if isinstance(node, (StringValueNode, IntValueNode, FloatValueNode)):
+            return cls.parse_value(node.value)
+        return Undefined
+
+    @staticmethod
+    def parse_value(value):
+        if isinstance(value, bool):
+            return Undefined
+        if isinstance(value, float):
+            value = repr(value)
+        try:
+            result = _Decimal(value)
+        except (InvalidOperation, TypeError, ValueError):
+            return Undefined
+        return result if result.is_finite() else Undefined
+
+
+@convert_django_field.register(models.DecimalField)
+def convert_field_to_decimal(field, registry=None):
+    return Decimal(description=get_django_field_description(field), required=not field.null)
+
+
+# Declared ``NumberFilter`` arguments are converted from their form field; they
+# must use this scalar too, or the schema ends up with two types named Decimal.
+@convert_form_field.register(forms.DecimalField)
+def convert_form_field_to_decimal(field):
+    return Decimal(description=get_form_field_description(field), required=field.required)
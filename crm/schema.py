@@ -1,80 +1,175 @@
+import decimal
+
 import graphene
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
-import django_filters
-from django.db.models import F
-from .models import Customer, Product, Order
-from crm.models import Product
-from django.db.models import Count, Sum
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .models import ArchivedOrder, ChangeRecord, Customer, Product, Order
+from . import activity, copurchase, events, inventory, loaders, outbox
+from .filters import CustomerFilter, OrderFilter, ProductFilter
+from .pagination import KeysetConnectionField, Partitions
+from .scalars import Decimal
 
-
-# =======================
-# FILTER CLASSES
-# =======================
-class CustomerFilter(django_filters.FilterSet):
-    class Meta:
-        model = Customer
-        fields = {
-            "name": ["icontains", "exact"],
-            "email": ["icontains", "exact"],
-        }
-
-
-class ProductFilter(django_filters.FilterSet):
-    class Meta:
-        model = Product
-        fields = {
-            "name": ["icontains", "exact"],
-            "price": ["gte", "lte", "exact"],
-        }
-
-
-class OrderFilter(django_filters.FilterSet):
-    class Meta:
-        model = Order
-        fields = {
-            "total_amount": ["gte", "lte", "exact"],
-            "order_date": ["gte", "lte", "exact"],
-            "customer__name": ["icontains", "exact"],
-        }
+CENTS = decimal.Decimal('0.01')
 
 
 # =======================
 # GRAPHQL TYPES
 # =======================
 class CustomerType(DjangoObjectType):
+    # orderCount and totalSpent are columns kept current by crm/activity.py.
+    last_order_date = graphene.Date()
+
     class Meta:
         model = Customer
         filterset_class = CustomerFilter
         interfaces = (graphene.relay.Node,)
 
+    def resolve_last_order_date(self, info):
+        return timezone.localdate(self.last_order_at) if self.last_order_at else None
+
+    @classmethod
+    def get_node(cls, info, id):
+        return loaders.load(info, Customer, id)
+
 
 class ProductType(DjangoObjectType):
+    frequently_bought_with = graphene.List(
+        graphene.NonNull(lambda: ProductType),
+        required=True,
+        first=graphene.Int(default_value=copurchase.DEFAULT_FIRST),
+    )
+
     class Meta:
         model = Product
         filterset_class = ProductFilter
         interfaces = (graphene.relay.Node,)
 
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        if "frequentlyBoughtWith" in loaders.selected_fields(info):
+            queryset = queryset.prefetch_related(copurchase.prefetch_neighbours())
+        return queryset
+
+    @classmethod
+    def get_node(cls, info, id):
+        return loaders.load(info, Product, id)
+
+    def resolve_frequently_bought_with(self, info, first):
+        # Served from the precomputed index in crm/copurchase.py, prefetched
+        # for every product of a list.
+        return copurchase.neighbours(self.pk, first, getattr(self, copurchase.RANKED_ATTR, None))
+
 
 class OrderType(DjangoObjectType):
+    products = KeysetConnectionField(ProductType, required=True)
+
     class Meta:
         model = Order
         filterset_class = OrderFilter
         interfaces = (graphene.relay.Node,)
 
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        # Join or prefetch what the query asks for, so lists of orders cost a
+        # fixed number of queries whatever their length.
+        fields = loaders.selected_fields(info)
+        if "customer" in fields:
+            queryset = queryset.select_related("customer")
+        if "products" in fields:
+            queryset = queryset.prefetch_related("products")
+            if "frequentlyBoughtWith" in loaders.selected_fields(info, "products"):
+                queryset = queryset.prefetch_related(copurchase.prefetch_neighbours("products__copurchases"))
+        return queryset
+
+    @classmethod
+    def is_type_of(cls, root, info):
+        # Archived orders have the same fields and are served as orders.
+        return isinstance(root, ArchivedOrder) or super().is_type_of(root, info)
+
+    @classmethod
+    def get_node(cls, info, id):
+        return loaders.load(info, Order, id) or loaders.load(info, ArchivedOrder, id)
+
+    def resolve_customer(self, info):
+        if self._meta.get_field("customer").is_cached(self):
+            return self.customer
+        return loaders.load(info, Customer, self.customer_id)
+
+
+class ChangeRecordType(DjangoObjectType):
+    class Meta:
+        model = ChangeRecord
+        fields = ("id", "model", "object_id", "operation", "payload", "created_at")
+
+
+class ChangeSet(graphene.ObjectType):
+    changes = graphene.List(graphene.NonNull(ChangeRecordType), required=True)
+    next_cursor = graphene.String(required=True)
+    has_more = graphene.Boolean(required=True)
+
 
 # =======================
 # QUERY CLASS
 # =======================
 class Query(graphene.ObjectType):
-    all_customers = DjangoFilterConnectionField(CustomerType)
-    all_products = DjangoFilterConnectionField(ProductType)
-    all_orders = DjangoFilterConnectionField(OrderType)
+    all_customers = KeysetConnectionField(CustomerType)
+    all_products = KeysetConnectionField(ProductType)
+    all_orders = KeysetConnectionField(OrderType, include_archived=graphene.Boolean(default_value=False))
 
     customer = graphene.relay.Node.Field(CustomerType)
     product = graphene.relay.Node.Field(ProductType)
     order = graphene.relay.Node.Field(OrderType)
 
+    total_customers = graphene.Int()
+    total_orders = graphene.Int()
+    total_revenue = Decimal()
+    recent_orders = graphene.List(
+        OrderType, limit=graphene.Int(), include_archived=graphene.Boolean(default_value=False)
+    )
+
+    changes_since = graphene.Field(
+        ChangeSet,
+        cursor=graphene.String(),
+        limit=graphene.Int(default_value=outbox.DEFAULT_BATCH_SIZE),
+        models=graphene.List(graphene.NonNull(graphene.String)),
+    )
+
+    def resolve_all_orders(self, info, include_archived=False, **kwargs):
+        if include_archived:
+            return Partitions([Order.objects.all(), ArchivedOrder.objects.all()])
+        return Order.objects.all()
+
+    def resolve_total_customers(self, info):
+        return Customer.objects.count()
+
+    def resolve_total_orders(self, info):
+        # Totals always cover the archive too.
+        return Order.objects.count() + ArchivedOrder.objects.count()
+
+    def resolve_total_revenue(self, info):
+        total = sum(
+            (model.objects.aggregate(total=Sum('total_amount'))['total'] or decimal.Decimal(0)
+             for model in (Order, ArchivedOrder)),
+            decimal.Decimal(0),
+        )
+        # SQLite sums decimals as floats; restore the column's two places.
+        return total.quantize(CENTS)
+
+    def resolve_recent_orders(self, info, limit=5, include_archived=False):
+        # Walks the (order_date, id) index backwards.
+        orders = list(OrderType.get_queryset(Order.objects.order_by('-order_date', '-id'), info)[:limit])
+        if include_archived and len(orders) < limit:
+            # Archived orders are all older than the live ones.
+            archived = OrderType.get_queryset(ArchivedOrder.objects.order_by('-order_date', '-id'), info)
+            orders.extend(archived[:limit - len(orders)])
+        return orders
+
+    def resolve_changes_since(self, info, cursor=None, limit=outbox.DEFAULT_BATCH_SIZE, models=None):
+        changes, next_cursor, has_more = outbox.changes_since(cursor, limit, models)
+        return ChangeSet(changes=changes, next_cursor=next_cursor, has_more=has_more)
+
 
 # =======================
 # MUTATIONS
@@ -88,22 +183,31 @@ class CreateCustomer(graphene.Mutation):
     customer = graphene.Field(CustomerType)
 
     def mutate(self, info, name, email, phone=None):
-        customer = Customer(name=name, email=email, phone=phone)
-        customer.save()
+        with transaction.atomic():
+            customer = Customer(name=name, email=email, phone=phone)
+            customer.save()
+            outbox.record_change(
+                "customer", customer.pk, ChangeRecord.CREATE, outbox.customer_payload(customer)
+            )
         return CreateCustomer(customer=customer)
 
 
 class CreateProduct(graphene.Mutation):
     class Arguments:
         name = graphene.String(required=True)
-        price = graphene.Float(required=True)
+        price = Decimal(required=True)
         stock = graphene.Int(required=True)
 
     product = graphene.Field(ProductType)
 
     def mutate(self, info, name, price, stock):
-        product = Product(name=name, price=price, stock=stock)
-        product.save()
+        with transaction.atomic():
+            product = Product(name=name, price=price, stock=stock)
+            product.save()
+            inventory.open_stock([product])
+            outbox.record_change(
+                "product", product.pk, ChangeRecord.CREATE, outbox.product_payload(product)
+            )
         return CreateProduct(product=product)
 
 
@@ -115,25 +219,24 @@ class CreateOrder(graphene.Mutation):
     order = graphene.Field(OrderType)
 
     def mutate(self, info, customer_id, product_ids):
-        customer = Customer.objects.get(pk=customer_id)
-        order = Order(customer=customer)
-        order.save()
-        order.products.set(Product.objects.filter(pk__in=product_ids))
-        order.total_amount = sum([p.price for p in order.products.all()])
-        order.save()
+        with transaction.atomic():
+            customer = Customer.objects.get(pk=customer_id)
+            products = list(Product.objects.filter(pk__in=product_ids))
+            order = Order(customer=customer)
+            order.total_amount = sum([p.price for p in products])
+            order.save()
+            # A new order has no links to diff against; add() inserts them directly.
+            order.products.add(*products)
+            # Raises InsufficientStock, rolling back the order, if any product ran out.
+            inventory.sell(order, {p.pk: 1 for p in products})
+            activity.record_orders([order])
+            outbox.record_change(
+                "order", order.pk, ChangeRecord.CREATE,
+                outbox.order_payload(order, [p.pk for p in products]),
+            )
         return CreateOrder(order=order)
 
 
-class Mutation(graphene.ObjectType):
-    create_customer = CreateCustomer.Field()
-    create_product = CreateProduct.Field()
-    create_order = CreateOrder.Field()
-
-class ProductType(DjangoObjectType):
-    class Meta:
-        model = Product
-        fields = "__all__"
-
 class UpdateLowStockProducts(graphene.Mutation):
     class Arguments:
         pass  # No arguments needed for this mutation
@@ -144,30 +247,31 @@ class UpdateLowStockProducts(graphene.Mutation):
 
     def mutate(self, info):
         try:
-            # Find products with stock less than 10
-            low_stock_products = Product.objects.filter(stock__lt=10)
-            
-            if not low_stock_products.exists():
+            # Find products with stock less than 10; keep their ids, since
+            # after the update they no longer match the filter
+            low_stock_ids = list(
+                Product.objects.filter(stock__lt=10).values_list('id', flat=True)
+            )
+
+            if not low_stock_ids:
                 return UpdateLowStockProducts(
                     success=True,
                     message="No low-stock products found",
                     updated_products=[]
                 )
-            
-            # Update stock by adding 10 to each low-stock product
-            updated_count = low_stock_products.update(stock=F('stock') + 10)
-            
-            # Get the updated products
-            updated_products = Product.objects.filter(
-                id__in=low_stock_products.values_list('id', flat=True)
-            )
-            
+
+            # Add 10 to each low-stock product; returns the updated products.
+            # restock() is atomic on its own, and outside a transaction it can
+            # be coalesced with concurrent stock changes (see crm/inventory.py).
+            updated_products = inventory.restock({pk: 10 for pk in low_stock_ids})
+            updated_count = len(updated_products)
+
             return UpdateLowStockProducts(
                 success=True,
                 message=f"Successfully updated {updated_count} low-stock products",
                 updated_products=updated_products
             )
-            
+
         except Exception as e:
             return UpdateLowStockProducts(
                 success=False,
@@ -176,34 +280,57 @@ class UpdateLowStockProducts(graphene.Mutation):
             )
 
 class Mutation(graphene.ObjectType):
+    create_customer = CreateCustomer.Field()
+    create_product = CreateProduct.Field()
+    create_order = CreateOrder.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
-    
 
 
-schema = graphene.Schema(
-    query=Query,  
-    mutation=Mutation
-)
 
-class Query(graphene.ObjectType):
-    
-    
-    total_customers = graphene.Int()
-    total_orders = graphene.Int()
-    total_revenue = graphene.Float()
-    
-    def resolve_total_customers(self, info):
-        return Customer.objects.count()
-    
-    def resolve_total_orders(self, info):
-        return Order.objects.count()
-    
-    def resolve_total_revenue(self, info):
-        result = Order.objects.aggregate(total=Sum('total_amount'))
-        return result['total'] or 0
-    
-    
-    recent_orders = graphene.List(OrderType, limit=graphene.Int())
-    
-    def resolve_recent_orders(self, info, limit=5):
-        return Order.objects.order_by('-order_date')[:limit]
\ No newline at end of file
+# =======================
+# SUBSCRIPTIONS
+# =======================
+def _load_order(order_id):
+    # Nested fields resolve on the event loop, so fetch everything they read here.
+    return (
+        Order.objects.select_related("customer")
+        .prefetch_related("products")
+        .filter(pk=order_id)
+        .first()
+    )
+
+
+class Subscription(graphene.ObjectType):
+    order_created = graphene.Field(OrderType)
+    product_stock_changed = graphene.Field(ProductType, threshold=graphene.Int())
+
+    async def subscribe_order_created(root, info):
+        from asgiref.sync import sync_to_async
+
+        with events.BUS.subscribe(events.ORDER_CREATED) as subscription:
+            async for order_id in subscription:
+                order = await sync_to_async(_load_order)(order_id)
+                if order is not None:
+                    yield order
+
+    async def subscribe_product_stock_changed(root, info, threshold=None):
+        with events.BUS.subscribe(events.STOCK_CHANGED) as subscription:
+            async for product in subscription:
+                if threshold is None or product.stock < threshold:
+                    yield product
+
+    def resolve_order_created(root, info):
+        return root
+
+    def resolve_product_stock_changed(root, info, threshold=None):
+        return root
+
+
+def __getattr__(name):
+    # ``schema`` is resolved lazily so importing this module never builds a
+    # type map; share the single project schema instead of building another.
+    if name == "schema":
+        from graphql_crm.schema import get_schema
+
+        return get_schema()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
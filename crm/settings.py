@@ -74,6 +74,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'alx_backend_graphql_crm.wsgi.application'
+ASGI_APPLICATION = 'alx_backend_graphql_crm.asgi.application'
 
 
 # Database
@@ -135,6 +136,11 @@ GRAPHENE = {
 CRONJOBS = [
     ('*/5 * * * *', 'crm.cron.log_crm_heartbeat'),
     ('0 */12 * * *', 'crm.cron.update_low_stock'),
+    ('*/10 * * * *', 'crm.cron.maintain_inventory'),
+    ('30 3 * * *', 'crm.cron.sync_customer_activity'),
+    ('0 4 * * *', 'crm.cron.archive_orders'),
+    ('20 * * * *', 'crm.cron.build_copurchase_index'),
+    ('45 4 * * *', 'crm.cron.prune_change_records'),
 ]
 
 LOGGING = {
@@ -168,4 +174,87 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'crm.tasks.generate_crm_report',
         'schedule': crontab(day_of_week='mon', hour=6, minute=0),
     },
-}
\ No newline at end of file
+}
+
+# Orders aggregated per generate_crm_report shard task.
+CRM_REPORT_SHARD_SIZE = 50000
+
+# Processes building the customer report sections (None uses every CPU).
+CRM_REPORT_WORKERS = None
+
+# Structured JSON-lines job logs (see crm/jsonlog.py).
+CRM_LOG_DIR = '/tmp'
+CRM_LOG_MAX_BYTES = 10 * 1024 * 1024
+CRM_LOG_BACKUP_COUNT = 5
+CRM_LOG_QUEUE_SIZE = 10000
+
+# In-process metrics served at /metrics (see crm/metrics.py).
+CRM_METRICS_ENABLED = True
+
+# Batched /graphql requests (see crm/views.py): operations per batch, and
+# threads for running all-query batches in parallel (0 runs them in order).
+CRM_GRAPHQL_MAX_BATCH_SIZE = 20
+CRM_GRAPHQL_BATCH_WORKERS = 0
+
+# Events buffered per GraphQL subscription before the oldest are dropped
+# (see crm/events.py).
+CRM_SUBSCRIPTION_QUEUE_SIZE = 100
+
+# Stock reservations and ledger compaction (see crm/inventory.py).
+CRM_RESERVATION_TTL_SECONDS = 15 * 60
+CRM_LEDGER_COMPACT_AFTER_DAYS = 7
+
+# Milliseconds sells and restocks made outside a transaction wait to be
+# applied together in one UPDATE, and the most changes per group (see
+# crm/inventory.py); 0 applies every change on its own.
+CRM_STOCK_COALESCE_MS = 0
+CRM_STOCK_COALESCE_MAX_BATCH = 500
+
+# Cross-request Product cache for node lookups (see crm/loaders.py); 0
+# disables it. Enable it only with a cache shared by every process.
+CRM_PRODUCT_CACHE = 'default'
+CRM_PRODUCT_CACHE_TIMEOUT = 0
+
+# Change feed (see crm/outbox.py): seconds a gap in record ids may belong to
+# a transaction still committing, and days records are kept.
+CRM_OUTBOX_SETTLE_SECONDS = 5
+CRM_OUTBOX_RETENTION_DAYS = 30
+
+# Orders older than this move to the archive tables (see crm/archive.py).
+CRM_ORDER_ARCHIVE_AFTER_DAYS = 365
+
+# Order reminders (see crm/reminders.py): orders per batch, reminders sent
+# at once, and seconds allowed per batch.
+CRM_REMINDER_PAGE_SIZE = 100
+CRM_REMINDER_CONCURRENCY = 50
+CRM_REMINDER_BATCH_TIMEOUT = 60
+
+# Neighbours kept per product in the frequently-bought-together index
+# (see crm/copurchase.py); frequentlyBoughtWith(first:) is capped at this.
+CRM_COPURCHASE_TOP_K = 10
+# Orders placed less than this many seconds ago wait for the next build, as
+# a lower id may still be committing.
+CRM_COPURCHASE_SETTLE_SECONDS = 60
+
+# /healthz and /readyz (see crm/health.py): seconds a check result is
+# reused, and seconds since its last run after which a job is reported stale.
+CRM_HEALTH_CACHE_SECONDS = 10
+CRM_HEALTH_MAX_JOB_LAG = {
+    'log_crm_heartbeat': 15 * 60,
+    'maintain_inventory': 30 * 60,
+    'build_copurchase_index': 2 * 60 * 60,
+    'update_low_stock': 13 * 60 * 60,
+    'sync_customer_activity': 25 * 60 * 60,
+    'archive_orders': 25 * 60 * 60,
+    'prune_change_records': 25 * 60 * 60,
+}
+
+# /graphql rate limiting (see crm/ratelimit.py): query-cost units refilled
+# per second, bucket size, and requests per client in flight at once. The
+# 'memory' backend is per process; 'cache' shares limits through
+# CRM_RATE_LIMIT_CACHE. CRM_RATE_LIMIT_RATE = None turns limiting off.
+CRM_RATE_LIMIT_RATE = 2000
+CRM_RATE_LIMIT_BURST = 20000
+CRM_RATE_LIMIT_CONCURRENCY = 4
+CRM_RATE_LIMIT_BACKEND = 'memory'
+CRM_RATE_LIMIT_CACHE = 'default'
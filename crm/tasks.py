@@ -1,164 +1,148 @@
-from celery import shared_task
-from datetime import datetime
-import requests
-import json
+import heapq
+import time
+from decimal import Decimal
+
+from celery import chord, shared_task
 from django.conf import settings
+from django.db.models import Count, Max, Min, Sum
 
-@shared_task
-def generate_crm_report():
+from crm.celery import app as celery_app  # noqa: F401  (binds shared tasks to the CRM app)
+from crm.jobs import claim_job, release_lease
+from crm.jsonlog import get_job_logger
+from crm.models import ArchivedOrder, Customer, JobRun, Order
+
+REPORT_LOG_NAME = "crm_report_log"
+
+# Orders aggregated by a single shard task and the number of recent orders listed.
+DEFAULT_REPORT_SHARD_SIZE = 50000
+REPORT_TOP_N = 5
+
+# The lease outlives a slow chord; a finished report is reused for an hour.
+REPORT_JOB_NAME = "generate_crm_report"
+REPORT_LEASE_SECONDS = 3600
+REPORT_FRESH_FOR = 3600
+
+
+def order_id_ranges(low, high, size):
+    """Split the inclusive id interval [low, high] into half-open [start, end) ranges."""
+    if low is None or high is None:
+        return []
+    return [(start, min(start + size, high + 1)) for start in range(low, high + 1, size)]
+
+
+@shared_task(bind=True)
+def generate_crm_report(self):
     """
     Generate a weekly CRM report with total customers, orders, and revenue.
+
+    The live and archived order tables are split into id ranges that are
+    aggregated in parallel by ``aggregate_order_shard`` and merged by ``merge_crm_report``, which also
+    releases the job lease taken here; if a shard fails, ``release_failed_report`` releases it instead.
     """
+    lease_token, result = claim_job(REPORT_JOB_NAME, REPORT_LEASE_SECONDS, REPORT_FRESH_FOR)
+    if lease_token is None:
+        return result
+    started = time.time()
+
     try:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_file_path = "/tmp/crm_report_log.txt"
-        
-        # GraphQL query to fetch CRM statistics
-        query = """
-        query {
-            totalCustomers
-            totalOrders
-            totalRevenue
-            recentOrders(limit: 5) {
-                id
-                totalAmount
-                orderDate
-                customer {
-                    name
-                    email
-                }
-            }
-        }
-        """
-        
-        # Alternative query if the above fields don't exist
-        alternative_query = """
-        query {
-            customers {
-                totalCount
-            }
-            orders {
-                totalCount
-                edges {
-                    node {
-                        totalAmount
-                    }
-                }
-            }
+        shard_size = getattr(settings, "CRM_REPORT_SHARD_SIZE", DEFAULT_REPORT_SHARD_SIZE)
+        ranges = []
+        for archived, model in ((False, Order), (True, ArchivedOrder)):
+            bounds = model.objects.aggregate(low=Min("id"), high=Max("id"))
+            ranges.extend(
+                (start, end, archived)
+                for start, end in order_id_ranges(bounds["low"], bounds["high"], shard_size)
+            )
+    except Exception as e:
+        release_lease(REPORT_JOB_NAME, lease_token, JobRun.ERROR, duration=time.time() - started)
+        return _log_report_error(e)
+
+    if not ranges:
+        return merge_crm_report([], lease_token=lease_token, started=started)
+
+    header = [aggregate_order_shard.s(start, end, REPORT_TOP_N, archived) for start, end, archived in ranges]
+    # A failed shard skips the callback, so the errback releases the lease instead.
+    body = merge_crm_report.s(lease_token=lease_token, started=started).on_error(
+        release_failed_report.s(lease_token=lease_token, started=started)
+    )
+    return self.replace(chord(header, body))
+
+
+@shared_task
+def aggregate_order_shard(start, end, top_n=REPORT_TOP_N, archived=False):
+    """Aggregate the orders (or archived orders) whose id falls in [start, end)."""
+    orders = (ArchivedOrder if archived else Order).objects.filter(id__gte=start, id__lt=end)
+    totals = orders.aggregate(count=Count("id"), revenue=Sum("total_amount"))
+
+    recent_orders = [
+        {
+            "id": order["id"],
+            "total_amount": str(order["total_amount"]),
+            "order_date": order["order_date"].isoformat(),
+            "customer_name": order["customer__name"],
         }
-        """
-        
-        url = "http://localhost:8000/graphql"
-        
-        # Try the main query first
-        try:
-            payload = {"query": query}
-            response = requests.post(url, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            if 'errors' in result:
-                raise Exception(f"GraphQL errors: {result['errors']}")
-            
-            data = result.get('data', {})
-            
-            total_customers = data.get('totalCustomers', 0)
-            total_orders = data.get('totalOrders', 0)
-            total_revenue = data.get('totalRevenue', 0)
-            
-            # If main query fields don't exist, try alternative approach
-            if total_customers == 0 and total_orders == 0 and total_revenue == 0:
-                payload = {"query": alternative_query}
-                response = requests.post(url, json=payload, timeout=30)
-                response.raise_for_status()
-                
-                result = response.json()
-                data = result.get('data', {})
-                
-                total_customers = data.get('customers', {}).get('totalCount', 0)
-                total_orders = data.get('orders', {}).get('totalCount', 0)
-                
-                # Calculate total revenue from orders
-                orders = data.get('orders', {}).get('edges', [])
-                total_revenue = sum(
-                    float(order.get('node', {}).get('totalAmount', 0)) 
-                    for order in orders
-                )
-            
-        except Exception as e:
-            # Fallback: Use Django ORM directly if GraphQL fails
-            from django.db.models import Sum
-            from crm.models import Customer, Order
-            
-            total_customers = Customer.objects.count()
-            total_orders = Order.objects.count()
-            total_revenue = Order.objects.aggregate(
-                total=Sum('total_amount')
-            )['total'] or 0
-            
-            # Log that we used fallback method
-            fallback_note = " (using ORM fallback)"
-        else:
-            fallback_note = ""
-        
-        # Format the report
-        report_message = (
-            f"{timestamp} - Report: {total_customers} customers, "
-            f"{total_orders} orders, ${total_revenue:.2f} revenue{fallback_note}\n"
+        for order in orders.order_by("-order_date", "-id").values(
+            "id", "total_amount", "order_date", "customer__name"
+        )[:top_n]
+    ]
+
+    return {
+        "orders": totals["count"],
+        "revenue": str(totals["revenue"] or Decimal("0")),
+        "recent_orders": recent_orders,
+    }
+
+
+@shared_task
+def merge_crm_report(partials, top_n=REPORT_TOP_N, lease_token=None, started=None):
+    """Merge the shard aggregates into the weekly report and write it to the log."""
+    try:
+        total_customers = Customer.objects.count()
+        total_orders = sum(partial["orders"] for partial in partials)
+        total_revenue = sum((Decimal(partial["revenue"]) for partial in partials), Decimal("0"))
+
+        # Each shard already holds its own top-N, so the global top-N is among them.
+        recent_orders = heapq.nlargest(
+            top_n,
+            (order for partial in partials for order in partial["recent_orders"]),
+            key=lambda order: (order["order_date"], order["id"]),
+        )
+
+        get_job_logger(REPORT_LOG_NAME).info(
+            "CRM report",
+            total_customers=total_customers,
+            total_orders=total_orders,
+            total_revenue=f"{total_revenue:.2f}",
+            shards=len(partials),
+            recent_orders=recent_orders,
         )
-        
-        # Add detailed information if available
-        try:
-            # Try to get recent orders for more details
-            detail_query = """
-            query {
-                orders(limit: 3, orderBy: {orderDate: DESC}) {
-                    id
-                    totalAmount
-                    orderDate
-                    customer {
-                        name
-                    }
-                }
-            }
-            """
-            
-            payload = {"query": detail_query}
-            response = requests.post(url, json=payload, timeout=10)
-            
-            if response.status_code == 200:
-                result = response.json()
-                orders = result.get('data', {}).get('orders', [])
-                
-                if orders:
-                    report_message += "  Recent Orders:\n"
-                    for order in orders:
-                        report_message += (
-                            f"    - {order['customer']['name']}: "
-                            f"${order['totalAmount']} on {order['orderDate'][:10]}\n"
-                        )
-        except:
-            pass  # Silently fail if detailed query doesn't work
-        
-        report_message += "-" * 60 + "\n"
-        
-        # Write to log file
-        with open(log_file_path, 'a') as log_file:
-            log_file.write(report_message)
-        
-        return f"CRM report generated: {total_customers} customers, {total_orders} orders, ${total_revenue:.2f} revenue"
-        
+
+        result = f"CRM report generated: {total_customers} customers, {total_orders} orders, ${total_revenue:.2f} revenue"
+        outcome = JobRun.SUCCESS
+
     except Exception as e:
-        error_message = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Error generating CRM report: {str(e)}\n"
-        error_log_path = "/tmp/crm_report_errors.log"
-        
-        with open(error_log_path, 'a') as error_file:
-            error_file.write(error_message)
-        
-        return f"Error generating CRM report: {str(e)}"
+        result = _log_report_error(e)
+        outcome = JobRun.ERROR
+
+    if lease_token:
+        release_lease(REPORT_JOB_NAME, lease_token, outcome, result, time.time() - (started or time.time()))
+    return result
+
+
+@shared_task
+def release_failed_report(request, exc, traceback, lease_token=None, started=None):
+    """Errback of the report chord: record the failure and release the lease."""
+    result = _log_report_error(exc)
+    release_lease(REPORT_JOB_NAME, lease_token, JobRun.ERROR, duration=time.time() - (started or time.time()))
+    return result
+
+
+def _log_report_error(error):
+    get_job_logger(REPORT_LOG_NAME).error("Error generating CRM report", error=str(error))
+    return f"Error generating CRM report: {str(error)}"
+
 
 @shared_task
 def test_task():
     """Test task to verify Celery is working"""
-    return "Celery is working correctly!"
\ No newline at end of file
+    return "Celery is working correctly!"
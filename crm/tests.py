@@ -1,3 +1,1805 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from . import events, inventory, jsonlog, metrics, outbox
+from .models import ChangeRecord, Customer, JobLease, JobRun, Product, Order, StockMovement
+
+
+def use_log_dir(test, path):
+    """Point the JSON log sinks at ``path`` for the duration of ``test``."""
+    jsonlog.shutdown()
+    override = override_settings(CRM_LOG_DIR=path)
+    override.enable()
+    test.addCleanup(override.disable)
+    test.addCleanup(jsonlog.shutdown)
+
+
+def read_json_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+class ImportCrmDataTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def read_rejects(self, path):
+        with open(path + '.rejects.ndjson', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_customers_csv_rejects_duplicates_and_invalid_rows(self):
+        Customer.objects.create(name='Existing', email='taken@example.com')
+        path = self.write('customers.csv', (
+            'name,email,phone\n'
+            'Alice,alice@example.com,+100\n'
+            'Bob,bob@example.com,\n'
+            'Alice Again,alice@example.com,\n'
+            'Taken,taken@example.com,\n'
+            'Broken,not-an-email,\n'
+            ',nameless@example.com,\n'
+        ))
+
+        out = StringIO()
+        call_command('import_crm_data', 'customers', path, chunk_size=2, stdout=out)
+
+        self.assertIn('Imported 2 customers, rejected 4', out.getvalue())
+        self.assertEqual(
+            set(Customer.objects.values_list('email', flat=True)),
+            {'taken@example.com', 'alice@example.com', 'bob@example.com'},
+        )
+        rejects = self.read_rejects(path)
+        self.assertEqual([r['line'] for r in sorted(rejects, key=lambda r: r['line'])], [4, 5, 6, 7])
+
+    def test_orders_ndjson_resolves_foreign_keys_and_totals(self):
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        laptop = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+        mouse = Product.objects.create(name='Mouse', price=Decimal('19.99'), stock=5)
+        path = self.write('orders.ndjson', '\n'.join([
+            json.dumps({'customer_email': 'alice@example.com', 'product_ids': [laptop.pk, mouse.pk]}),
+            json.dumps({'customer_id': customer.pk, 'product_ids': [mouse.pk], 'total_amount': '15.00'}),
+            json.dumps({'customer_email': 'nobody@example.com', 'product_ids': [mouse.pk]}),
+            json.dumps({'customer_id': customer.pk, 'product_ids': [999999]}),
+            '{not json',
+        ]))
+
+        call_command('import_crm_data', 'orders', path, stdout=StringIO())
+
+        totals = sorted(Order.objects.values_list('total_amount', flat=True))
+        self.assertEqual(totals, [Decimal('15.00'), Decimal('1019.98')])
+        self.assertEqual(Order.products.through.objects.count(), 3)
+        self.assertEqual(len(self.read_rejects(path)), 3)
+
+    def test_customers_ndjson_rejects_non_string_and_oversized_fields(self):
+        path = self.write('customers.ndjson', '\n'.join([
+            json.dumps({'name': 'Alice', 'email': 'alice@example.com', 'phone': '+100'}),
+            json.dumps({'name': 'Number', 'email': 5}),
+            json.dumps({'name': ['Listed'], 'email': 'listed@example.com'}),
+            json.dumps({'name': 'Phone', 'email': 'phone@example.com', 'phone': 1234}),
+            json.dumps({'name': 'x' * 256, 'email': 'long@example.com'}),
+            json.dumps({'name': 'Dialer', 'email': 'dialer@example.com', 'phone': '1' * 21}),
+        ]))
+
+        out = StringIO()
+        call_command('import_crm_data', 'customers', path, stdout=out)
+
+        self.assertIn('Imported 1 customers, rejected 5', out.getvalue())
+        self.assertEqual(list(Customer.objects.values_list('email', flat=True)), ['alice@example.com'])
+        errors = [r['error'] for r in self.read_rejects(path)]
+        self.assertEqual(errors[:3], [
+            'Invalid email: expected a string',
+            'Invalid name: expected a string',
+            'Invalid phone: expected a string',
+        ])
+        self.assertEqual(errors[3:], [
+            'Invalid name: longer than 255 characters',
+            'Invalid phone: longer than 20 characters',
+        ])
+
+    def test_orders_with_repeated_products_are_linked_once(self):
+        from crm.management.commands.import_crm_data import Command
+
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        mouse = Product.objects.create(name='Mouse', price=Decimal('19.99'), stock=5)
+        path = self.write('orders.ndjson', '\n'.join([
+            json.dumps({'customer_id': customer.pk, 'product_ids': [mouse.pk, mouse.pk]}),
+            json.dumps({'customer_id': customer.pk, 'product_ids': f'{mouse.pk};{mouse.pk}'}),
+        ]))
+
+        call_command('import_crm_data', 'orders', path, stdout=StringIO())
+
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(Order.products.through.objects.count(), 2)
+        self.assertEqual(set(Order.objects.values_list('total_amount', flat=True)), {Decimal('19.99')})
+
+        # A row that still fails at write time rejects only itself.
+        good, bad = Order(customer=customer, total_amount=1), Order(customer=customer, total_amount=2)
+        good._import_product_ids, bad._import_product_ids = [mouse.pk], [mouse.pk, mouse.pk]
+        written, rejects = Command().write_orders([(1, {}, good), (2, {}, bad)])
+        self.assertEqual(written, 1)
+        self.assertEqual([line for line, _, _ in rejects], [2])
+        self.assertEqual(Order.objects.count(), 3)
+        customer.refresh_from_db()
+        self.assertEqual(customer.order_count, 3)
+
+
+class CrmReportTaskTests(TestCase):
+    def setUp(self):
+        from celery.backends.cache import CacheBackend
+        from crm.celery import app
+
+        # Run the chord eagerly against in-memory stores instead of Redis.
+        previous = {key: app.conf[key] for key in ('task_always_eager', 'task_eager_propagates')}
+        app.conf.update(task_always_eager=True, task_eager_propagates=True)
+        self.addCleanup(app.conf.update, **previous)
+        patcher = mock.patch.object(app, '_backend_cache', CacheBackend(app=app, backend='memory://'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        use_log_dir(self, self.tmpdir.name)
+
+    def test_order_id_ranges_cover_interval(self):
+        from crm.tasks import order_id_ranges
+
+        self.assertEqual(order_id_ranges(3, 9, 3), [(3, 6), (6, 9), (9, 10)])
+        self.assertEqual(order_id_ranges(None, None, 3), [])
+
+    @override_settings(CRM_REPORT_SHARD_SIZE=2)
+    def test_report_merges_shards(self):
+        from crm.tasks import generate_crm_report
+
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        Customer.objects.create(name='Bob', email='bob@example.com')
+        for amount in ('10.00', '20.50', '5.25', '100.00', '1.00'):
+            Order.objects.create(customer=customer, total_amount=Decimal(amount))
+
+        result = generate_crm_report.apply().get()
+
+        self.assertEqual(result, 'CRM report generated: 2 customers, 5 orders, $136.75 revenue')
+        jsonlog.shutdown()
+        (report,) = read_json_lines(os.path.join(self.tmpdir.name, 'crm_report_log.jsonl'))
+        self.assertEqual(report['shards'], 3)
+        self.assertEqual(
+            [order['total_amount'] for order in report['recent_orders']],
+            ['1.00', '100.00', '5.25', '20.50', '10.00'],
+        )
+
+    def test_report_without_orders(self):
+        from crm.tasks import generate_crm_report
+
+        result = generate_crm_report.apply().get()
+
+        self.assertEqual(result, 'CRM report generated: 0 customers, 0 orders, $0.00 revenue')
+
+    def test_failed_shard_releases_the_lease(self):
+        from crm.celery import app
+        from crm.tasks import REPORT_JOB_NAME, generate_crm_report
+
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        Order.objects.create(customer=customer, total_amount=Decimal('10.00'))
+
+        # Eager chords raise instead of calling errbacks; fail the callback
+        # the way a result backend does when a shard fails.
+        with mock.patch.object(generate_crm_report, 'replace', side_effect=lambda signature: signature):
+            report_chord = generate_crm_report.apply().get()
+        report_chord.freeze()
+        try:
+            raise RuntimeError('shard lost')
+        except RuntimeError as e:
+            app.backend.chord_error_from_stack(report_chord.body, e)
+
+        lease = JobLease.objects.get(name=REPORT_JOB_NAME)
+        self.assertEqual((lease.owner, lease.expires_at, lease.last_outcome), ('', None, JobRun.ERROR))
+        self.assertEqual(JobRun.objects.get(name=REPORT_JOB_NAME).outcome, JobRun.ERROR)
+        self.assertIn('CRM report generated', generate_crm_report.apply().get())
+
+
+class CoordinatedJobTests(TestCase):
+    def test_skips_while_lease_is_held(self):
+        from crm.jobs import acquire_lease, coordinated_job
+
+        calls = []
+
+        @coordinated_job('sample_job', lease_seconds=60)
+        def sample_job():
+            calls.append(1)
+            return 'ran'
+
+        token = acquire_lease('sample_job', 60)
+        self.assertIsNotNone(token)
+        self.assertIn('skipped', sample_job())
+        self.assertEqual(calls, [])
+        self.assertEqual(JobRun.objects.get(name='sample_job').outcome, JobRun.SKIPPED)
+
+    def test_reuses_fresh_result_and_records_durations(self):
+        from crm.jobs import coordinated_job
+
+        calls = []
+
+        @coordinated_job('sample_job', lease_seconds=60, fresh_for=300)
+        def sample_job():
+            calls.append(1)
+            return {'updated': len(calls)}
+
+        self.assertEqual(sample_job(), {'updated': 1})
+        self.assertEqual(sample_job(), {'updated': 1})
+        self.assertEqual(calls, [1])
+
+        lease = JobLease.objects.get(name='sample_job')
+        self.assertEqual(lease.owner, '')
+        self.assertEqual(lease.last_outcome, JobRun.SUCCESS)
+        self.assertEqual(
+            sorted(JobRun.objects.filter(name='sample_job').values_list('outcome', flat=True)),
+            [JobRun.CACHED, JobRun.SUCCESS],
+        )
+
+    def test_failed_run_releases_lease_without_caching(self):
+        from crm.jobs import coordinated_job
+
+        @coordinated_job('failing_job', lease_seconds=60, fresh_for=300)
+        def failing_job():
+            raise RuntimeError('boom')
+
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                failing_job()
+
+        self.assertEqual(JobLease.objects.get(name='failing_job').owner, '')
+        self.assertEqual(JobRun.objects.filter(name='failing_job', outcome=JobRun.ERROR).count(), 2)
+
+    def test_handled_failures_are_recorded_as_errors(self):
+        from types import SimpleNamespace
+
+        from crm.cron import update_low_stock
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        use_log_dir(self, tmpdir.name)
+        failed = SimpleNamespace(errors=['database is locked'], data=None)
+        for _ in range(2):
+            with mock.patch('graphql_crm.schema.execute', return_value=failed):
+                self.assertEqual(update_low_stock(), "GraphQL errors: ['database is locked']")
+
+        lease = JobLease.objects.get(name='update_low_stock')
+        self.assertEqual((lease.owner, lease.last_outcome), ('', JobRun.ERROR))
+        self.assertEqual(JobRun.objects.filter(name='update_low_stock', outcome=JobRun.ERROR).count(), 2)
+
+
+class JsonLogTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        use_log_dir(self, self.tmpdir.name)
+
+    def test_writes_structured_json_lines(self):
+        log = jsonlog.get_job_logger('sample')
+        for i in range(1000):
+            log.info('Order reminder', order_id=i, amount=Decimal('1.50'))
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            log.exception('Unexpected error')
+        jsonlog.shutdown()
+
+        entries = read_json_lines(os.path.join(self.tmpdir.name, 'sample.jsonl'))
+        self.assertEqual(len(entries), 1001)
+        self.assertEqual(entries[0]['event'], 'Order reminder')
+        self.assertEqual(entries[999]['order_id'], 999)
+        self.assertEqual(entries[0]['amount'], '1.50')
+        self.assertIn('ValueError: boom', entries[-1]['exception'])
+
+    @override_settings(CRM_LOG_MAX_BYTES=4096, CRM_LOG_BACKUP_COUNT=2, CRM_LOG_BATCH_SIZE=10)
+    def test_rotates_by_size(self):
+        log = jsonlog.get_job_logger('rotating')
+        for i in range(500):
+            log.info('Product restocked', product_id=i)
+        jsonlog.shutdown()
+
+        names = sorted(os.listdir(self.tmpdir.name))
+        self.assertEqual(names, ['rotating.jsonl', 'rotating.jsonl.1', 'rotating.jsonl.2'])
+        for name in names:
+            self.assertLessEqual(os.path.getsize(os.path.join(self.tmpdir.name, name)), 4096)
+
+    def test_full_buffer_drops_instead_of_blocking(self):
+        handler = jsonlog.BoundedQueueHandler(jsonlog.queue.Queue(maxsize=1))
+        record = logging.LogRecord('crm', logging.INFO, __file__, 1, 'event', None, None)
+        handler.emit(record)
+        handler.emit(record)
+        self.assertEqual(handler.dropped, 1)
+
+
+class MetricsTests(TestCase):
+    def test_counters_merge_thread_shards(self):
+        counter = metrics.Counter('sample_total', 'Sample.', ['kind'])
+        threads = [threading.Thread(target=lambda: [counter.inc(kind='a') for _ in range(1000)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(5, kind='b')
+
+        self.assertEqual(counter.collect(), {('a',): 4000, ('b',): 5})
+        self.assertIn('sample_total{kind="a"} 4000', counter.render())
+
+    def test_finished_thread_shards_are_folded_into_totals(self):
+        counter = metrics.Counter('sample_total', 'Sample.')
+        histogram = metrics.Histogram('latency_seconds', 'Latency.', buckets=(1.0,))
+        for _ in range(50):
+            thread = threading.Thread(target=lambda: (counter.inc(), histogram.observe(0.5)))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(counter.collect(), {(): 50})
+        self.assertEqual(histogram.collect(), {(): [50, 0, 25.0, 50]})
+        self.assertEqual(counter._shards, [])
+        self.assertEqual(histogram._shards, [])
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = metrics.Histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value)
+
+        lines = histogram.render()
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{le="1"} 3', lines)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn('latency_seconds_count 4', lines)
+
+    def test_metrics_endpoint_reports_operations_sql_and_jobs(self):
+        from crm.jobs import coordinated_job
+
+        coordinated_job('sample_job')(lambda: 'done')()
+        before = metrics.GRAPHQL_REQUESTS.collect()
+        for query in ('query Totals { totalCustomers }', '{ n: totalCustomers }', 'query Pick_123 { __typename }'):
+            response = self.client.post('/graphql', {'query': query}, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+
+        after = metrics.GRAPHQL_REQUESTS.collect()
+        for key, added in ((('totalCustomers', 'ok'), 2), (('other', 'ok'), 1)):
+            self.assertEqual(after[key] - before.get(key, 0), added)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('crm_graphql_requests_total{operation="totalCustomers",status="ok"}', body)
+        self.assertIn('crm_graphql_request_duration_seconds_count{operation="totalCustomers"}', body)
+        self.assertNotIn('Totals', body)
+        self.assertNotIn('Pick_123', body)
+        self.assertIn('crm_db_query_duration_seconds_count{alias="default"}', body)
+        self.assertIn('crm_job_runs{job="sample_job",outcome="success"} 1', body)
+
+
+@override_settings(CRM_OUTBOX_SETTLE_SECONDS=0)
+class ChangeOutboxTests(TestCase):
+    def test_mutations_record_changes_in_their_transaction(self):
+        from .schema import CreateCustomer, CreateOrder, CreateProduct, UpdateLowStockProducts
+
+        customer = CreateCustomer().mutate(None, name='Ada', email='ada@example.com').customer
+        product = CreateProduct().mutate(None, name='Pen', price=2.5, stock=3).product
+        order = CreateOrder().mutate(None, customer_id=customer.pk, product_ids=[product.pk]).order
+        result = UpdateLowStockProducts().mutate(None)
+
+        self.assertEqual([p.stock for p in result.updated_products], [12])
+        self.assertEqual(
+            list(ChangeRecord.objects.values_list('model', 'object_id', 'operation', 'payload')),
+            [
+                ('customer', customer.pk, ChangeRecord.CREATE, {'name': 'Ada', 'email': 'ada@example.com', 'phone': None}),
+                ('product', product.pk, ChangeRecord.CREATE, {'name': 'Pen', 'price': '2.5', 'stock': 3}),
+                ('product', product.pk, ChangeRecord.UPDATE, {'stock': 2}),
+                ('order', order.pk, ChangeRecord.CREATE, {'customer_id': customer.pk, 'product_ids': [product.pk], 'total_amount': '2.50'}),
+                ('product', product.pk, ChangeRecord.UPDATE, {'stock': 12}),
+            ],
+        )
+        self.assertEqual(ChangeRecord.objects.get(model='order').payload['product_ids'], [product.pk])
+
+        with mock.patch.object(Order, 'save', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                CreateOrder().mutate(None, customer_id=customer.pk, product_ids=[product.pk])
+        self.assertEqual(ChangeRecord.objects.filter(model='order').count(), 1)
+
+    def test_purge_records_customer_and_cascaded_order_deletes(self):
+        from crm.management.commands.clean_inactive_customers import purge_inactive_customers
+
+        stale = Customer.objects.create(name='Stale', email='stale@example.com')
+        order = Order.objects.create(customer=stale, total_amount=Decimal('1.00'))
+        Order.objects.filter(pk=order.pk).update(order_date='2000-01-01T00:00:00Z')
+
+        self.assertEqual(purge_inactive_customers(), 1)
+        self.assertEqual(
+            set(ChangeRecord.objects.values_list('model', 'object_id', 'operation')),
+            {('customer', stale.pk, ChangeRecord.DELETE), ('order', order.pk, ChangeRecord.DELETE)},
+        )
+
+    def test_changes_since_pages_with_cursor(self):
+        outbox.record_changes('product', ChangeRecord.UPDATE, [(i, {'stock': i}) for i in range(1, 6)])
+        outbox.record_change('customer', 1, ChangeRecord.CREATE)
+
+        changes, cursor, has_more = outbox.changes_since(None, limit=2, models=['product'])
+        self.assertEqual([c.object_id for c in changes], [1, 2])
+        self.assertTrue(has_more)
+        changes, cursor, has_more = outbox.changes_since(cursor, limit=10, models=['product'])
+        self.assertEqual([c.object_id for c in changes], [3, 4, 5])
+        self.assertFalse(has_more)
+        self.assertEqual(outbox.changes_since(cursor, models=['product'])[1], cursor)
+        with self.assertRaises(ValueError):
+            outbox.changes_since('not-a-cursor')
+
+        streamed = list(outbox.stream_changes(batch_size=2, poll_interval=None))
+        self.assertEqual(len(streamed), 6)
+
+    @override_settings(CRM_OUTBOX_SETTLE_SECONDS=60)
+    def test_changes_since_holds_back_behind_unsettled_gaps(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        records = outbox.record_changes('product', ChangeRecord.UPDATE, [(i, {}) for i in range(1, 5)])
+        # The third id stands in for a transaction that hasn't committed yet.
+        ChangeRecord.objects.filter(pk=records[2].pk).delete()
+
+        changes, cursor, has_more = outbox.changes_since(None)
+        self.assertEqual([c.object_id for c in changes], [1, 2])
+        self.assertEqual(cursor, str(records[1].pk))
+        self.assertFalse(has_more)
+        self.assertEqual(outbox.changes_since(cursor)[0], [])
+
+        # Once the record after the gap is older than the window, the gap was a rollback.
+        ChangeRecord.objects.filter(pk=records[3].pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        changes, cursor, _ = outbox.changes_since(cursor)
+        self.assertEqual([c.object_id for c in changes], [4])
+        self.assertEqual(cursor, str(records[3].pk))
+
+    def test_prune_changes_keeps_the_retention_period(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        records = outbox.record_changes('customer', ChangeRecord.CREATE, [(i, {}) for i in range(1, 6)])
+        ChangeRecord.objects.filter(pk__in=[r.pk for r in records[:3]]).update(
+            created_at=timezone.now() - timedelta(days=31)
+        )
+
+        self.assertEqual(outbox.prune_changes(chunk_size=2), 3)
+        self.assertEqual(sorted(ChangeRecord.objects.values_list('object_id', flat=True)), [4, 5])
+        self.assertEqual(outbox.prune_changes(), 0)
+
+    def test_changes_since_query(self):
+        outbox.record_change('customer', 7, ChangeRecord.CREATE, {'name': 'Ada'})
+        response = self.client.post('/graphql', {'query': (
+            '{ changesSince(limit: 1) { nextCursor hasMore changes { model objectId payload } } }'
+        )}, content_type='application/json')
+
+        data = response.json()['data']['changesSince']
+        self.assertFalse(data['hasMore'])
+        self.assertEqual(data['changes'][0]['objectId'], 7)
+        self.assertEqual(json.loads(data['changes'][0]['payload']), {'name': 'Ada'})
+        self.assertEqual(data['nextCursor'], str(ChangeRecord.objects.get().pk))
+
+    def test_import_records_created_rows(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'products.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('name,price,stock\nPen,1.50,4\nInk,3.00,\n')
+            call_command('import_crm_data', 'products', path, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(ChangeRecord.objects.values_list('object_id', flat=True)),
+            sorted(Product.objects.values_list('pk', flat=True)),
+        )
+
+
+class InventoryTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        self.product = Product.objects.create(name='Pen', price=Decimal('2.50'), stock=0)
+        inventory.restock({self.product.pk: 5})
+
+    def ledger_total(self):
+        return sum(StockMovement.objects.filter(product=self.product).values_list('quantity', flat=True))
+
+    def test_sell_is_all_or_nothing(self):
+        from .inventory import InsufficientStock
+
+        other = Product.objects.create(name='Ink', price=Decimal('1.00'), stock=0)
+        order = Order.objects.create(customer=self.customer)
+        with self.assertRaises(InsufficientStock):
+            inventory.sell(order, {self.product.pk: 2, other.pk: 1})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+        inventory.sell(order, {self.product.pk: 2})
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.ledger_total()), (3, 3))
+
+    def test_reservations_hold_and_expire(self):
+        from .inventory import InsufficientStock
+
+        held = inventory.reserve(self.product.pk, 3)
+        expiring = inventory.reserve(self.product.pk, 2, ttl=-1)
+        with self.assertRaises(InsufficientStock):
+            inventory.reserve(self.product.pk, 1)
+
+        self.assertFalse(inventory.confirm_reservation(expiring.pk))
+        self.assertEqual(inventory.expire_reservations(), 1)
+        self.assertFalse(inventory.release_reservation(expiring.pk))
+        self.assertTrue(inventory.confirm_reservation(held.pk))
+        self.assertFalse(inventory.release_reservation(held.pk))
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.ledger_total()), (2, 2))
+
+    def test_compaction_keeps_totals_and_fixes_drift(self):
+        from datetime import timedelta
+
+        inventory.restock({self.product.pk: 4})
+        inventory.sell(Order.objects.create(customer=self.customer), {self.product.pk: 1})
+        Product.objects.filter(pk=self.product.pk).update(stock=20)
+
+        removed, adjusted = inventory.compact_ledger(older_than=timedelta(seconds=-1))
+        self.assertEqual((removed, adjusted), (2, 1))
+        self.assertEqual(
+            list(StockMovement.objects.filter(product=self.product).values_list('reason', 'quantity')),
+            [(StockMovement.BALANCE, 8), (StockMovement.ADJUST, 12)],
+        )
+        self.assertEqual(inventory.compact_ledger(), (0, 0))
+
+    def test_create_order_takes_stock(self):
+        from .schema import CreateOrder
+
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+        CreateOrder().mutate(None, customer_id=self.customer.pk, product_ids=[self.product.pk])
+        with self.assertRaises(inventory.InsufficientStock):
+            CreateOrder().mutate(None, customer_id=self.customer.pk, product_ids=[self.product.pk])
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class InventoryStressTests(TransactionTestCase):
+    def test_concurrent_orders_never_lose_updates(self):
+        from django.db import OperationalError, connection, transaction
+
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        product = Product.objects.create(name='Pen', price=Decimal('2.50'), stock=0)
+        inventory.restock({product.pk: 100})
+        sold, short = [], []
+
+        def buyer():
+            try:
+                for _ in range(40):
+                    while True:
+                        try:
+                            with transaction.atomic():
+                                order = Order.objects.create(customer=customer)
+                                inventory.sell(order, {product.pk: 1})
+                            sold.append(order.pk)
+                            break
+                        except inventory.InsufficientStock:
+                            short.append(order.pk)
+                            break
+                        except OperationalError:
+                            # SQLite's shared in-memory test database reports
+                            # lock contention instead of waiting.
+                            continue
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual((len(sold), len(short)), (100, 220))
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(StockMovement.objects.filter(reason=StockMovement.SALE).count(), 100)
+        self.assertEqual(Order.objects.count(), 100)
+        self.assertEqual(sum(StockMovement.objects.values_list('quantity', flat=True)), 0)
+
+
+class CustomerActivityTests(TestCase):
+    def setUp(self):
+        from .schema import CreateOrder
+
+        self.ada = Customer.objects.create(name='Ada', email='ada@example.com')
+        self.bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        self.pen = Product.objects.create(name='Pen', price=Decimal('2.50'), stock=0)
+        inventory.restock({self.pen.pk: 10})
+        for _ in range(2):
+            CreateOrder().mutate(None, customer_id=self.ada.pk, product_ids=[self.pen.pk])
+
+    def test_orders_update_activity_in_their_transaction(self):
+        from .schema import CreateOrder
+
+        self.ada.refresh_from_db()
+        latest = Order.objects.filter(customer=self.ada).latest('order_date', 'id')
+        self.assertEqual((self.ada.order_count, self.ada.last_order_at), (2, latest.order_date))
+
+        Product.objects.filter(pk=self.pen.pk).update(stock=0)
+        with self.assertRaises(inventory.InsufficientStock):
+            CreateOrder().mutate(None, customer_id=self.bob.pk, product_ids=[self.pen.pk])
+        self.bob.refresh_from_db()
+        self.assertEqual((self.bob.order_count, self.bob.last_order_at), (0, None))
+
+    def test_sync_repairs_drift_in_chunks(self):
+        from .activity import sync_activity
+
+        Customer.objects.filter(pk=self.ada.pk).update(order_count=0, last_order_at=None)
+        Order.objects.create(customer=self.bob)
+
+        self.assertEqual(sync_activity(chunk_size=1, repair=False), (2, 2))
+        self.assertEqual(sync_activity(chunk_size=1), (2, 2))
+        self.assertEqual(sync_activity(), (2, 0))
+        self.assertEqual(Customer.objects.get(pk=self.bob.pk).order_count, 1)
+
+        out = StringIO()
+        call_command('sync_customer_activity', '--check', stdout=out)
+        self.assertIn('All 2 customers are in sync', out.getvalue())
+
+    def test_purge_and_filters_read_the_activity_columns(self):
+        from crm.management.commands.clean_inactive_customers import purge_inactive_customers
+        from graphql_crm.schema import execute
+
+        Customer.objects.filter(pk=self.bob.pk).update(last_order_at='2000-01-01T00:00:00Z')
+        result = execute('{ allCustomers(inactiveSince: "2020-01-01T00:00:00Z") { edges { node { name } } } }')
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data['allCustomers']['edges'], [{'node': {'name': 'Bob'}}])
+        result = execute('{ allCustomers(orderCount_Gte: 2) { edges { node { name orderCount } } } }')
+        self.assertEqual(result.data['allCustomers']['edges'], [{'node': {'name': 'Ada', 'orderCount': 2}}])
+
+        self.assertEqual(purge_inactive_customers(), 1)
+        self.assertEqual(list(Customer.objects.values_list('name', flat=True)), ['Ada'])
+
+    def test_purge_rechecks_orders_behind_a_stale_column(self):
+        from crm.management.commands.clean_inactive_customers import purge_inactive_customers
+
+        Customer.objects.filter(pk=self.ada.pk).update(last_order_at='2000-01-01T00:00:00Z')
+        Customer.objects.filter(pk=self.bob.pk).update(last_order_at='2000-01-01T00:00:00Z')
+
+        self.assertEqual(purge_inactive_customers(), 1)
+        self.assertEqual(list(Customer.objects.values_list('name', flat=True)), ['Ada'])
+
+    def test_totals_are_fields_filters_and_sort_keys(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.utils import timezone
+        from graphql_crm.schema import execute
+
+        from .activity import sync_activity
+
+        today = timezone.localdate().isoformat()
+        with CaptureQueriesContext(connection) as ctx:
+            result = execute(
+                '{ allCustomers(orderBy: "-totalSpent") { edges { node { name orderCount totalSpent lastOrderDate } } } }'
+            )
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual([edge['node'] for edge in result.data['allCustomers']['edges']], [
+            {'name': 'Ada', 'orderCount': 2, 'totalSpent': '5.00', 'lastOrderDate': today},
+            {'name': 'Bob', 'orderCount': 0, 'totalSpent': '0.00', 'lastOrderDate': None},
+        ])
+
+        result = execute(
+            f'{{ allCustomers(totalSpent_Gte: 5, lastOrderDate_Lte: "{today}") {{ edges {{ node {{ name }} }} }} }}'
+        )
+        self.assertEqual(result.data['allCustomers']['edges'], [{'node': {'name': 'Ada'}}])
+        result = execute('{ allCustomers(orderBy: "-lastOrderDate", first: 1) { edges { node { name } } } }')
+        self.assertEqual(result.data['allCustomers']['edges'], [{'node': {'name': 'Ada'}}])
+
+        Customer.objects.filter(pk=self.ada.pk).update(total_spent=0)
+        self.assertEqual(sync_activity(), (2, 1))
+        self.assertEqual(Customer.objects.get(pk=self.ada.pk).total_spent, Decimal('5.00'))
+
+
+class NodeLoadingTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        self.product = Product.objects.create(name='Pen', price=Decimal('2.50'), stock=5)
+        for _ in range(3):
+            Order.objects.create(customer=self.customer, total_amount=Decimal('2.50'))
+
+    def table_queries(self, queries, table):
+        return [q for q in queries if f'FROM "{table}"' in q['sql']]
+
+    def test_each_row_is_loaded_once_per_operation(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from graphene.relay import Node
+        from graphql_crm.schema import execute
+
+        customer_id = Node.to_global_id('CustomerType', self.customer.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            result = execute(
+                'query ($id: ID!) { a: customer(id: $id) { name } b: customer(id: $id) { email } '
+                'allOrders { edges { node { customer { name } } } } }',
+                {'id': customer_id},
+            )
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data['a'], {'name': 'Ada'})
+        self.assertEqual(len(result.data['allOrders']['edges']), 3)
+        self.assertEqual(len(self.table_queries(ctx.captured_queries, 'crm_customer')), 1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            execute('query ($id: ID!) { customer(id: $id) { name } }', {'id': customer_id})
+        self.assertEqual(len(self.table_queries(ctx.captured_queries, 'crm_customer')), 1)
+
+    @override_settings(CRM_PRODUCT_CACHE_TIMEOUT=60)
+    def test_product_cache_is_invalidated_by_writes(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from graphene.relay import Node
+        from graphql_crm.schema import execute
+
+        query = 'query ($id: ID!) { product(id: $id) { stock } }'
+        variables = {'id': Node.to_global_id('ProductType', self.product.pk)}
+        self.assertEqual(execute(query, variables).data['product'], {'stock': 5})
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(execute(query, variables).data['product'], {'stock': 5})
+        self.assertEqual(self.table_queries(ctx.captured_queries, 'crm_product'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.restock({self.product.pk: 2})
+        self.assertEqual(execute(query, variables).data['product'], {'stock': 7})
+
+        self.product.refresh_from_db()
+        self.product.name = 'Ink'
+        self.product.save()
+        self.assertEqual(execute('query ($id: ID!) { product(id: $id) { name } }', variables).data['product'], {'name': 'Ink'})
+
+
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        from .schema import CreateOrder
+
+        self.customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        self.pen = Product.objects.create(name='Pen', price=Decimal('2.50'), stock=10)
+        self.ink = Product.objects.create(name='Ink', price=Decimal('4.00'), stock=10)
+        self.orders = [
+            CreateOrder().mutate(None, customer_id=self.customer.pk, product_ids=products).order
+            for products in ([self.pen.pk], [self.ink.pk], [self.pen.pk, self.ink.pk])
+        ]
+        for order, date in zip(self.orders, ['2000-01-01T00:00:00Z', '2001-01-01T00:00:00Z']):
+            Order.objects.filter(pk=order.pk).update(order_date=date)
+
+    def test_old_orders_move_with_their_products(self):
+        from .activity import sync_activity
+        from .archive import archive_orders
+        from .models import ArchivedOrder
+        from .reports import build_report
+
+        sync_activity()
+        self.assertEqual(archive_orders(chunk_size=1), 2)
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), [self.orders[2].pk])
+        archived = ArchivedOrder.objects.order_by('pk')
+        self.assertEqual([o.pk for o in archived], [o.pk for o in self.orders[:2]])
+        self.assertEqual([list(o.products.values_list('name', flat=True)) for o in archived], [['Pen'], ['Ink']])
+        self.assertEqual(archive_orders(), 0)
+
+        self.assertEqual(sync_activity(), (1, 0))
+        report = build_report(['lifetime_value'], workers=1)
+        self.assertEqual(report['lifetime_value']['top_customers'][0]['orders'], 3)
+
+    def test_queries_opt_into_archived_orders(self):
+        from graphene.relay import Node
+        from graphql_crm.schema import execute
+
+        from .archive import archive_orders
+
+        archive_orders()
+        result = execute('{ totalOrders totalRevenue recentOrders { id } all: recentOrders(includeArchived: true) { id } }')
+        self.assertIsNone(result.errors)
+        self.assertEqual((result.data['totalOrders'], result.data['totalRevenue']), (3, '13.00'))
+        self.assertEqual(len(result.data['recentOrders']), 1)
+        self.assertEqual(len(result.data['all']), 3)
+
+        query = '''query ($after: String, $archived: Boolean) {
+            allOrders(first: 2, after: $after, orderBy: "-orderDate", includeArchived: $archived) {
+                edges { node { id totalAmount products { edges { node { name } } } } } pageInfo { hasNextPage endCursor }
+            }
+        }'''
+        self.assertEqual(len(execute(query).data['allOrders']['edges']), 1)
+        first = execute(query, {'archived': True}).data['allOrders']
+        second = execute(query, {'archived': True, 'after': first['pageInfo']['endCursor']}).data['allOrders']
+        ids = [Node.to_global_id('OrderType', o.pk) for o in reversed(self.orders)]
+        self.assertEqual([e['node']['id'] for e in first['edges'] + second['edges']], ids)
+        self.assertEqual((first['pageInfo']['hasNextPage'], second['pageInfo']['hasNextPage']), (True, False))
+        self.assertEqual(second['edges'][0]['node']['products']['edges'], [{'node': {'name': 'Pen'}}])
+
+        result = execute('query ($id: ID!) { order(id: $id) { totalAmount customer { name } } }', {'id': ids[-1]})
+        self.assertEqual(result.data['order'], {'totalAmount': '2.50', 'customer': {'name': 'Ada'}})
+
+    def test_offset_pages_merge_archived_orders_in_order(self):
+        from graphene.relay import Node
+        from graphql_crm.schema import execute
+
+        from .archive import archive_orders
+
+        archive_orders()
+        ids = [Node.to_global_id('OrderType', o.pk) for o in self.orders]
+        query = '{ allOrders(orderBy: "%s", offset: 1, first: 2, includeArchived: true) { edges { node { id } } } }'
+        for order_by, expected in (('orderDate', ids[1:]), ('-totalAmount', ids[1::-1])):
+            with self.subTest(order_by=order_by):
+                result = execute(query % order_by)
+                self.assertIsNone(result.errors)
+                self.assertEqual([e['node']['id'] for e in result.data['allOrders']['edges']], expected)
+
+
+class FakeSender:
+    """Reminder sender that records what it sends and tracks concurrency."""
+
+    def __init__(self, delay=0.01, fail=(), hang=()):
+        self.delay, self.fail, self.hang = delay, set(fail), set(hang)
+        self.sent, self.in_flight, self.peak = [], 0, 0
+
+    async def send(self, reminder):
+        import asyncio
+
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(60 if reminder['order_id'] in self.hang else self.delay)
+            if reminder['order_id'] in self.fail:
+                raise ConnectionError('sender unavailable')
+            self.sent.append(reminder)
+        finally:
+            self.in_flight -= 1
+
+
+class OrderReminderTests(TestCase):
+    def setUp(self):
+        from graphene.relay import Node
+
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        orders = [Order.objects.create(customer=customer, total_amount=Decimal('1.00')) for _ in range(8)]
+        Order.objects.filter(pk=orders[0].pk).update(order_date='2000-01-01T00:00:00Z')
+        self.ids = [Node.to_global_id('OrderType', order.pk) for order in orders[1:]]
+
+    def run_reminders(self, sender, **kwargs):
+        from asgiref.sync import async_to_sync
+
+        from .reminders import InProcessSource, run_reminders
+
+        return async_to_sync(run_reminders)(InProcessSource(), sender, page_size=2, **kwargs)
+
+    def test_recent_orders_are_sent_concurrently(self):
+        sender = FakeSender(fail=[self.ids[0]])
+        summary = self.run_reminders(sender, concurrency=2)
+
+        self.assertEqual(
+            summary.as_dict() | {'seconds': 0, 'per_second': 0},
+            {'batches': 4, 'sent': 6, 'failed': 1, 'timed_out': 0, 'seconds': 0, 'per_second': 0},
+        )
+        self.assertEqual(sorted(r['order_id'] for r in sender.sent), sorted(self.ids[1:]))
+        self.assertEqual(sender.sent[0]['customer_email'], 'ada@example.com')
+        self.assertEqual(sender.peak, 2)
+
+    def test_slow_batches_time_out(self):
+        summary = self.run_reminders(FakeSender(hang=[self.ids[2]]), batch_timeout=0.2)
+        self.assertEqual((summary.sent, summary.timed_out, summary.batches), (6, 1, 4))
+
+
+class QueryBudgetTests(TestCase):
+    def test_operations_stay_within_a_constant_budget(self):
+        from .budgets import measure
+
+        report = measure(sizes=(5, 40))
+        path = os.environ.get('CRM_QUERY_BUDGET_REPORT')
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+        for name, result in report['operations'].items():
+            with self.subTest(operation=name):
+                self.assertLessEqual(max(result['queries']), result['budget'])
+                self.assertTrue(result['constant'], f'{name} grows with the dataset: {result["queries"]}')
+
+    def test_prefetched_products_are_paged_without_queries(self):
+        from graphql_crm.schema import execute
+
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        products = [Product.objects.create(name=name, price=Decimal('1.00')) for name in ('Ink', 'Pen')]
+        Order.objects.create(customer=customer).products.set(products)
+
+        with self.assertNumQueries(2):
+            result = execute('{ allOrders { edges { node { products(first: 1) { edges { node { name } } } } } } }')
+        self.assertEqual(result.data['allOrders']['edges'][0]['node']['products']['edges'], [{'node': {'name': 'Ink'}}])
+        # Filtering a nested list still goes to the database.
+        with self.assertNumQueries(3):
+            result = execute('{ allOrders { edges { node { products(name: "pen") { edges { node { name } } } } } } }')
+        self.assertEqual(result.data['allOrders']['edges'][0]['node']['products']['edges'], [{'node': {'name': 'Pen'}}])
+
+
+class RateLimitTests(TestCase):
+    def post(self, payload):
+        return self.client.post('/graphql', payload, content_type='application/json')
+
+    def test_query_cost_multiplies_lists(self):
+        from .ratelimit import query_cost
+
+        self.assertEqual(query_cost('{ totalCustomers totalOrders }'), 2)
+        # 1 + 5 * (edges 1 + (node 1 + name 1))
+        self.assertEqual(query_cost('{ allCustomers(first: 5) { edges { node { name } } } }'), 16)
+        self.assertEqual(
+            query_cost('query ($n: Int) { allCustomers(first: $n) { edges { node { name } } } }', {'n': 2}), 7
+        )
+        # No page size: 100 rows at the top, 10 per nested connection.
+        self.assertEqual(
+            query_cost('{ allOrders { edges { node { products { edges { node { name } } } } } } }'),
+            1 + 100 * (1 + 1 + 1 + 10 * 3),
+        )
+        self.assertEqual(
+            query_cost('{ ...F } fragment F on Query { recentOrders(limit: 3) { id } }'), 1 + 3 * 1
+        )
+        self.assertEqual(query_cost('mutation { updateLowStockProducts { success } }'), 2 + 10)
+        self.assertEqual(query_cost('{ not valid'), 1)
+
+    def test_query_cost_expands_each_fragment_once(self):
+        import time
+
+        from .ratelimit import MAX_COST, query_cost
+
+        levels = 40
+        fragments = ' '.join(
+            f'fragment F{i} on Query {{ ...F{i + 1} ...F{i + 1} }}' for i in range(levels)
+        ) + f' fragment F{levels} on Query {{ totalOrders }}'
+        started = time.perf_counter()
+        self.assertEqual(query_cost('{ ...F0 } ' + fragments), min(2 ** levels, MAX_COST))
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+        deep = '{ ...D0 } ' + ' '.join(f'fragment D{i} on Query {{ ...D{i + 1} }}' for i in range(200))
+        self.assertEqual(query_cost(deep + ' fragment D200 on Query { totalOrders }'), MAX_COST)
+        wide = '{ ' + ' '.join(f'a{i}: totalOrders' for i in range(20000)) + ' }'
+        self.assertEqual(query_cost(wide), MAX_COST)
+
+    def test_token_bucket_refills(self):
+        from .ratelimit import MemoryBackend
+
+        backend = MemoryBackend()
+        self.assertEqual(backend.take('c', 8, rate=2, burst=10, now=0), 0)
+        self.assertEqual(backend.take('c', 5, rate=2, burst=10, now=0), 1.5)
+        self.assertEqual(backend.take('c', 5, rate=2, burst=10, now=1.5), 0)
+        self.assertEqual(backend.take('other', 10, rate=2, burst=10, now=1.5), 0)
+
+    def test_refilled_buckets_are_dropped(self):
+        from .ratelimit import MemoryBackend
+
+        backend = MemoryBackend()
+        for i in range(100):
+            backend.take(f'client{i}', 1, rate=2, burst=10, now=0)
+        backend.take('busy', 10, rate=2, burst=10, now=4)
+        self.assertEqual(len(backend.buckets), 101)
+
+        # Five seconds refill a bucket of 10 at 2 per second.
+        backend.take('late', 1, rate=2, burst=10, now=5)
+        self.assertEqual(set(backend.buckets), {'busy', 'late'})
+        self.assertEqual(backend.take('busy', 10, rate=2, burst=10, now=5), 4)
+
+    def test_over_budget_request_gets_429_with_retry_after(self):
+        with override_settings(CRM_RATE_LIMIT_RATE=1, CRM_RATE_LIMIT_BURST=20, CRM_RATE_LIMIT_BACKEND='memory'):
+            query = {'query': '{ allCustomers(first: 5) { edges { node { name } } } }'}
+            self.assertEqual(self.post(query).status_code, 200)
+            response = self.post(query)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '12')
+        error = response.json()['errors'][0]
+        self.assertEqual(error['extensions']['code'], 'RATE_LIMITED')
+        self.assertEqual(error['extensions']['reason'], 'rate')
+
+    def test_batch_is_charged_for_every_operation(self):
+        batch = [{'query': '{ totalCustomers totalOrders totalRevenue }'}] * 2
+        with override_settings(CRM_RATE_LIMIT_RATE=1, CRM_RATE_LIMIT_BURST=10, CRM_RATE_LIMIT_BACKEND='memory'):
+            first, second = self.post(batch), self.post(batch)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second['Retry-After'], '2')
+
+    def test_in_flight_requests_are_capped_per_client(self):
+        from .ratelimit import get_limiter
+
+        with override_settings(CRM_RATE_LIMIT_RATE=100, CRM_RATE_LIMIT_CONCURRENCY=1, CRM_RATE_LIMIT_BACKEND='memory'):
+            limiter = get_limiter()
+            limiter.backend.acquire('addr:127.0.0.1', 1)
+            try:
+                blocked = self.post({'query': '{ totalCustomers }'})
+                other = self.client.post(
+                    '/graphql', {'query': '{ totalCustomers }'}, content_type='application/json',
+                    REMOTE_ADDR='10.0.0.2',
+                )
+            finally:
+                limiter.release('addr:127.0.0.1')
+            allowed = self.post({'query': '{ totalCustomers }'})
+
+        self.assertEqual(blocked.status_code, 429)
+        self.assertEqual(blocked.json()['errors'][0]['extensions']['reason'], 'concurrency')
+        self.assertEqual(other.status_code, 200)
+        self.assertEqual(allowed.status_code, 200)
+        self.assertEqual(limiter.backend.in_flight, {})
+
+    def test_web_settings_enable_the_limiter(self):
+        # manage.py, wsgi.py and asgi.py load these settings, not crm.settings.
+        code = (
+            'import django; django.setup(); '
+            'from django.test import Client; from django.test.utils import setup_test_environment; '
+            'from crm import ratelimit; setup_test_environment(); '
+            'limiter = ratelimit.get_limiter(); '
+            'limiter.backend.take("addr:127.0.0.1", limiter.burst, limiter.rate, limiter.burst); '
+            'response = Client().post("/graphql", {"query": "{ allCustomers(first: 10000) { edges { node { name } } } }"}, '
+            'content_type="application/json"); '
+            'print(response.status_code, response.has_header("Retry-After"))'
+        )
+        completed = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'alx_backend_graphql_crm.settings'},
+        )
+        self.assertEqual(completed.stdout.split('\n')[0], '429 True')
+
+    def test_cache_backend_shares_windows(self):
+        from django.core.cache import cache
+
+        from .ratelimit import CacheBackend
+
+        cache.clear()
+        backend = CacheBackend('default')
+        self.assertEqual(backend.take('c', 6, rate=1, burst=10, now=100), 0)
+        self.assertEqual(backend.take('c', 6, rate=1, burst=10, now=105), 5)
+        self.assertEqual(backend.take('c', 6, rate=1, burst=10, now=110), 0)
+        self.assertTrue(backend.acquire('c', 1))
+        self.assertFalse(backend.acquire('c', 1))
+        backend.release('c')
+        self.assertTrue(backend.acquire('c', 1))
+
+
+@override_settings(CRM_COPURCHASE_SETTLE_SECONDS=0)
+class CoPurchaseTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        self.a, self.b, self.c, self.d = (
+            Product.objects.create(name=name, price=Decimal('1.00'), stock=10) for name in 'ABCD'
+        )
+        for basket in ((self.a, self.b), (self.a, self.b, self.c), (self.a, self.c), (self.b, self.d)):
+            self.order(*basket)
+
+    def order(self, *products):
+        order = Order.objects.create(customer=self.customer)
+        order.products.add(*products)
+        return order
+
+    def names(self, product, first=5):
+        from .copurchase import neighbours
+
+        return [p.name for p in neighbours(product.pk, first)]
+
+    def test_build_counts_new_orders_incrementally(self):
+        from .copurchase import build_index
+        from .models import CoPurchase
+
+        self.assertEqual(build_index(chunk_size=3), 4)
+        self.assertEqual(self.names(self.a), ['B', 'C'])
+        self.assertEqual(self.names(self.b), ['A', 'C', 'D'])
+        self.assertEqual(CoPurchase.objects.get(product=self.a, other=self.b).count, 2)
+
+        self.order(self.a, self.c)
+        self.order(self.a, self.c)
+        self.assertEqual(build_index(), 2)
+        self.assertEqual(build_index(), 0)
+        self.assertEqual(self.names(self.a, first=1), ['C'])
+        self.assertEqual(CoPurchase.objects.get(product=self.c, other=self.a).count, 4)
+
+    @override_settings(CRM_COPURCHASE_SETTLE_SECONDS=60)
+    def test_build_stops_short_of_recent_orders(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from .copurchase import build_index
+
+        first, second, third, fourth = Order.objects.order_by('pk')
+        self.assertEqual(build_index(), 0)
+
+        # A recent order holds back the settled ones after it.
+        old = timezone.now() - timedelta(minutes=5)
+        Order.objects.filter(pk__in=[first.pk, second.pk, fourth.pk]).update(order_date=old)
+        self.assertEqual(build_index(), 2)
+        self.assertEqual(self.names(self.a), ['B', 'C'])
+
+        Order.objects.filter(pk=third.pk).update(order_date=old)
+        self.assertEqual(build_index(), 2)
+        self.assertEqual(self.names(self.b), ['A', 'C', 'D'])
+
+    def test_rebuild_counts_archived_orders_and_keeps_top_k(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from .archive import archive_orders
+        from .copurchase import build_index
+        from .models import ArchivedOrder, CoPurchase
+
+        build_index()
+        before = set(CoPurchase.objects.values_list('product_id', 'other_id', 'count'))
+        Order.objects.filter(pk=Order.objects.order_by('pk')[0].pk).update(order_date='2000-01-01T00:00:00Z')
+        archive_orders(timezone.now() - timedelta(days=365))
+        self.assertEqual(ArchivedOrder.objects.count(), 1)
+
+        with override_settings(CRM_COPURCHASE_TOP_K=1):
+            self.assertEqual(build_index(rebuild=True), 4)
+            self.assertEqual(self.names(self.b), ['A'])
+        self.assertEqual(set(CoPurchase.objects.values_list('product_id', 'other_id', 'count')), before)
+        self.assertEqual(CoPurchase.objects.filter(product=self.b, rank__isnull=False).count(), 1)
+
+    def test_field_reads_the_index_in_one_query(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from graphql_crm.schema import execute
+
+        from .copurchase import build_index
+
+        build_index()
+        with CaptureQueriesContext(connection) as ctx:
+            result = execute('{ allProducts(name: "A") { edges { node { frequentlyBoughtWith(first: 1) { name } } } } }')
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            result.data['allProducts']['edges'], [{'node': {'frequentlyBoughtWith': [{'name': 'B'}]}}]
+        )
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+        out = StringIO()
+        call_command('build_copurchase_index', '--rebuild', stdout=out)
+        self.assertIn('Counted 4 orders', out.getvalue())
+
+    def test_lists_of_products_read_the_index_in_one_query(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from graphql_crm.schema import execute
+
+        from .copurchase import build_index
+
+        build_index()
+        with CaptureQueriesContext(connection) as ctx:
+            result = execute('{ allProducts { edges { node { name frequentlyBoughtWith(first: 2) { name } } } } }')
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            {edge['node']['name']: [p['name'] for p in edge['node']['frequentlyBoughtWith']]
+             for edge in result.data['allProducts']['edges']},
+            {'A': ['B', 'C'], 'B': ['A', 'C'], 'C': ['A', 'B'], 'D': ['B']},
+        )
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+        with CaptureQueriesContext(connection) as ctx:
+            result = execute(
+                '{ allOrders { edges { node { products { edges { node { frequentlyBoughtWith(first: 1) { name } } } } } } } }'
+            )
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            result.data['allOrders']['edges'][0]['node']['products']['edges'][0]['node']['frequentlyBoughtWith'],
+            [{'name': 'B'}],
+        )
+        self.assertEqual(len(ctx.captured_queries), 3)
+
+
+class HealthTests(TestCase):
+    def setUp(self):
+        from . import health
+
+        health.reset()
+        self.addCleanup(health.reset)
+
+    def test_healthz_checks_the_database_and_caches_the_result(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            first = self.client.get('/healthz')
+            second = self.client.get('/healthz')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['status'], 'ok')
+        self.assertTrue(first.json()['database']['ok'])
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_unreachable_database_is_a_503(self):
+        from django.db import OperationalError
+
+        with mock.patch('crm.health.connection.cursor', side_effect=OperationalError('no such host')):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['database'], {'ok': False, 'error': 'no such host'})
+
+    @override_settings(CRM_HEALTH_MAX_JOB_LAG={'archive_orders': 60})
+    def test_readyz_reports_job_lag_and_backlogs(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from .models import JobLease
+
+        now = timezone.now()
+        JobLease.objects.create(name='archive_orders', last_finished_at=now - timedelta(hours=2), last_outcome='success')
+        JobLease.objects.create(name='update_low_stock', last_finished_at=now, last_outcome='error')
+        JobLease.objects.create(name='maintain_inventory', last_finished_at=now, last_outcome='success')
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        Order.objects.create(customer=customer)
+
+        report = self.client.get('/readyz').json()
+        self.assertEqual(report['status'], 'ok')
+        self.assertEqual(report['stale_jobs'], ['archive_orders', 'update_low_stock'])
+        self.assertGreater(report['jobs']['archive_orders']['lag_seconds'], 7000)
+        self.assertFalse(report['jobs']['maintain_inventory']['stale'])
+        self.assertEqual(report['queues']['copurchase_orders'], 1)
+        self.assertEqual(report['queues']['expired_reservations'], 0)
+
+    def test_backlog_counts_are_capped(self):
+        from . import health
+
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        for _ in range(3):
+            Order.objects.create(customer=customer)
+        with mock.patch.object(health, 'BACKLOG_LIMIT', 2):
+            self.assertEqual(health.queue_backlog()['copurchase_orders'], 2)
+
+    def test_web_settings_know_every_cron_job(self):
+        # /readyz runs under the web settings; the cron schedule lives in crm.settings.
+        from alx_backend_graphql_crm import settings as web_settings
+        from crm import settings as cron_settings
+
+        jobs = {path.rsplit('.', 1)[1] for _, path in cron_settings.CRONJOBS}
+        self.assertEqual(set(web_settings.CRM_HEALTH_MAX_JOB_LAG), jobs)
+        self.assertEqual(web_settings.CRM_HEALTH_MAX_JOB_LAG, cron_settings.CRM_HEALTH_MAX_JOB_LAG)
+        self.assertEqual(web_settings.CRM_HEALTH_CACHE_SECONDS, cron_settings.CRM_HEALTH_CACHE_SECONDS)
+
+    def test_heartbeat_logs_the_readiness_report_in_process(self):
+        from crm.cron import log_crm_heartbeat
+        from graphql_crm import schema
+
+        with mock.patch.object(schema, 'execute') as execute:
+            self.assertIn('CRM is alive', log_crm_heartbeat())
+        execute.assert_not_called()
+
+
+class StockCoalescingTests(TestCase):
+    def setUp(self):
+        self.pen = Product.objects.create(name='Pen', price=Decimal('2.50'), stock=0)
+        self.ink = Product.objects.create(name='Ink', price=Decimal('4.00'), stock=0)
+        inventory.restock({self.pen.pk: 3, self.ink.pk: 1})
+
+    def change(self, quantities, sign):
+        reason = StockMovement.SALE if sign < 0 else StockMovement.RESTOCK
+        return inventory._Change(quantities, sign, reason, None)
+
+    def test_group_admits_changes_in_order_with_one_update(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        group = [
+            self.change({self.pen.pk: 2}, -1),
+            self.change({self.pen.pk: 2, self.ink.pk: 1}, -1),
+            self.change({self.pen.pk: 5}, 1),
+            self.change({self.pen.pk: 4, self.ink.pk: 1}, -1),
+            self.change({self.ink.pk: 1}, -1),
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            inventory.StockCoalescer(window=0).flush(group)
+
+        self.assertEqual([c.error is None for c in group], [True, False, True, True, False])
+        self.assertIsInstance(group[1].error, inventory.InsufficientStock)
+        self.assertEqual(group[4].error.product_id, self.ink.pk)
+        self.assertEqual([p.name for p in group[3].result], ['Pen', 'Ink'])
+        self.assertTrue(all(c.done.is_set() for c in group))
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "crm_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('CASE', updates[0])
+
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Pen': 2, 'Ink': 0})
+        self.assertEqual(inventory.compact_ledger(), (0, 0))
+
+    def test_failed_group_falls_back_to_single_changes(self):
+        group = [self.change({self.pen.pk: 2}, -1), self.change({self.pen.pk: 2}, -1)]
+        with mock.patch.object(inventory, '_apply_group', side_effect=inventory.StockConflict('changed')):
+            inventory.StockCoalescer(window=0).flush(group)
+
+        self.assertIsNone(group[0].error)
+        self.assertIsInstance(group[1].error, inventory.InsufficientStock)
+        self.assertEqual(Product.objects.get(pk=self.pen.pk).stock, 1)
+
+    @override_settings(CRM_STOCK_COALESCE_MS=2)
+    def test_changes_inside_a_transaction_are_not_coalesced(self):
+        # TestCase wraps every test in a transaction.
+        self.assertIsNone(inventory.get_coalescer())
+        self.assertEqual(inventory.sell(None, {self.pen.pk: 1})[0].stock, 2)
+
+
+@override_settings(CRM_STOCK_COALESCE_MS=2)
+class StockCoalescingStressTests(TransactionTestCase):
+    def test_concurrent_sells_never_oversell(self):
+        from django.db import close_old_connections
+
+        product = Product.objects.create(name='Pen', price=Decimal('2.50'), stock=0)
+        self.assertEqual(inventory.restock({product.pk: 30})[0].stock, 30)
+        sold, short = [], []
+
+        def buyer():
+            try:
+                for _ in range(5):
+                    try:
+                        inventory.sell(None, {product.pk: 1})
+                        sold.append(1)
+                    except inventory.InsufficientStock:
+                        short.append(1)
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=buyer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual((len(sold), len(short)), (30, 10))
+        self.assertEqual(Product.objects.get(pk=product.pk).stock, 0)
+        self.assertEqual(inventory.compact_ledger(), (0, 0))
+
+
+class ExplainTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        self.pen = Product.objects.create(name='Pen', price=Decimal('2.50'), stock=5)
+
+    def post(self, payload, path='/graphql?explain=1'):
+        return self.client.post(path, payload, content_type='application/json')
+
+    @override_settings(DEBUG=True)
+    def test_explain_returns_plans_and_flags_full_scans(self):
+        response = self.post({'query': '{ allOrders(customerName: "ada") { edges { node { id } } } }'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['data'], {'allOrders': {'edges': []}})
+        report = body['extensions']['explain']
+        self.assertTrue(report['dry_run'])
+        self.assertTrue(all(entry['plan'] for entry in report['statements']))
+        # icontains on the customer name can't use an index.
+        self.assertTrue(report['full_scans'])
+
+        seek = self.post({'query': '{ allOrders(first: 5, orderBy: "-totalAmount") { edges { node { id } } } }'})
+        statements = seek.json()['extensions']['explain']['statements']
+        self.assertEqual([entry['full_scans'] for entry in statements], [[]])
+        self.assertEqual(statements[0]['count'], 1)
+
+    @override_settings(DEBUG=True)
+    def test_mutations_are_rolled_back(self):
+        response = self.post({
+            'query': 'mutation ($c: ID!, $p: [ID]!) { createOrder(customerId: $c, productIds: $p) { order { id } } }',
+            'variables': {'c': str(self.customer.pk), 'p': [str(self.pen.pk)]},
+        })
+        body = response.json()
+        self.assertIsNotNone(body['data']['createOrder']['order']['id'])
+        sql = [entry['sql'] for entry in body['extensions']['explain']['statements']]
+        self.assertTrue(any(statement.startswith('INSERT INTO "crm_order"') for statement in sql))
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(Product.objects.get(pk=self.pen.pk).stock, 5)
+
+    def test_explain_needs_debug(self):
+        body = self.post({'query': '{ totalOrders }', 'explain': True}, path='/graphql').json()
+        self.assertNotIn('extensions', body)
+
+    @override_settings(DEBUG=True)
+    def test_explain_in_process_and_in_batches(self):
+        from .explain import explain
+
+        result, report = explain('{ recentOrders(limit: 3) { id } }')
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(report['statements']), 1)
+
+        first, second = self.post([{'query': '{ totalCustomers }', 'explain': True}, {'query': '{ totalCustomers }'}], path='/graphql').json()
+        self.assertIn('explain', first['extensions'])
+        self.assertNotIn('extensions', second)
+
+
+class OrderingPaginationTests(TestCase):
+    def setUp(self):
+        from graphql_crm.schema import get_schema
+
+        self.schema = get_schema()
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        self.orders = [
+            Order.objects.create(customer=customer, total_amount=Decimal(i % 3)) for i in range(12)
+        ]
+
+    def page(self, arguments):
+        result = self.schema.execute(
+            '{ allOrders(%s) { edges { node { id totalAmount } } pageInfo { endCursor startCursor hasNextPage hasPreviousPage } } }'
+            % arguments
+        )
+        self.assertIsNone(result.errors)
+        return result.data['allOrders']
+
+    def test_sorted_pages_are_stable_and_complete(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from graphql_relay import from_global_id
+
+        expected = [o.pk for o in sorted(self.orders, key=lambda o: (o.total_amount, o.pk), reverse=True)]
+        seen, after = [], None
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.page('orderBy: "-totalAmount", first: 5' + (f', after: "{after}"' if after else ''))
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn('OFFSET', queries[0]['sql'])
+            seen += [int(from_global_id(edge['node']['id'])[1]) for edge in page['edges']]
+            if not page['pageInfo']['hasNextPage']:
+                break
+            after = page['pageInfo']['endCursor']
+        self.assertEqual(seen, expected)
+
+        backwards = self.page(f'orderBy: "-totalAmount", last: 3, before: "{after}"')
+        self.assertEqual(
+            [int(from_global_id(edge['node']['id'])[1]) for edge in backwards['edges']], expected[6:9]
+        )
+        self.assertTrue(backwards['pageInfo']['hasPreviousPage'])
+
+    def test_paging_by_order_date_keeps_microseconds(self):
+        from datetime import datetime, timedelta, timezone as dt_timezone
+
+        from graphql_relay import from_global_id
+
+        # Every timestamp shares one millisecond, and some are equal.
+        base = datetime(2026, 1, 1, 12, 0, 0, 123000, tzinfo=dt_timezone.utc)
+        for i, order in enumerate(self.orders):
+            Order.objects.filter(pk=order.pk).update(order_date=base + timedelta(microseconds=(i * 7) % 5))
+        dates = dict(Order.objects.values_list('pk', 'order_date'))
+
+        def ids(page):
+            return [int(from_global_id(edge['node']['id'])[1]) for edge in page['edges']]
+
+        for key, descending in (('orderDate', False), ('-orderDate', True)):
+            expected = sorted(dates, key=lambda pk: (dates[pk], pk), reverse=descending)
+            seen, after = [], None
+            for _ in range(len(expected)):
+                page = self.page(f'orderBy: "{key}", first: 2' + (f', after: "{after}"' if after else ''))
+                seen += ids(page)
+                if not page['pageInfo']['hasNextPage']:
+                    break
+                after = page['pageInfo']['endCursor']
+            self.assertEqual(seen, expected, key)
+
+            seen, before = [], None
+            for _ in range(len(expected)):
+                page = self.page(f'orderBy: "{key}", last: 2' + (f', before: "{before}"' if before else ''))
+                seen = ids(page) + seen
+                if not page['pageInfo']['hasPreviousPage']:
+                    break
+                before = page['pageInfo']['startCursor']
+            self.assertEqual(seen, expected, key)
+
+    def test_order_by_rejects_unindexed_keys(self):
+        result = self.schema.execute('{ allCustomers(orderBy: "phone") { edges { node { id } } } }')
+        self.assertIsNotNone(result.errors)
+
+    def test_default_order_is_by_id(self):
+        page = self.page('first: 2')
+        self.assertEqual(len(page['edges']), 2)
+        self.assertFalse(page['pageInfo']['hasPreviousPage'])
+        self.assertTrue(page['pageInfo']['hasNextPage'])
+
+
+class SchemaTests(TestCase):
+    def field_names(self, root):
+        return set(root.fields) if root else set()
+
+    def test_schema_exposes_every_operation(self):
+        from graphql_crm.schema import get_schema
+
+        schema = get_schema()
+        self.assertIs(schema, get_schema())
+        graphql_schema = schema.graphql_schema
+        self.assertEqual(self.field_names(graphql_schema.query_type), {
+            'hello', 'allCustomers', 'allProducts', 'allOrders', 'customer', 'product', 'order',
+            'totalCustomers', 'totalOrders', 'totalRevenue', 'recentOrders', 'changesSince',
+        })
+        self.assertEqual(self.field_names(graphql_schema.mutation_type), {
+            'createCustomer', 'createProduct', 'createOrder', 'updateLowStockProducts',
+        })
+        self.assertEqual(self.field_names(graphql_schema.subscription_type), {
+            'orderCreated', 'productStockChanged',
+        })
+
+    def test_mutations_and_filters_over_http(self):
+        def post(query):
+            response = self.client.post('/graphql', {'query': query}, content_type='application/json')
+            body = response.json()
+            self.assertNotIn('errors', body)
+            return body['data']
+
+        post('mutation { createCustomer(name: "Ada", email: "ada@example.com") { customer { id } } }')
+        post('mutation { createProduct(name: "Blue Pen", price: 2.5, stock: 4) { product { id } } }')
+        customer, product = Customer.objects.get(), Product.objects.get()
+        post(f'mutation {{ createOrder(customerId: {customer.pk}, productIds: [{product.pk}]) {{ order {{ id }} }} }}')
+
+        data = post('{ allOrders(productName: "pen") { edges { node { customer { name } } } } }')
+        self.assertEqual(data['allOrders']['edges'], [{'node': {'customer': {'name': 'Ada'}}}])
+
+    def test_cron_jobs_run_in_process(self):
+        from crm.cron import update_low_stock
+
+        Product.objects.create(name='Pen', price=Decimal('1.00'), stock=2)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        use_log_dir(self, tmpdir.name)
+        self.assertIn('Successfully updated 1', update_low_stock())
+        self.assertEqual(Product.objects.get().stock, 12)
+
+
+class BatchRequestTests(TestCase):
+    def post(self, payload):
+        return self.client.post('/graphql', payload, content_type='application/json')
+
+    def test_batch_runs_operations_in_order(self):
+        response = self.post([
+            {'query': 'mutation { createCustomer(name: "Ada", email: "ada@example.com") { customer { name } } }'},
+            {'query': 'query Count { totalCustomers }', 'id': 'count'},
+            {'query': '{ missingField }'},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        first, second, third = response.json()
+        self.assertEqual(first['data'], {'createCustomer': {'customer': {'name': 'Ada'}}})
+        self.assertEqual((second['id'], second['data']), ('count', {'totalCustomers': 1}))
+        self.assertEqual(third['status'], 400)
+        self.assertIn('errors', third)
+
+    def test_batch_shares_request_context(self):
+        from .views import CRMGraphQLView
+
+        contexts = []
+        original = CRMGraphQLView.get_context
+
+        def recording(view, request):
+            contexts.append(original(view, request))
+            return contexts[-1]
+
+        with mock.patch.object(CRMGraphQLView, 'get_context', recording):
+            self.post([{'query': '{ totalOrders }'}, {'query': '{ totalOrders }'}])
+        self.assertEqual(len(contexts), 2)
+        self.assertIs(contexts[0], contexts[1])
+
+    @override_settings(CRM_GRAPHQL_MAX_BATCH_SIZE=2)
+    def test_batch_size_is_limited(self):
+        response = self.post([{'query': '{ totalOrders }'}] * 3)
+        self.assertEqual(response.status_code, 400)
+
+    def test_single_operation_still_returns_object(self):
+        self.assertEqual(self.post({'query': '{ totalOrders }'}).json(), {'data': {'totalOrders': 0}})
+
+
+@override_settings(CRM_GRAPHQL_BATCH_WORKERS=4)
+class ParallelBatchTests(TransactionTestCase):
+    def test_read_batches_run_on_worker_threads(self):
+        Customer.objects.create(name='Ada', email='ada@example.com')
+        threads = set()
+        count = Customer.objects.count
+
+        def recording():
+            threads.add(threading.current_thread().name)
+            return count()
+
+        def post(batch):
+            threads.clear()
+            with mock.patch.object(Customer.objects, 'count', recording):
+                return self.client.post('/graphql', batch, content_type='application/json')
+
+        response = post([{'query': '{ totalCustomers }'}] * 4)
+        self.assertEqual([r['data'] for r in response.json()], [{'totalCustomers': 1}] * 4)
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith('graphql-batch') for name in threads))
+
+        post([
+            {'query': '{ totalCustomers }'},
+            {'query': 'mutation { updateLowStockProducts { success } }'},
+        ])
+        self.assertEqual(threads, {threading.current_thread().name})
+
+
+class DecimalAndEncodingTests(TestCase):
+    def post(self, query):
+        return self.client.post('/graphql', {'query': query}, content_type='application/json')
+
+    def test_decimal_fields_round_trip_exactly(self):
+        from .scalars import Decimal as DecimalScalar
+
+        self.assertEqual(DecimalScalar.parse_value(0.1), Decimal('0.1'))
+        self.assertEqual(DecimalScalar.serialize(Decimal('19.990')), '19.990')
+        response = self.post('mutation { createProduct(name: "Pen", price: 19.99, stock: 1) { product { price } } }')
+        self.assertEqual(response.json()['data']['createProduct']['product']['price'], '19.99')
+        self.assertEqual(Product.objects.get().price, Decimal('19.99'))
+
+        response = self.post('{ allProducts(price_Gte: 19.99) { edges { node { name } } } }')
+        self.assertEqual(response.json()['data']['allProducts']['edges'], [{'node': {'name': 'Pen'}}])
+
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        for amount in ('0.10', '0.20'):
+            Order.objects.create(customer=customer, total_amount=Decimal(amount))
+        self.assertEqual(self.post('{ totalRevenue }').json(), {'data': {'totalRevenue': '0.30'}})
+
+    def test_encoders_produce_identical_bytes(self):
+        from .encoding import ENCODERS, get_encoder, orjson_available
+
+        data = {'data': {'name': 'Zoë', 'amount': Decimal('1.50'), 'items': [1, None, True]}}
+        outputs = {ENCODERS[name](data) for name in ENCODERS if name != 'orjson' or orjson_available()}
+        self.assertEqual(outputs, {'{"data":{"name":"Zoë","amount":"1.50","items":[1,null,true]}}'.encode()})
+        with self.assertRaises(ValueError):
+            get_encoder('yaml')
+
+    def test_view_uses_configured_encoder(self):
+        for name in ('json', 'orjson'):
+            with self.subTest(encoder=name), override_settings(CRM_GRAPHQL_JSON_ENCODER=name):
+                with mock.patch.dict('crm.encoding.ENCODERS', {name: mock.Mock(return_value=b'{}')}):
+                    self.assertEqual(self.post('{ totalOrders }').content, b'{}')
+
+
+class CustomerReportTests(TestCase):
+    def setUp(self):
+        pen = Product.objects.create(name='Pen', price=Decimal('2.00'), stock=100)
+        ink = Product.objects.create(name='Ink', price=Decimal('300.00'), stock=100)
+        for i in range(9):
+            customer = Customer.objects.create(name=f'C{i}', email=f'c{i}@example.com')
+            for _ in range(i % 3):
+                products = [pen, ink] if i % 2 else [pen]
+                order = Order.objects.create(customer=customer, total_amount=sum(p.price for p in products))
+                order.products.set(products)
+
+    def test_report_is_independent_of_partitioning(self):
+        from .reports import build_report
+
+        report = build_report(workers=1, partitions=1)
+        for partitions in (2, 5, 20):
+            self.assertEqual(build_report(workers=1, partitions=partitions), report)
+
+        bands = report['lifetime_value']['bands']
+        self.assertEqual(bands['none']['customers'], 3)
+        self.assertEqual(bands['500_to_1000'], {'customers': 1, 'revenue': Decimal('604.00')})
+        self.assertEqual(
+            [c['name'] for c in report['lifetime_value']['top_customers'][:3]], ['C5', 'C1', 'C7']
+        )
+        self.assertEqual(
+            report['top_products_per_segment']['under_100'],
+            [{'product_id': Product.objects.get(name='Pen').pk, 'name': 'Pen', 'purchases': 5}],
+        )
+
+    def test_unknown_section_is_rejected(self):
+        from .reports import build_report
+
+        with self.assertRaises(ValueError):
+            build_report(['churn'], workers=1)
+
+
+class EventBusTests(SimpleTestCase):
+    async def test_full_queue_drops_oldest_events(self):
+        import asyncio
+
+        with events.BUS.subscribe('sample', maxsize=2) as subscription:
+            for i in range(5):
+                events.BUS.publish('sample', i)
+            await asyncio.sleep(0)
+
+            self.assertEqual([await anext(subscription), await anext(subscription)], [3, 4])
+            self.assertEqual(subscription.dropped, 3)
+        self.assertFalse(events.BUS.has_subscribers('sample'))
+
+
+class SubscriptionTests(TransactionTestCase):
+    async def subscribe(self, query):
+        import asyncio
+
+        from channels.testing import WebsocketCommunicator
+
+        from alx_backend_graphql_crm.asgi import application
+
+        communicator = WebsocketCommunicator(application, '/graphql', subprotocols=['graphql-transport-ws'])
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, 'graphql-transport-ws')
+        await communicator.send_json_to({'type': 'connection_init'})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'connection_ack'})
+        await communicator.send_json_to({'type': 'subscribe', 'id': '1', 'payload': {'query': query}})
+        # Wait for the subscription to register on the bus before writing.
+        for _ in range(100):
+            if events.BUS._subscribers:
+                break
+            await asyncio.sleep(0.01)
+        return communicator
+
+    async def next_payload(self, communicator):
+        message = await communicator.receive_json_from(timeout=5)
+        self.assertEqual((message['type'], message['id']), ('next', '1'), message)
+        return message['payload']['data']
+
+    async def test_order_created(self):
+        from asgiref.sync import sync_to_async
+
+        from .schema import CreateOrder
+
+        communicator = await self.subscribe('subscription { orderCreated { totalAmount customer { name } } }')
+
+        def create_order():
+            customer = Customer.objects.create(name='Ada', email='ada@example.com')
+            product = Product.objects.create(name='Pen', price=Decimal('2.50'), stock=5)
+            CreateOrder().mutate(None, customer_id=customer.pk, product_ids=[product.pk])
+
+        await sync_to_async(create_order)()
+        self.assertEqual(
+            await self.next_payload(communicator),
+            {'orderCreated': {'totalAmount': '2.50', 'customer': {'name': 'Ada'}}},
+        )
+
+        await communicator.send_json_to({'type': 'complete', 'id': '1'})
+        await communicator.disconnect()
+        self.assertFalse(events.BUS.has_subscribers(events.ORDER_CREATED))
+
+    async def test_product_stock_changed_honours_threshold(self):
+        from asgiref.sync import sync_to_async
+
+        from .schema import UpdateLowStockProducts
+
+        communicator = await self.subscribe(
+            'subscription { productStockChanged(threshold: 20) { name stock } }'
+        )
+
+        def write_products():
+            Product.objects.create(name='Plenty', price=Decimal('1.00'), stock=50)
+            Product.objects.create(name='Scarce', price=Decimal('1.00'), stock=3)
+            UpdateLowStockProducts().mutate(None)
+
+        await sync_to_async(write_products)()
+        self.assertEqual(await self.next_payload(communicator), {'productStockChanged': {'name': 'Scarce', 'stock': 3}})
+        self.assertEqual(await self.next_payload(communicator), {'productStockChanged': {'name': 'Scarce', 'stock': 13}})
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_rejects_subscribe_before_init(self):
+        from channels.testing import WebsocketCommunicator
+
+        from alx_backend_graphql_crm.asgi import application
+
+        communicator = WebsocketCommunicator(application, '/graphql', subprotocols=['graphql-transport-ws'])
+        await communicator.connect()
+        await communicator.send_json_to({'type': 'subscribe', 'id': '1', 'payload': {'query': '{ totalOrders }'}})
+        self.assertEqual(await communicator.receive_output(), {'type': 'websocket.close', 'code': 4401})
+
+
+class StartupTests(SimpleTestCase):
+    def test_entry_points_defer_heavy_imports_and_schema_build(self):
+        code = (
+            'import sys, django; django.setup(); '
+            'import crm.cron, crm.jobs, graphql_crm.schema; '
+            'print(sorted(m for m in ("gql", "requests") if m in sys.modules)); '
+            'print(graphql_crm.schema._schema is None)'
+        )
+        completed = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        )
+        self.assertEqual(completed.stdout.split('\n')[:2], ['[]', 'True'])
+
+    def test_schema_is_built_once(self):
+        from crm import schema as crm_schema
+        from graphql_crm import schema as project_schema
+
+        self.assertIs(project_schema.schema, project_schema.get_schema())
+        self.assertIs(crm_schema.schema, project_schema.get_schema())
@@ -1,3 +1,237 @@
-from django.shortcuts import render
+import functools
+import json
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your views here.
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import ensure_csrf_cookie
+from graphene_django.views import GraphQLView, HttpError
+from graphql import OperationType, get_operation_ast, parse
+from graphql.language.ast import FieldNode
+
+from . import explain, health, metrics, ratelimit
+from .encoding import get_encoder
+
+# Operation type and first root field (skipping an alias) of a document.
+ROOT_FIELD_RE = re.compile(r'^\s*(query|mutation|subscription)?[^{]*\{\s*(?:\w+\s*:\s*)?(\w+)')
+
+DEFAULT_MAX_BATCH_SIZE = 20
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def root_fields(operation_type):
+    from graphql_crm.schema import get_schema
+
+    root = getattr(get_schema().graphql_schema, f'{operation_type}_type')
+    return frozenset(root.fields) if root else frozenset()
+
+
+def operation_label(query):
+    """
+    Label for an operation's metrics: its first root field, read without
+    parsing the document. Names the schema doesn't have, like client-chosen
+    operation names, would make the label set unbounded; they count as ``other``.
+    """
+    match = ROOT_FIELD_RE.match(query or '')
+    if match and match.group(2) in root_fields(match.group(1) or 'query'):
+        return match.group(2)
+    return 'other'
+
+
+def batch_executor(workers):
+    """Process-wide pool for running the read operations of a batch in parallel."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(workers, thread_name_prefix='graphql-batch')
+    return _executor
+
+
+def is_read_only(entry):
+    """True when a batch entry is a query that can run alongside the others."""
+    try:
+        document = parse(entry.get('query') or '')
+    except Exception:
+        return False
+    operation = get_operation_ast(document, entry.get('operationName'))
+    return operation is not None and operation.operation == OperationType.QUERY
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQL endpoint that records per-operation request metrics.
+
+    A JSON array of operations is executed as a batch and answered with an
+    array of results. Every operation shares the request as its context; when
+    ``CRM_GRAPHQL_BATCH_WORKERS`` is above 1, batches made only of queries run
+    on a thread pool. Responses are encoded with the encoder selected by
+    ``CRM_GRAPHQL_JSON_ENCODER`` (see ``crm/encoding.py``). Requests are
+    rate limited by query cost and per-client concurrency when
+    ``CRM_RATE_LIMIT_RATE`` is set (see ``crm/ratelimit.py``). With ``DEBUG``
+    on, an operation sent with ``explain`` runs as a dry run and returns its
+    query plans (see ``crm/explain.py``).
+    """
+
+    def json_encode(self, request, d, pretty=False):
+        if self.pretty or pretty or request.GET.get('pretty'):
+            return super().json_encode(request, d, pretty=True).encode()
+        return get_encoder()(d)
+
+    @staticmethod
+    def is_batch_request(request):
+        return (
+            request.method == 'POST'
+            and request.content_type == 'application/json'
+            and request.body.lstrip()[:1] == b'['
+        )
+
+    @method_decorator(ensure_csrf_cookie)
+    def dispatch(self, request, *args, **kwargs):
+        batch = self.is_batch_request(request)
+        self.batch = batch
+        limiter = ratelimit.get_limiter()
+        # Opening GraphiQL runs no operation and isn't charged.
+        if limiter is None or (request.method == 'GET' and 'query' not in request.GET):
+            return self.dispatch_operations(request, batch, *args, **kwargs)
+
+        client = ratelimit.client_key(request)
+        try:
+            limiter.admit(client, self.request_cost(request, batch))
+        except ratelimit.RateLimited as e:
+            return self.rate_limited_response(request, e)
+        try:
+            return self.dispatch_operations(request, batch, *args, **kwargs)
+        finally:
+            limiter.release(client)
+
+    def request_cost(self, request, batch):
+        """Query cost of the request; the sum of its operations' costs for a batch."""
+        try:
+            data = self.parse_body(request)
+            entries = data if batch else [data]
+            if len(entries) > getattr(settings, 'CRM_GRAPHQL_MAX_BATCH_SIZE', DEFAULT_MAX_BATCH_SIZE):
+                return 1
+            cost = 0
+            for entry in entries:
+                if isinstance(entry, dict):
+                    query, variables, operation_name, _ = self.get_graphql_params(request, entry)
+                    variables = variables if isinstance(variables, dict) else None
+                    cost += ratelimit.query_cost(query, variables, operation_name)
+        except HttpError:
+            # Malformed requests are answered with a 400 by the normal path.
+            return 1
+        return max(1, cost)
+
+    def rate_limited_response(self, request, error):
+        retry_after = max(1, math.ceil(error.retry_after))
+        response = HttpResponse(
+            status=429,
+            content=self.json_encode(request, {'errors': [{
+                'message': str(error),
+                'extensions': {'code': 'RATE_LIMITED', 'reason': error.reason, 'retryAfter': retry_after},
+            }]}),
+            content_type='application/json',
+        )
+        response['Retry-After'] = str(retry_after)
+        return response
+
+    def dispatch_operations(self, request, batch, *args, **kwargs):
+        if not batch:
+            return super().dispatch(request, *args, **kwargs)
+
+        try:
+            entries = self.parse_body(request)
+            max_size = getattr(settings, 'CRM_GRAPHQL_MAX_BATCH_SIZE', DEFAULT_MAX_BATCH_SIZE)
+            if len(entries) > max_size:
+                raise HttpError(HttpResponseBadRequest(f'Batches are limited to {max_size} operations.'))
+            if not all(isinstance(entry, dict) for entry in entries):
+                raise HttpError(HttpResponseBadRequest('Every batch entry must be a JSON object.'))
+            responses = self.get_batch_responses(request, entries)
+        except HttpError as e:
+            response = e.response
+            response['Content-Type'] = 'application/json'
+            response.content = self.json_encode(request, {'errors': [self.format_error(e)]})
+            return response
+
+        return HttpResponse(
+            status=max(status for _, status in responses),
+            content=b'[' + b','.join(result for result, _ in responses) + b']',
+            content_type='application/json',
+        )
+
+    def get_batch_responses(self, request, entries):
+        workers = getattr(settings, 'CRM_GRAPHQL_BATCH_WORKERS', 0)
+        parallel = (
+            workers > 1
+            and len(entries) > 1
+            # Rollback flags only work on the request thread's transaction.
+            and not connection.settings_dict.get('ATOMIC_REQUESTS')
+            and all(is_read_only(entry) for entry in entries)
+        )
+        if not parallel:
+            # Mutations run one after another, in the order they were sent.
+            return [self.get_response(request, entry) for entry in entries]
+        return list(batch_executor(workers).map(lambda entry: self.get_worker_response(request, entry), entries))
+
+    def get_worker_response(self, request, entry):
+        try:
+            return self.get_response(request, entry)
+        finally:
+            close_old_connections()
+
+    def get_response(self, request, data, show_graphiql=False):
+        if not (explain.enabled() and explain.requested(request, data)):
+            return super().get_response(request, data, show_graphiql)
+        (result, status_code), report = explain.run_explained(
+            lambda: super(CRMGraphQLView, self).get_response(request, data, show_graphiql)
+        )
+        if result is None:
+            return result, status_code
+        response = json.loads(result)
+        response.setdefault('extensions', {})['explain'] = report
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        if not metrics.REGISTRY.enabled:
+            return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+        started = time.perf_counter()
+        result = super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+        if result is None:
+            return result
+
+        operation = operation_label(query)
+        metrics.GRAPHQL_LATENCY.observe(time.perf_counter() - started, operation=operation)
+        metrics.GRAPHQL_REQUESTS.inc(operation=operation, status='error' if result.errors else 'ok')
+        for error in result.errors or ():
+            # Label by the schema field, not the path, which carries client aliases.
+            nodes = getattr(error, 'nodes', None)
+            if getattr(error, 'path', None) and nodes and isinstance(nodes[0], FieldNode):
+                metrics.RESOLVER_ERRORS.inc(field=nodes[0].name.value)
+        return result
+
+
+def metrics_view(request):
+    return HttpResponse(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def health_response(report):
+    return JsonResponse(report, status=200 if report['status'] == 'ok' else 503)
+
+
+def healthz_view(request):
+    return health_response(health.liveness())
+
+
+def readyz_view(request):
+    return health_response(health.readiness())
@@ -1,10 +1,71 @@
+"""
+Project GraphQL schema, assembled from the apps listed in ``SCHEMA_MODULES``.
+
+Each module contributes any of ``Query``, ``Mutation`` and ``Subscription``;
+the root types here inherit from all of them. The schema is built once per
+process on first use and shared by the view, the websocket consumer, the
+cron jobs and the tasks.
+"""
+
+import threading
+from importlib import import_module
+from types import SimpleNamespace
+
 import graphene
-from crm.schema import Query as CRMQuery, Mutation as CRMMutation
 
-class Query(CRMQuery, graphene.ObjectType):
-    pass
+SCHEMA_MODULES = [
+    "alx_backend_graphql_crm.schema",
+    "crm.schema",
+]
+
+ROOT_TYPES = ("Query", "Mutation", "Subscription")
+
+_schema = None
+_schema_lock = threading.Lock()
+
+
+def root_types(modules=SCHEMA_MODULES):
+    """Combine each module's root types into one class per operation type."""
+    parts = {name: [] for name in ROOT_TYPES}
+    for path in modules:
+        module = import_module(path)
+        for name in ROOT_TYPES:
+            if name in vars(module):
+                parts[name].append(vars(module)[name])
+    return {
+        name: type(name, (*bases, graphene.ObjectType), {}) if bases else None
+        for name, bases in parts.items()
+    }
+
+
+def get_schema():
+    """Build the project schema on first use and reuse it for the life of the process."""
+    global _schema
+    if _schema is None:
+        with _schema_lock:
+            if _schema is None:
+                types = root_types()
+                _schema = graphene.Schema(
+                    query=types["Query"],
+                    mutation=types["Mutation"],
+                    subscription=types["Subscription"],
+                )
+    return _schema
+
+
+def execute(query, variables=None, operation_name=None, context=None):
+    """Run an operation in-process against the shared schema."""
+    return get_schema().execute(
+        query,
+        variable_values=variables,
+        operation_name=operation_name,
+        # Resolvers keep per-operation state, such as the identity map, on the context.
+        context_value=context if context is not None else SimpleNamespace(),
+    )
 
-class Mutation(CRMMutation, graphene.ObjectType):
-    pass
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+def __getattr__(name):
+    # ``schema`` is what GRAPHENE["SCHEMA"] points at; build it only when asked for.
+    if name == "schema":
+        return get_schema()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")